@@ -1,13 +1,26 @@
 import os
+import sys
+import tempfile
+from functools import partial
 from typing import Callable
 
-from aiohttp import web
+from aiomisc import bind_socket
 from aiomisc.log import LogFormat, basic_config
-from configargparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from configargparse import ArgumentParser, ArgumentDefaultsHelpFormatter, Namespace
 from yarl import URL
 
 from analyzer.api.app import create_app
+from analyzer.api.docs import API_DOCS_MODES
+from analyzer.api.drain import run_app
+from analyzer.api.payloads import JSON_BACKENDS
+from analyzer.api.services.stats import NUMPY_AVAILABLE
 from analyzer.utils.consts import ENV_VAR_PREFIX, DEFAULT_PG_URL
+from analyzer.utils.loop import EVENT_LOOPS, setup_event_loop_policy
+from analyzer.utils.supervisor import Supervisor
+
+# Время, которое супервизор дополнительно к --shutdown-timeout дает воркерам
+# на закрытие соединений с БД, в секундах
+SHUTDOWN_MARGIN = 10
 
 parser = ArgumentParser(
     # Парсер будет искать переменные окружения с префиксом ANALYZER_,
@@ -24,6 +37,151 @@ group.add_argument(
     help="IPv4/IPv6 address API server would listen on",
 )
 group.add_argument("--api-port", type=int, default=8081, help="TCP port API server would listen on")
+group.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of API server processes sharing the port via SO_REUSEPORT "
+    "(0 - one per CPU core). Every process has its own database pool",
+)
+group.add_argument(
+    "--shutdown-timeout",
+    type=float,
+    default=30,
+    help="Seconds to wait for in-flight requests (streams and imports) to finish on shutdown "
+    "before they are cancelled and the database pool is closed",
+)
+group.add_argument(
+    "--event-loop",
+    default="asyncio",
+    choices=EVENT_LOOPS,
+    help="Event loop implementation (falls back to asyncio if uvloop is not installed)",
+)
+group.add_argument(
+    "--api-docs",
+    default="lazy",
+    choices=API_DOCS_MODES,
+    help="When the swagger spec is built: on the first request to it, on startup, or never (docs disabled)",
+)
+group.add_argument(
+    "--http-cache-max-age",
+    type=int,
+    default=0,
+    help="Seconds clients and proxies may serve cached GET responses of imports without revalidating "
+    "their ETag (0 - revalidate every time)",
+)
+group.add_argument(
+    "--json-backend",
+    default="json",
+    choices=("json", "orjson"),
+    help="Library used to serialize responses and parse request bodies",
+)
+
+group.add_argument(
+    "--relation-graph-cache-size",
+    type=int,
+    default=32,
+    help="Maximum number of imports whose relation graphs are kept in memory "
+    "for birthdays computation (0 disables the cache)",
+)
+
+group.add_argument(
+    "--stats-engine",
+    default="sql",
+    choices=("sql", "numpy", "auto"),
+    help="Where town age statistics are computed: in PostgreSQL, in the application "
+    "with NumPy, or with NumPy only for imports of at least --stats-numpy-min-citizens citizens",
+)
+group.add_argument(
+    "--stats-numpy-min-citizens",
+    type=int,
+    default=20000,
+    help="Minimum import size for the NumPy statistics engine in auto mode",
+)
+
+group = parser.add_argument_group("Admission control options")
+group.add_argument(
+    "--admission-max-in-flight",
+    type=int,
+    default=0,
+    help="Reject new requests with 503 while this many requests are being processed (0 - no limit)",
+)
+group.add_argument(
+    "--admission-max-pool-wait",
+    type=float,
+    default=0,
+    help="Reject new requests with 503 while coroutines wait for a primary database connection "
+    "longer than this number of milliseconds (0 - no limit)",
+)
+group.add_argument(
+    "--admission-retry-after",
+    type=int,
+    default=1,
+    help="Retry-After header value of rejected requests in seconds",
+)
+
+group = parser.add_argument_group(
+    "Concurrency options",
+    "Limits of requests processed at the same time by handler class: imports, whole import "
+    "requests (citizen and change lists, bulk updates) and other requests. Database "
+    "connections above the limits of limited classes are reserved for the others",
+)
+group.add_argument(
+    "--import-concurrency", type=int, default=2, help="Imports processed at the same time (0 - no limit)"
+)
+group.add_argument(
+    "--import-queue-timeout",
+    type=float,
+    default=30,
+    help="Seconds an import waits for its turn before it is rejected with 503",
+)
+group.add_argument(
+    "--bulk-concurrency",
+    type=int,
+    default=4,
+    help="Whole import requests processed at the same time (0 - no limit)",
+)
+group.add_argument(
+    "--bulk-queue-timeout",
+    type=float,
+    default=10,
+    help="Seconds a whole import request waits for its turn before it is rejected with 503",
+)
+group.add_argument(
+    "--default-concurrency",
+    type=int,
+    default=0,
+    help="Other requests processed at the same time (0 - no limit)",
+)
+group.add_argument(
+    "--default-queue-timeout",
+    type=float,
+    default=1,
+    help="Seconds another request waits for its turn before it is rejected with 503",
+)
+
+group = parser.add_argument_group("Profiling options")
+group.add_argument(
+    "--profiling-token",
+    help="Requests with the X-Profile header equal to this token are profiled (profiling is disabled if not set)",
+)
+group.add_argument(
+    "--profiling-sample-rate",
+    type=float,
+    default=0,
+    help="Share of requests profiled without the X-Profile header",
+)
+group.add_argument(
+    "--profiling-dir",
+    default=os.path.join(tempfile.gettempdir(), "analyzer-profiles"),
+    help="Directory where request profiles are stored",
+)
+group.add_argument(
+    "--profiling-max-files",
+    type=int,
+    default=1000,
+    help="Number of the latest request profiles kept in the profiling directory",
+)
 
 group = parser.add_argument_group("PostgreSQL options")
 group.add_argument(
@@ -34,6 +192,44 @@ group.add_argument(
 )
 group.add_argument("--pg-pool-min-size", type=int, default=10, help="Minimum database connections")
 group.add_argument("--pg-pool-max-size", type=int, default=10, help="Maximum database connection")
+group.add_argument(
+    "--pg-replica-url",
+    type=URL,
+    action="append",
+    help="URL of a read replica used by GET requests (may be repeated, reads go to the primary if not set)",
+)
+group.add_argument("--pg-replica-pool-min-size", type=int, default=10, help="Minimum connections to each replica")
+group.add_argument("--pg-replica-pool-max-size", type=int, default=10, help="Maximum connections to each replica")
+group.add_argument(
+    "--pg-replica-max-lag",
+    type=float,
+    default=5,
+    help="Replicas lagging behind the primary by more than this number of seconds are not used for reads",
+)
+group.add_argument(
+    "--pg-replica-check-interval",
+    type=float,
+    default=5,
+    help="Number of seconds between replica health checks",
+)
+group.add_argument(
+    "--pg-slow-query-threshold",
+    type=float,
+    default=1000,
+    help="Log queries running longer than this number of milliseconds with their parameters (0 - disabled)",
+)
+group.add_argument(
+    "--pg-explain-sample-rate",
+    type=float,
+    default=0,
+    help="Share of slow queries for which EXPLAIN (ANALYZE, BUFFERS) is captured (0 - never)",
+)
+group.add_argument(
+    "--pg-explain-interval",
+    type=float,
+    default=60,
+    help="Minimum number of seconds between two EXPLAIN captures",
+)
 
 group = parser.add_argument_group("Logging options")
 group.add_argument(
@@ -50,8 +246,40 @@ def clean_environ(rule: Callable):
         os.environ.pop(var)
 
 
+def run_worker(args: Namespace, number: int) -> None:
+    """
+    Запускает процесс-воркер API: свой сокет с SO_REUSEPORT, свой пул
+    соединений с БД и свой event loop.
+    """
+    # Поток буферизации логов не переживает fork, поэтому логирование
+    # настраивается в каждом воркере заново
+    basic_config(level=args.log_level, log_format=args.log_format, buffered=True)
+
+    # SO_REUSEPORT позволяет каждому воркеру открыть собственный сокет на том
+    # же порту, а ядро распределяет входящие соединения между ними
+    sock = bind_socket(address=args.api_address, port=args.api_port, reuse_port=True)
+    app = create_app(args=args)
+    run_app(app=app, sock=sock)
+
+
 def main():
     args = parser.parse_args()
+    if args.stats_engine == "numpy" and not NUMPY_AVAILABLE:
+        parser.error("NumPy statistics engine requires numpy to be installed")
+    if args.json_backend not in JSON_BACKENDS:
+        parser.error("{0} JSON backend requires {0} to be installed".format(args.json_backend))
+    if args.workers < 0:
+        parser.error("--workers must not be negative")
+    if args.admission_max_in_flight < 0 or args.admission_max_pool_wait < 0 or args.admission_retry_after < 0:
+        parser.error("--admission-* options must not be negative")
+    if min(args.import_concurrency, args.bulk_concurrency, args.default_concurrency) < 0:
+        parser.error("--*-concurrency options must not be negative")
+    if args.http_cache_max_age < 0:
+        parser.error("--http-cache-max-age must not be negative")
+    if args.shutdown_timeout < 0:
+        parser.error("--shutdown-timeout must not be negative")
+    if args.pg_replica_check_interval <= 0:
+        parser.error("--pg-replica-check-interval must be positive")
 
     # После получения конфигурации приложения переменные окружения приложения
     # больше не нужны и даже могут представлять опасность - например, они могут
@@ -70,8 +298,21 @@ def main():
     # автоматически).
     basic_config(level=args.log_level, log_format=args.log_format, buffered=True)
 
-    app = create_app(args=args)
-    web.run_app(app=app, host=args.api_address, port=args.api_port)
+    # Политика наследуется воркерами, поэтому устанавливается один раз до fork
+    setup_event_loop_policy(args.event_loop)
+
+    workers = args.workers or os.cpu_count()
+    if workers == 1:
+        sock = bind_socket(address=args.api_address, port=args.api_port)
+        app = create_app(args=args)
+        run_app(app=app, sock=sock)
+        return
+
+    # Воркеру нужно время и на закрытие пула после завершения запросов
+    supervisor = Supervisor(
+        target=partial(run_worker, args), workers=workers, shutdown_timeout=args.shutdown_timeout + SHUTDOWN_MARGIN
+    )
+    sys.exit(supervisor.run())
 
 
 if __name__ == "__main__":
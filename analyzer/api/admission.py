@@ -0,0 +1,178 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+
+from aiohttp.web import HTTPServiceUnavailable, Request, StreamResponse, middleware
+
+from analyzer.api.middlewares import format_http_exception
+from analyzer.utils.metrics import REGISTRY
+
+REJECTED_REQUESTS = REGISTRY.counter(
+    "analyzer_http_rejected_requests",
+    "Requests rejected with 503 because the process is overloaded",
+    labelnames=("reason",),
+)
+CONCURRENCY_IN_USE = REGISTRY.gauge(
+    "analyzer_concurrency_in_use", "Requests of the concurrency class being processed", labelnames=("class",)
+)
+CONCURRENCY_WAITING = REGISTRY.gauge(
+    "analyzer_concurrency_waiting", "Requests waiting for a slot of the concurrency class", labelnames=("class",)
+)
+
+# Причины перегрузки
+IN_FLIGHT = "in_flight"
+POOL_WAIT = "pool_wait"
+QUEUE_TIMEOUT = "queue_timeout"
+
+# Классы конкурентности обработчиков (атрибут CONCURRENCY_CLASS представления):
+# загрузка выгрузок, запросы по всей выгрузке (потоковые списки, массовое
+# изменение) и остальные - быстрые - запросы
+IMPORT_CLASS = "import"
+BULK_CLASS = "bulk"
+DEFAULT_CLASS = "default"
+CONCURRENCY_CLASSES = (IMPORT_CLASS, BULK_CLASS, DEFAULT_CLASS)
+
+
+class AdmissionController:
+    """
+    Контроль допуска запросов.
+
+    Пул соединений с БД невелик, и при перегрузке новые запросы выстраиваются
+    в очередь за соединением, пока не истечет таймаут клиента или
+    балансировщика. Вместо этого, если запросов в обработке слишком много или
+    соединения пула ждут дольше порога, новые запросы сразу получают 503 с
+    Retry-After, а /health/ready сообщает балансировщику, что процесс
+    не готов принимать запросы.
+    """
+
+    def __init__(self, max_in_flight: int, max_pool_wait: float, retry_after: int) -> None:
+        """
+        :param max_in_flight: максимальное количество запросов в обработке (0 - не ограничено)
+        :param max_pool_wait: максимальное время ожидания соединения с
+            основной БД в секундах (0 - не ограничено)
+        :param retry_after: значение заголовка Retry-After в секундах
+        """
+        self.max_in_flight = max_in_flight
+        self.max_pool_wait = max_pool_wait
+        self.retry_after = retry_after
+        self.in_flight = 0
+
+    def overload_reason(self, request: Request) -> Optional[str]:
+        """Возвращает причину перегрузки или None, если процесс может принять запрос."""
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return IN_FLIGHT
+
+        # Пул основной БД - общий для всех изменяющих запросов и, без реплик, читающих
+        if self.max_pool_wait and request.app["db"].pool.wait_time() > self.max_pool_wait:
+            return POOL_WAIT
+        return None
+
+    def unavailable(self, reason: str) -> HTTPServiceUnavailable:
+        exc = format_http_exception(HTTPServiceUnavailable(text="Server is overloaded ({0})".format(reason)))
+        exc.headers["Retry-After"] = str(self.retry_after)
+        return exc
+
+
+class ConcurrencyClass:
+    """
+    Ограничение количества одновременно обрабатываемых запросов класса.
+
+    Тяжелые запросы (загрузка выгрузок, потоковые списки) держат соединение
+    с БД долго, и несколько таких запросов могут занять весь пул, а быстрые
+    запросы будут ждать за ними. Ограничение тяжелых классов резервирует
+    оставшиеся соединения пула для остальных запросов: пул asyncpg выдает
+    соединения в порядке очереди, поэтому приоритет быстрых запросов
+    выражается в том, что тяжелые не могут занять больше своей доли.
+    """
+
+    def __init__(self, name: str, limit: int, queue_timeout: float) -> None:
+        """
+        :param name: название класса
+        :param limit: максимальное количество запросов класса в обработке (0 - не ограничено)
+        :param queue_timeout: максимальное время ожидания в очереди в секундах,
+            после которого запрос отклоняется с 503
+        """
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.labels = (name,)
+        self._semaphore = asyncio.Semaphore(limit) if limit else None
+
+    async def acquire(self) -> bool:
+        """Занимает место в классе, возвращает False, если время ожидания истекло."""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return True
+
+        CONCURRENCY_WAITING.inc(labels=self.labels)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            CONCURRENCY_WAITING.dec(labels=self.labels)
+
+    @asynccontextmanager
+    async def slot(self, admission: AdmissionController) -> AsyncIterator[None]:
+        if not await self.acquire():
+            REJECTED_REQUESTS.inc(labels=(QUEUE_TIMEOUT,))
+            raise admission.unavailable("{0} {1}".format(self.name, QUEUE_TIMEOUT))
+
+        CONCURRENCY_IN_USE.inc(labels=self.labels)
+        try:
+            yield
+        finally:
+            CONCURRENCY_IN_USE.dec(labels=self.labels)
+            self._semaphore.release()
+
+
+@middleware
+async def admission_middleware(request: Request, handler: Callable) -> StreamResponse:
+    """
+    Отклоняет запросы, если процесс перегружен (см. AdmissionController).
+
+    Проверки здоровья и метрики принимаются всегда: балансировщик и
+    Prometheus должны видеть состояние перегруженного процесса. Потоковый
+    ответ считается обработанным, когда обработчик вернул его, но
+    соединение с БД, которое он держит, учитывается во времени ожидания пула.
+    """
+    if getattr(request.match_info.handler, "SKIP_ADMISSION", False):
+        return await handler(request)
+
+    admission: AdmissionController = request.app["admission"]
+    reason = admission.overload_reason(request)
+    if reason is not None:
+        REJECTED_REQUESTS.inc(labels=(reason,))
+        raise admission.unavailable(reason)
+
+    admission.in_flight += 1
+    try:
+        return await handler(request)
+    finally:
+        admission.in_flight -= 1
+
+
+@middleware
+async def concurrency_middleware(request: Request, handler: Callable) -> StreamResponse:
+    """
+    Ограничивает количество одновременно обрабатываемых запросов по классам
+    обработчиков (см. ConcurrencyClass).
+
+    Ответ отправляется клиенту здесь же: потоковые ответы держат соединение
+    с БД, пока пишутся, и место в классе освобождается только после этого.
+    """
+    view = request.match_info.handler
+    name = getattr(view, "CONCURRENCY_CLASS", None)
+    if name is None or getattr(view, "SKIP_ADMISSION", False):
+        return await handler(request)
+
+    concurrency: ConcurrencyClass = request.app["concurrency"][name]
+    if not concurrency.limit:
+        return await handler(request)
+
+    async with concurrency.slot(request.app["admission"]):
+        response = await handler(request)
+        await response.prepare(request)
+        await response.write_eof()
+    return response
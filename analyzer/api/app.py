@@ -5,12 +5,27 @@ from typing import Mapping, AsyncIterable
 
 from aiohttp import PAYLOAD_REGISTRY
 from aiohttp.web_app import Application
-from aiohttp_apispec import setup_aiohttp_apispec, validation_middleware
+from aiohttp_apispec import validation_middleware
 from configargparse import Namespace
 
+from analyzer.api.admission import (
+    CONCURRENCY_CLASSES,
+    AdmissionController,
+    ConcurrencyClass,
+    admission_middleware,
+    concurrency_middleware,
+)
+from analyzer.api.docs import setup_api_docs
+from analyzer.api.drain import Drainer, close_when_draining, drain_middleware, drain_requests
+from analyzer.api.metrics import metrics_middleware
 from analyzer.api.middlewares import error_middleware, format_validation_error
-from analyzer.api.payloads import JsonPayload, AsyncGenJSONListPayload
+from analyzer.api.parsers import JsonBackendParser
+from analyzer.api.payloads import JsonPayload, AsyncGenJSONListPayload, set_json_backend
+from analyzer.api.profiling import Profiler, profiling_middleware
+from analyzer.api.services.graph import RelationGraphCache
+from analyzer.api.services.stats import NUMPY_AVAILABLE, preload_numpy
 from analyzer.api.views import VIEWS
+from analyzer.api.views.profiles import ProfileView
 from analyzer.utils.consts import MAX_REQUEST_SIZE
 from analyzer.utils.db import setup_db
 
@@ -19,24 +34,96 @@ log = logging.getLogger(__name__)
 
 def create_app(args: Namespace) -> Application:
     """Создает экземпляр приложения, готовое к запуску."""
-    app = Application(
-        middlewares=[error_middleware, validation_middleware],
-        client_max_size=MAX_REQUEST_SIZE,
-    )
+    # Метрики собираются снаружи error_middleware, чтобы учитывать
+    # итоговые статусы ответов, в том числе отклоненных при перегрузке запросов.
+    # drain_middleware - первый, чтобы учитывать запросы до окончания записи ответа
+    middlewares = [
+        drain_middleware,
+        metrics_middleware,
+        admission_middleware,
+        concurrency_middleware,
+        error_middleware,
+        validation_middleware,
+    ]
+    profiler = None
+    if args.profiling_token is not None or args.profiling_sample_rate > 0:
+        profiler = Profiler(
+            token=args.profiling_token,
+            sample_rate=args.profiling_sample_rate,
+            directory=args.profiling_dir,
+            max_files=args.profiling_max_files,
+        )
+        middlewares.insert(middlewares.index(error_middleware), profiling_middleware)
+
+    app = Application(middlewares=middlewares, client_max_size=MAX_REQUEST_SIZE)
 
     # Подключение на старте к postgres и отключение при остановке
     app.cleanup_ctx.append(partial(setup_db, args=args))
 
-    for view in VIEWS:
+    # При остановке пул закрывается только после завершения обрабатываемых
+    # запросов (или истечения --shutdown-timeout)
+    app["drainer"] = Drainer(timeout=args.shutdown_timeout)
+    app.on_shutdown.append(drain_requests)
+    app.on_response_prepare.append(close_when_draining)
+
+    # Отклонение запросов с 503 при перегрузке процесса
+    app["admission"] = AdmissionController(
+        max_in_flight=args.admission_max_in_flight,
+        max_pool_wait=args.admission_max_pool_wait / 1000,
+        retry_after=args.admission_retry_after,
+    )
+
+    # Ограничения количества одновременных запросов по классам обработчиков:
+    # соединения пула сверх лимитов тяжелых классов остаются быстрым запросам
+    app["concurrency"] = {
+        name: ConcurrencyClass(
+            name=name,
+            limit=getattr(args, "{0}_concurrency".format(name)),
+            queue_timeout=getattr(args, "{0}_queue_timeout".format(name)),
+        )
+        for name in CONCURRENCY_CLASSES
+    }
+    limits = [concurrency.limit for concurrency in app["concurrency"].values()]
+    if 0 in limits and sum(limits) >= args.pg_pool_max_size:
+        log.warning("Concurrency limits leave no database connections reserved for unlimited classes")
+
+    # Время, в течение которого клиенты и прокси могут отдавать ответы на
+    # GET-запросы к выгрузкам из кэша без проверки ETag (0 - всегда проверять)
+    app["http_cache_max_age"] = args.http_cache_max_age
+
+    # Графы родственных связей часто запрашиваемых выгрузок
+    app["relation_graphs"] = None
+    if args.relation_graph_cache_size > 0:
+        app["relation_graphs"] = RelationGraphCache(max_size=args.relation_graph_cache_size)
+
+    # Размер выгрузки, начиная с которого статистика возрастов рассчитывается
+    # в приложении с помощью NumPy (None - всегда в PostgreSQL)
+    app["stats_numpy_min_citizens"] = None
+    if args.stats_engine == "numpy":
+        app["stats_numpy_min_citizens"] = 0
+    elif args.stats_engine == "auto" and NUMPY_AVAILABLE:
+        app["stats_numpy_min_citizens"] = args.stats_numpy_min_citizens
+    elif args.stats_engine == "auto":
+        log.warning("NumPy is not installed, town age statistics will be computed in PostgreSQL")
+    if app["stats_numpy_min_citizens"] is not None:
+        app.on_startup.append(preload_numpy)
+
+    # Профилирование запросов по заголовку X-Profile или для случайной доли запросов
+    app["profiler"] = profiler
+    views = VIEWS if profiler is None else VIEWS + (ProfileView,)
+
+    for view in views:
         log.debug("Registering view %r as %r", view, view.URL_PATH)
         app.router.add_route("*", view.URL_PATH, view)
 
-    setup_aiohttp_apispec(
-        app=app,
-        title="Citizens API",
-        swagger_path="/",
-        error_callback=format_validation_error,
-    )
+    # Swagger-документация (по умолчанию спецификация строится при первом
+    # обращении к ней, а не при запуске приложения)
+    setup_api_docs(app, mode=args.api_docs)
+
+    # Тела запросов в validation_middleware разбираются той же библиотекой
+    # JSON, что и сериализуются ответы
+    set_json_backend(args.json_backend)
+    app["_apispec_parser"] = JsonBackendParser(error_handler=format_validation_error)
 
     # Автоматическая сериализация в json данных в HTTP ответах
     PAYLOAD_REGISTRY.register(JsonPayload, (Mapping, MappingProxyType))
@@ -0,0 +1,90 @@
+from aiohttp import hdrs
+from aiohttp.web import Application, Request, Response, View, json_response
+from aiohttp_apispec import AiohttpApiSpec
+from aiohttp_apispec.aiohttp_apispec import NAME_SWAGGER_SPEC
+
+from analyzer import __version__
+from analyzer.api.middlewares import format_validation_error
+
+API_DOCS_MODES = ("lazy", "eager", "off")
+
+# Ключ запроса, в который validation_middleware кладет проверенные данные
+REQUEST_DATA_NAME = "data"
+
+
+class LazyAiohttpApiSpec(AiohttpApiSpec):
+    """
+    Swagger-спецификация, которая строится при первом запросе к ней.
+
+    AiohttpApiSpec строит спецификацию по всем обработчикам при запуске
+    приложения (в on_startup): это преобразование всех схем marshmallow,
+    которое задерживает начало приема запросов каждым процессом, хотя
+    документация запрашивается редко.
+
+    Регистрацию (парсер и error_callback для validation_middleware, страницу
+    документации) выполняет AiohttpApiSpec.register, заменяется только
+    обработчик спецификации.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._swagger_dict = None
+        super().__init__(*args, **kwargs)
+
+    def register(self, app: Application, in_place: bool = False) -> None:
+        # Без url AiohttpApiSpec не добавляет обработчик спецификации (и
+        # страницу документации, которая ссылается на него по имени)
+        url, self.url = self.url, None
+        try:
+            super().register(app, in_place=in_place)
+        finally:
+            self.url = url
+
+        app.router.add_route(hdrs.METH_GET, self.url, self.swagger_handler, name=NAME_SWAGGER_SPEC)
+        if self.swagger_path is not None:
+            self._add_swagger_web_page(app, self.static_path, self.swagger_path)
+
+    def _register(self, app: Application) -> None:
+        """Вызывается AiohttpApiSpec при запуске приложения: спецификация строится позже."""
+
+    def build(self, app: Application) -> dict:
+        """Строит спецификацию по обработчикам приложения (как AiohttpApiSpec._register)."""
+        for route in app.router.routes():
+            if isinstance(route.handler, type) and issubclass(route.handler, View):
+                if route.method != hdrs.METH_ANY:
+                    continue
+                for method in hdrs.METH_ALL:
+                    view = getattr(route.handler, method.lower(), None)
+                    if view is not None:
+                        self._register_route(route, method.lower(), view)
+            else:
+                self._register_route(route, route.method.lower(), route.handler)
+        return self.swagger_dict()
+
+    async def swagger_handler(self, request: Request) -> Response:
+        if self._swagger_dict is None:
+            self._swagger_dict = self.build(request.app)
+        return json_response(self._swagger_dict)
+
+
+def setup_api_docs(app: Application, mode: str) -> None:
+    """
+    Подключает Swagger-документацию.
+
+    :param app: экземпляр приложения
+    :param mode: lazy - спецификация строится при первом запросе к ней,
+        eager - при запуске приложения, off - документация отключена
+    """
+    if mode == "off":
+        # Обработчики получают данные запросов и без документации
+        app["_apispec_request_data_name"] = REQUEST_DATA_NAME
+        return
+
+    spec_class = LazyAiohttpApiSpec if mode == "lazy" else AiohttpApiSpec
+    spec_class(
+        app=app,
+        request_data_name=REQUEST_DATA_NAME,
+        swagger_path="/",
+        error_callback=format_validation_error,
+        title="Citizens API",
+        version=__version__,
+    )
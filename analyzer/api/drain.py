@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import signal
+import socket
+from typing import Callable
+
+from aiohttp import hdrs
+from aiohttp.web import AppRunner, Application, Request, SockSite, StreamResponse, middleware
+
+log = logging.getLogger(__name__)
+
+
+class Drainer:
+    """
+    Завершение обрабатываемых запросов при остановке процесса.
+
+    При остановке aiohttp закрывает соединения и отменяет обрабатываемые
+    запросы (чтение тел запросов прерывается), а затем cleanup_ctx закрывает
+    пул соединений с БД. Загрузки выгрузок, тело которых еще передается,
+    при этом завершаются ошибкой, а потоковые ответы могут оборваться.
+    Drainer дожидается завершения запросов (включая запись потоковых
+    ответов) после того, как процесс перестал принимать соединения, но не
+    дольше timeout секунд; /health/ready в это время отвечает 503.
+    """
+
+    def __init__(self, timeout: float) -> None:
+        """
+        :param timeout: максимальное время ожидания запросов при остановке в секундах
+        """
+        self.timeout = timeout
+        self.draining = False
+        self.drained = False
+        self.in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def started(self) -> None:
+        self.in_flight += 1
+        self._idle.clear()
+
+    def finished(self) -> None:
+        self.in_flight -= 1
+        if not self.in_flight:
+            self._idle.set()
+
+    async def drain(self) -> None:
+        """Дожидается обрабатываемых запросов, повторные вызовы не ждут."""
+        self.draining = True
+        if self.drained:
+            return
+
+        self.drained = True
+        if not self.in_flight:
+            return
+
+        log.info("Waiting for %d requests to finish", self.in_flight)
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # Загрузка выгрузки выполняется в одной транзакции: при отмене
+            # она откатывается, и выгрузка не сохраняется частично
+            log.warning("%d requests did not finish in %g seconds and will be cancelled", self.in_flight, self.timeout)
+        else:
+            log.info("All requests finished")
+
+
+async def drain_requests(app: Application) -> None:
+    # Если приложение остановлено не через serve (например, в тестах)
+    await app["drainer"].drain()
+
+
+async def serve(app: Application, sock: socket.socket) -> None:
+    """
+    Обслуживает запросы на сокете до получения SIGINT/SIGTERM.
+
+    В отличие от aiohttp.web.run_app, после остановки приема соединений
+    дожидается обрабатываемых запросов (см. Drainer) и только потом
+    закрывает соединения и останавливает приложение.
+    """
+    stopping = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    runner = AppRunner(app)
+    await runner.setup()
+    try:
+        site = SockSite(runner, sock)
+        await site.start()
+        log.info("Listening on %s", site.name)
+        await stopping.wait()
+
+        log.info("Stopping, no new connections are accepted")
+        await site.stop()
+        await app["drainer"].drain()
+    finally:
+        await runner.cleanup()
+
+
+def run_app(app: Application, sock: socket.socket) -> None:
+    asyncio.get_event_loop().run_until_complete(serve(app, sock))
+
+
+async def close_when_draining(request: Request, response: StreamResponse) -> None:
+    """
+    Закрывает после ответа соединения, по которым приходят запросы во время
+    остановки (хук on_response_prepare: заголовки еще не отправлены).
+    """
+    if request.app["drainer"].draining:
+        response.force_close()
+        # В новых версиях aiohttp хук вызывается после формирования заголовков
+        response.headers[hdrs.CONNECTION] = "close"
+
+
+@middleware
+async def drain_middleware(request: Request, handler: Callable) -> StreamResponse:
+    """
+    Учитывает обрабатываемые запросы для Drainer.
+
+    Ответ отправляется клиенту здесь же, чтобы запрос считался завершенным
+    только после записи потокового ответа (если его не отправил внутренний
+    middleware, повторная отправка ничего не делает).
+    """
+    drainer: Drainer = request.app["drainer"]
+    drainer.started()
+    try:
+        response = await handler(request)
+        await response.prepare(request)
+        await response.write_eof()
+        return response
+    finally:
+        drainer.finished()
@@ -0,0 +1,62 @@
+import time
+from typing import Callable
+
+from aiohttp.web import HTTPException, Request, Response, middleware
+
+from analyzer.utils.metrics import REGISTRY
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "analyzer_http_request_duration_seconds",
+    "HTTP request processing time by view and response status",
+    labelnames=("method", "path", "status"),
+)
+REQUESTS_IN_PROGRESS = REGISTRY.gauge(
+    "analyzer_http_requests_in_progress", "HTTP requests being processed", labelnames=("method", "path")
+)
+STREAMED_BYTES = REGISTRY.counter(
+    "analyzer_http_streamed_bytes", "Bytes of JSON written by streaming responses", labelnames=("root_object",)
+)
+IMPORT_CITIZENS = REGISTRY.histogram(
+    "analyzer_import_citizens",
+    "Number of citizens in created imports",
+    buckets=(10, 100, 1000, 5000, 10000, 50000, 100000, 500000),
+)
+IMPORT_SECONDS = REGISTRY.histogram(
+    "analyzer_import_duration_seconds",
+    "Time to store an import in the database",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+# Запросы к несуществующим маршрутам не должны порождать новые значения меток
+UNMATCHED_PATH = "unmatched"
+
+
+@middleware
+async def metrics_middleware(request: Request, handler: Callable) -> Response:
+    """
+    Измеряет время обработки запросов и количество обрабатываемых запросов.
+
+    Путь в метках - шаблон URL_PATH обработчика (без регулярных выражений),
+    а не URL запроса, чтобы количество временных рядов не зависело от
+    идентификаторов в запросах.
+
+    Ответ отправляется клиенту здесь же: время потоковых ответов (списки
+    жителей, изменений) складывается в основном из записи тела.
+    """
+    resource = request.match_info.route.resource
+    labels = (request.method, resource.canonical if resource is not None else UNMATCHED_PATH)
+    REQUESTS_IN_PROGRESS.inc(labels=labels)
+    started = time.monotonic()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        await response.prepare(request)
+        await response.write_eof()
+        return response
+    except HTTPException as exc:
+        status = exc.status
+        raise
+    finally:
+        REQUESTS_IN_PROGRESS.dec(labels=labels)
+        REQUEST_SECONDS.observe(time.monotonic() - started, labels=labels + (str(status),))
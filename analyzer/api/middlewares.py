@@ -70,7 +70,10 @@ async def error_middleware(request: Request, handler: Callable) -> Response:
         return await handler(request)
     except HTTPException as exc:
         # Текстовые исключения (или исключения без информации)
-        # форматируем в JSON
+        # форматируем в JSON. Ответы без ошибок (например, 304 Not Modified)
+        # передаются как есть: у них нет тела, а заголовки нужно сохранить
+        if exc.status < HTTPStatus.BAD_REQUEST:
+            raise
         if not isinstance(exc.body, JsonPayload):
             exc = format_http_exception(exc=exc)
         raise exc
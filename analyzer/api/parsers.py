@@ -0,0 +1,38 @@
+import json
+from typing import Any
+
+from aiohttp.web import Request
+from marshmallow.fields import Field
+from webargs import core
+from webargs.aiohttpparser import AIOHTTPParser, is_json_request
+
+from analyzer.api import payloads
+
+
+class JsonBackendParser(AIOHTTPParser):
+    """
+    Парсер запросов для валидации aiohttp_apispec, разбирающий тело запроса
+    библиотекой JSON, выбранной для приложения (см. payloads.set_json_backend).
+
+    Тело разбирается из байт, без промежуточного декодирования в строку.
+    """
+
+    async def parse_json(self, req: Request, name: str, field: Field) -> Any:
+        json_data = self._cache.get("json")
+        if json_data is None:
+            if not (req.body_exists and is_json_request(req)):
+                return core.missing
+
+            body = await req.read()
+            if not body:
+                return core.missing
+
+            try:
+                # JSONDecodeError из orjson - подкласс json.JSONDecodeError,
+                # а ошибки декодирования UTF-8 stdlib-парсер выбрасывает отдельно
+                json_data = payloads.json_backend.loads(body)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                return self.handle_invalid_json_error(e, req)
+
+            self._cache["json"] = json_data
+        return core.get_value(json_data, name, field, allow_many_nested=True)
@@ -2,15 +2,20 @@ import json
 from datetime import date
 from decimal import Decimal
 from functools import singledispatch, partial
-from typing import Any, AsyncIterator
+from typing import Any, AsyncIterator, Callable, NamedTuple
 
 from aiohttp.abc import AbstractStreamWriter
-from aiohttp.payload import JsonPayload as BaseJsonPayload, Payload
-from aiohttp.typedefs import JSONEncoder
+from aiohttp.payload import BytesPayload, Payload
 from asyncpg import Record
 
+from analyzer.api.metrics import STREAMED_BYTES
 from analyzer.utils.consts import DATE_FORMAT
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
 
 @singledispatch
 def convert(value: Any) -> Any:
@@ -44,17 +49,72 @@ def convert_decimal(value: Decimal) -> float:
     return float(value)
 
 
-smart_dumps = partial(json.dumps, default=convert, ensure_ascii=False)
+# Разделители без пробелов совпадают с выводом orjson, поэтому ответы
+# не зависят от выбранной библиотеки сериализации
+smart_dumps = partial(json.dumps, default=convert, ensure_ascii=False, separators=(",", ":"))
+
+
+def json_dumps(value: Any) -> bytes:
+    return smart_dumps(value).encode("utf-8")
+
+
+def orjson_default(value: Any) -> Any:
+    # Даты передаются сюда благодаря OPT_PASSTHROUGH_DATETIME: сам orjson
+    # сериализует их в ISO-формате, а не в DATE_FORMAT
+    if type(value) is date:
+        return value.strftime(DATE_FORMAT)
+    return convert(value)
+
+
+def orjson_dumps(value: Any) -> bytes:
+    return orjson.dumps(value, default=orjson_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+class JsonBackend(NamedTuple):
+    """Библиотека сериализации JSON: dumps возвращает UTF-8 байты, loads принимает str или bytes."""
+
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[Any], Any]
+
+
+JSON_BACKENDS = {"json": JsonBackend(dumps=json_dumps, loads=json.loads)}
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = JsonBackend(dumps=orjson_dumps, loads=orjson.loads)
 
+# Payload'ы создаются aiohttp по типу значения (см. PAYLOAD_REGISTRY) и не
+# получают ссылку на приложение, поэтому библиотека выбирается на уровне модуля
+json_backend = JSON_BACKENDS["json"]
 
-class JsonPayload(BaseJsonPayload):
+
+def set_json_backend(name: str) -> JsonBackend:
+    """
+    Выбирает библиотеку сериализации JSON для ответов и разбора запросов.
+
+    :param name: json или orjson
+    :return: выбранная библиотека
+    :raise KeyError: если библиотека не установлена
+    """
+    global json_backend
+    json_backend = JSON_BACKENDS[name]
+    return json_backend
+
+
+def dumps(value: Any) -> bytes:
+    """Сериализует значение в JSON выбранной библиотекой, сразу в байты."""
+    return json_backend.dumps(value)
+
+
+class JsonPayload(BytesPayload):
     """
-    Заменяет функцию сериализации на более "умную" (умеющую упаковывать в JSON
-    объекты asyncpg.Record, datetime.date, decimal.Decimal и другие сущности).
+    Сериализует ответ "умной" функцией (умеющей упаковывать в JSON объекты
+    asyncpg.Record, datetime.date, decimal.Decimal и другие сущности) выбранной
+    библиотекой JSON сразу в байты, без промежуточной строки.
     """
 
-    def __init__(self, *args: Any, dumps: JSONEncoder = smart_dumps, **kwargs: Any) -> None:
-        super().__init__(*args, dumps=dumps, **kwargs)
+    def __init__(
+        self, value: Any, encoding: str = "utf-8", content_type: str = "application/json", *args: Any, **kwargs: Any
+    ) -> None:
+        super().__init__(dumps(value), content_type=content_type, encoding=encoding, *args, **kwargs)
 
 
 class AsyncGenJSONListPayload(Payload):
@@ -85,18 +145,29 @@ class AsyncGenJSONListPayload(Payload):
             ]
         }
         """
-        # начало объекта
-        await writer.write('{{"{0}":['.format(self.root_object).encode(self.encoding))
-
-        first = True
-        async for row in self._value:
-            # перед первой строчкой запятая не нужна
-            if not first:
-                # ставим запятую
-                await writer.write(b",")
-
-            await writer.write(smart_dumps(row).encode(self.encoding))
-            first = False
-
-        # конец объекта
-        await writer.write(b"]}")
+        # Счетчик метрики обновляется один раз за ответ, а не на каждую строку
+        written = 0
+        try:
+            # начало объекта
+            chunk = '{{"{0}":['.format(self.root_object).encode(self.encoding)
+            await writer.write(chunk)
+            written += len(chunk)
+
+            first = True
+            async for row in self._value:
+                # перед первой строчкой запятая не нужна
+                if not first:
+                    # ставим запятую
+                    await writer.write(b",")
+                    written += 1
+
+                chunk = dumps(row)
+                await writer.write(chunk)
+                written += len(chunk)
+                first = False
+
+            # конец объекта
+            await writer.write(b"]}")
+            written += 2
+        finally:
+            STREAMED_BYTES.inc(written, labels=(self.root_object,))
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import uuid
+from collections import Counter, deque
+from typing import Callable, List, Optional
+
+from aiohttp.web import HTTPException, Request, StreamResponse, middleware
+
+log = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+PROFILE_SUFFIX = ".folded"
+
+# Интервал между снимками стека в секундах
+SAMPLE_INTERVAL = 0.002
+
+
+def format_frame(frame) -> str:
+    code = frame.f_code
+    return "{0} ({1}:{2})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+def coroutine_frames(coro) -> List:
+    """
+    Возвращает кадры цепочки ожидающих друг друга корутин (и асинхронных
+    генераторов) - от внешней к той, которая ждет future.
+    """
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is not None:
+            frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return frames
+
+
+def thread_frames(frame) -> List:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+class TaskSampler:
+    """
+    Сэмплирующий профилировщик одной asyncio-задачи.
+
+    Отдельный поток периодически снимает стек: если задача выполняется, -
+    стек потока event loop'а (время CPU, ветка [running]), если ждет, - цепочку
+    ее корутин до ожидаемой операции (ветка [waiting]: запросы к БД, запись в
+    сокет потоковых ответов). Стеки обрезаются до кадра root_code, чтобы
+    в профиль не попадали кадры event loop'а и aiohttp.
+
+    Результат - счетчики стеков в формате "collapsed" (folded), который
+    понимают flamegraph.pl, speedscope и другие инструменты.
+    """
+
+    def __init__(self, task: asyncio.Task, root_code, label: str, interval: float = SAMPLE_INTERVAL) -> None:
+        self.task = task
+        self.loop = asyncio.get_event_loop()
+        self.root_code = root_code
+        self.label = label
+        self.interval = interval
+        self.stacks = Counter()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def __enter__(self) -> "TaskSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _trim(self, frames: List) -> List:
+        for i, frame in enumerate(frames):
+            if frame.f_code is self.root_code:
+                return frames[i + 1 :]
+        return frames
+
+    def _sample(self) -> None:
+        if asyncio.current_task(self.loop) is self.task:
+            state = "[running]"
+            frames = thread_frames(sys._current_frames().get(self._loop_thread_id))
+        else:
+            state = "[waiting]"
+            frames = coroutine_frames(self.task.get_coro())
+
+        stack = [self.label, state] + [format_frame(frame) for frame in self._trim(frames)]
+        self.stacks[";".join(stack)] += 1
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self._sample()
+            except Exception:
+                # Кадры чужого потока могут измениться во время обхода
+                continue
+
+    def collapsed(self) -> str:
+        return "".join("{0} {1}\n".format(stack, count) for stack, count in sorted(self.stacks.items()))
+
+
+class Profiler:
+    """
+    Настройки профилирования запросов и хранилище профилей.
+
+    В каталоге хранятся только max_files последних профилей: при сохранении
+    нового профиля самые старые удаляются. Файлы, оставшиеся от предыдущих
+    запусков, учитываются в порядке времени изменения. Методы save и load
+    обращаются к диску и вызываются в пуле потоков.
+    """
+
+    def __init__(self, token: Optional[str], sample_rate: float, directory: str, max_files: int) -> None:
+        """
+        :param token: значение заголовка X-Profile, включающее профилирование запроса
+        :param sample_rate: доля запросов, профилируемых без заголовка
+        :param directory: каталог для сохранения профилей
+        :param max_files: количество хранимых профилей
+        """
+        self.token = token
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.max_files = max_files
+        os.makedirs(directory, exist_ok=True)
+
+        paths = [entry.path for entry in os.scandir(directory) if entry.name.endswith(PROFILE_SUFFIX)]
+        self._paths = deque(sorted(paths, key=os.path.getmtime))
+        self._lock = threading.Lock()
+        self._remove_old()
+
+    def is_authorized(self, request: Request) -> bool:
+        return self.token is not None and request.headers.get(PROFILE_HEADER) == self.token
+
+    def should_profile(self, request: Request) -> bool:
+        return self.is_authorized(request) or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, profile_id + PROFILE_SUFFIX)
+
+    def _remove_old(self) -> None:
+        while len(self._paths) > self.max_files:
+            try:
+                os.remove(self._paths.popleft())
+            except FileNotFoundError:
+                continue
+
+    def save(self, profile_id: str, profile: str) -> None:
+        path = self.path(profile_id)
+        with open(path, "w") as file:
+            file.write(profile)
+
+        # Профили сохраняются одновременно из нескольких потоков пула
+        with self._lock:
+            self._paths.append(path)
+            self._remove_old()
+
+    def load(self, profile_id: str) -> Optional[str]:
+        try:
+            with open(self.path(profile_id)) as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+
+@middleware
+async def profiling_middleware(request: Request, handler: Callable) -> StreamResponse:
+    """
+    Профилирует обработку запросов с заголовком X-Profile (значение должно
+    совпадать с --profiling-token) и случайной доли остальных запросов.
+
+    Ответ отправляется клиенту здесь же, чтобы в профиль попало время
+    записи потоковых ответов. Идентификатор сохраненного профиля передается
+    в заголовке X-Profile-Id, сам профиль доступен по /profiles/{profile_id}.
+    """
+    profiler: Profiler = request.app["profiler"]
+    if not profiler.should_profile(request):
+        return await handler(request)
+
+    profile_id = uuid.uuid4().hex
+    # Точка с запятой разделяет кадры в формате collapsed
+    label = "{0} {1}".format(request.method, request.path).replace(";", ",")
+    sampler = TaskSampler(asyncio.current_task(), root_code=profiling_middleware.__code__, label=label)
+    try:
+        with sampler:
+            response = await handler(request)
+            response.headers[PROFILE_ID_HEADER] = profile_id
+            await response.prepare(request)
+            await response.write_eof()
+    except HTTPException as exc:
+        # Ответы с ошибками отправляет aiohttp, профиль заканчивается на исключении
+        exc.headers[PROFILE_ID_HEADER] = profile_id
+        raise
+    finally:
+        await asyncio.get_event_loop().run_in_executor(None, profiler.save, profile_id, sampler.collapsed())
+        log.info("Saved profile %s of %s", profile_id, label)
+
+    return response
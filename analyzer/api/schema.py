@@ -1,8 +1,9 @@
 from datetime import date
 
 from marshmallow import Schema, validates_schema, validates
-from marshmallow.fields import Int, Str, Date, Nested, List, Float
+from marshmallow.fields import Int, Str, Date, Nested, List, Float, Dict, Bool
 from marshmallow.validate import Range, Length, OneOf, ValidationError
+from webargs.fields import DelimitedList
 
 from analyzer.db.schema import Gender
 from analyzer.utils.consts import DATE_FORMAT
@@ -57,13 +58,15 @@ class PatchCitizenRequestSchema(BaseCitizenRequestSchema):
     relatives = List(Int(validate=POSITIVE_VALUE))
 
 
-class ImportRequestSchema(Schema):
-    citizens = Nested(CitizenSchema, many=True, required=True, validate=Length(max=10000))
+class PatchCitizensItemSchema(PatchCitizenRequestSchema):
+    citizen_id = Int(validate=POSITIVE_VALUE, required=True)
 
+
+class UniqueCitizensMixin:
     @validates_schema
     def validate_unique_citizen_id(self, data: dict, **_) -> None:
         """
-        Валидация на уникальность id-шников жителей в рамках выгрузки.
+        Валидация на уникальность id-шников жителей в рамках запроса.
 
         :param data: данные схемы
         """
@@ -74,6 +77,14 @@ class ImportRequestSchema(Schema):
 
             unique_ids.add(citizen["citizen_id"])
 
+
+class PatchCitizensRequestSchema(UniqueCitizensMixin, Schema):
+    citizens = Nested(PatchCitizensItemSchema, many=True, required=True, validate=Length(min=1, max=10000))
+
+
+class ImportRequestSchema(UniqueCitizensMixin, Schema):
+    citizens = Nested(CitizenSchema, many=True, required=True, validate=Length(max=10000))
+
     @validates_schema
     def validate_relatives(self, data: dict, **_) -> None:
         """
@@ -106,10 +117,18 @@ class CitizenListResponseSchema(Schema):
     data = Nested(CitizenSchema, many=True, required=True)
 
 
+class CitizenResponseSchema(Schema):
+    data = Nested(CitizenSchema, required=True)
+
+
 class PatchCitizenResponseSchema(Schema):
     data = Nested(CitizenSchema, required=True)
 
 
+class PatchCitizensResponseSchema(Schema):
+    data = Nested(CitizenSchema, many=True, required=True)
+
+
 class PresentsSchema(Schema):
     citizen_id = Int(validate=Range(min=0), required=True)
     presents = Int(validate=Range(min=0), required=True)
@@ -122,6 +141,10 @@ CitizenPresentsByMonthSchema = type(
 )
 
 
+class CitizenBirthdaysQuerySchema(Schema):
+    month = Int(validate=Range(min=1, max=12))
+
+
 class CitizenPresentsResponseSchema(Schema):
     data = Nested(CitizenPresentsByMonthSchema, required=True)
 
@@ -135,3 +158,31 @@ class TownAgeStatSchema(Schema):
 
 class TownAgeStatResponseSchema(Schema):
     data = Nested(TownAgeStatSchema, many=True, required=True)
+
+
+class TownAgeStatQuerySchema(Schema):
+    q = DelimitedList(Float(validate=Range(min=0, max=1)), validate=Length(min=1, max=100))
+    approximate = Bool(missing=False)
+
+
+class TownAgeQuantilesSchema(Schema):
+    town = Str(validate=BASIC_STRING_LENGTH, required=True)
+    quantiles = Dict(keys=Str(), values=Float(), required=True)
+
+
+class TownAgeQuantilesResponseSchema(Schema):
+    data = Nested(TownAgeQuantilesSchema, many=True, required=True)
+
+
+class ChangesQuerySchema(Schema):
+    since = Int(validate=POSITIVE_VALUE, missing=0)
+
+
+class CitizenChangeSchema(Schema):
+    seq = Int(validate=POSITIVE_VALUE, required=True)
+    citizen_id = Int(validate=POSITIVE_VALUE, required=True)
+    changes = Dict(keys=Str(), required=True)
+
+
+class ChangeListResponseSchema(Schema):
+    data = Nested(CitizenChangeSchema, many=True, required=True)
@@ -0,0 +1,143 @@
+import json
+from typing import AsyncIterator, Iterable, List
+
+from asyncpgsa import PG
+from asyncpgsa.connection import SAConnection
+from sqlalchemy import select, and_, bindparam, func
+
+from analyzer.api.payloads import smart_dumps
+from analyzer.db.schema import citizen_changes_table
+from analyzer.utils.db import AsyncPGCursor, Executor, QUERIES
+
+# Для жителей, у которых изменились родственные связи, в журнал записывается
+# итоговый список родственников: при пакетном обновлении он может отличаться
+# от переданного в запросе.
+LOG_CHANGES_QUERY = QUERIES.register(
+    "log_changes",
+    """
+INSERT INTO citizen_changes (import_id, citizen_id, changes)
+SELECT
+    $1::int,
+    c.citizen_id,
+    c.changes::jsonb || CASE
+        WHEN c.citizen_id = ANY($4::int[]) THEN jsonb_build_object(
+            'relatives',
+            coalesce(
+                (
+                    SELECT jsonb_agg(relations.relative_id ORDER BY relations.relative_id)
+                    FROM relations
+                    WHERE relations.import_id = $1 AND relations.citizen_id = c.citizen_id
+                ),
+                '[]'::jsonb
+            )
+        )
+        ELSE '{}'::jsonb
+    END
+FROM unnest($2::int[], $3::text[]) WITH ORDINALITY AS c(citizen_id, changes, n)
+ORDER BY c.n
+""",
+    params=("import_id", "citizen_id", "changes", "relatives_changed"),
+)
+
+CHANGES_QUERY = QUERIES.register(
+    "changes",
+    select(
+        [
+            citizen_changes_table.c.seq,
+            citizen_changes_table.c.citizen_id,
+            citizen_changes_table.c.changes,
+        ]
+    )
+    .where(
+        and_(
+            citizen_changes_table.c.import_id == bindparam("import_id"),
+            citizen_changes_table.c.seq > bindparam("since"),
+        )
+    )
+    .order_by(citizen_changes_table.c.seq),
+)
+
+LAST_CHANGE_QUERY = QUERIES.register(
+    "last_change",
+    select([func.coalesce(func.max(citizen_changes_table.c.seq), 0)]).where(
+        citizen_changes_table.c.import_id == bindparam("import_id")
+    ),
+)
+
+
+async def log_changes(
+    conn: SAConnection, import_id: int, updates: List[dict], relatives_changed: Iterable[int]
+) -> None:
+    """
+    Добавляет изменения жителей в журнал изменений.
+
+    Номера изменений выдаются последовательностью, поэтому транзакция,
+    получившая меньший номер, могла бы зафиксироваться позже транзакции с
+    большим номером, и потребитель, уже прочитавший больший номер, пропустил
+    бы изменение. Поэтому функция вызывается под блокировкой строки выгрузки
+    в imports (ее берет обновление времени изменения выгрузки), которая
+    держится до фиксации: номера изменений одной выгрузки выдаются в порядке
+    фиксации транзакций.
+
+    :param conn: объект соединения
+    :param import_id: идентификатор выгрузки
+    :param updates: данные для обновления, содержащие citizen_id
+    :param relatives_changed: идентификаторы жителей, у которых изменились родственные связи
+    """
+    relatives_changed = set(relatives_changed)
+    citizen_ids, changes = [], []
+    for updated_data in updates:
+        citizen_ids.append(updated_data["citizen_id"])
+        changes.append(
+            smart_dumps({key: value for key, value in updated_data.items() if key not in ("citizen_id", "relatives")})
+        )
+        if "relatives" in updated_data:
+            relatives_changed.add(updated_data["citizen_id"])
+
+    # Жители, чьи родственные связи изменились из-за обновления других жителей
+    for citizen_id in sorted(relatives_changed - set(citizen_ids)):
+        citizen_ids.append(citizen_id)
+        changes.append("{}")
+
+    await LOG_CHANGES_QUERY.execute(
+        conn,
+        import_id=import_id,
+        citizen_id=citizen_ids,
+        changes=changes,
+        relatives_changed=list(relatives_changed),
+    )
+
+
+async def iter_changes(db: PG, import_id: int, since: int) -> AsyncIterator[dict]:
+    """
+    Возвращает асинхронный генератор изменений жителей выгрузки
+    с номером больше указанного.
+
+    :param db: объект для взаимодействия с БД
+    :param import_id: идентификатор выгрузки
+    :param since: номер последнего полученного изменения
+    """
+    cursor = AsyncPGCursor(
+        query=CHANGES_QUERY,
+        params={"import_id": import_id, "since": since},
+        transaction_ctx=db.transaction(),
+    )
+    async for row in cursor:
+        change = dict(row)
+        change["changes"] = json.loads(change["changes"])
+        yield change
+
+
+async def get_last_change_seq(executor: Executor, import_id: int) -> int:
+    """
+    Возвращает номер последнего изменения жителей выгрузки.
+
+    Выгрузка изменяется только обновлением жителей, поэтому номер последнего
+    изменения однозначно определяет состояние выгрузки и может служить ее версией,
+    в том числе для кэшей, которые живут в разных процессах.
+
+    :param executor: объект для взаимодействия с БД
+    :param import_id: идентификатор выгрузки
+    :return: номер изменения или 0, если выгрузка не изменялась
+    """
+    return await LAST_CHANGE_QUERY.fetchval(executor, import_id=import_id)
@@ -1,15 +1,19 @@
-from itertools import groupby
-from typing import Iterable, Dict
+from typing import Iterable, Dict, List, Optional, Set, Tuple
 
-from aiohttp.web import HTTPNotFound
-from asyncpg import ForeignKeyViolationError
+from aiohttp.web import HTTPNotFound, HTTPPreconditionFailed
+from asyncpg import ForeignKeyViolationError, Record
 from asyncpgsa import PG
 from asyncpgsa.connection import SAConnection
 from marshmallow import ValidationError
-from sqlalchemy import select, and_, func, or_, cast, Integer
+from sqlalchemy import select, and_, func, cast, Integer, bindparam, any_
+from sqlalchemy.dialects.postgresql import ARRAY
 
-from analyzer.db.schema import citizens_table, relations_table
-from analyzer.utils.db import AsyncPGCursor
+from analyzer.api.services.changes import log_changes, get_last_change_seq
+from analyzer.api.services.graph import RelationGraph, RelationGraphCache
+from analyzer.api.services.sketches import invalidate_sketches
+from analyzer.api.services.stats import STATS_FIELDS, invalidate_town_age_statistics
+from analyzer.db.schema import citizens_table, relations_table, citizen_birth_month
+from analyzer.utils.db import AsyncPGCursor, QUERIES
 
 CITIZENS_QUERY = (
     select(
@@ -37,6 +41,201 @@ CITIZENS_QUERY = (
     .group_by(citizens_table.c.import_id, citizens_table.c.citizen_id)
 )
 
+ACQUIRE_LOCK_QUERY = QUERIES.register("acquire_lock", "SELECT pg_advisory_xact_lock($1)", params=("import_id",))
+
+IMPORT_CITIZENS_QUERY = QUERIES.register(
+    "import_citizens",
+    CITIZENS_QUERY.where(citizens_table.c.import_id == bindparam("import_id")),
+)
+
+CITIZEN_QUERY = QUERIES.register(
+    "citizen",
+    CITIZENS_QUERY.where(
+        and_(
+            citizens_table.c.import_id == bindparam("import_id"),
+            citizens_table.c.citizen_id == bindparam("citizen_id"),
+        )
+    ),
+)
+
+CITIZEN_WITH_VERSION_QUERY = QUERIES.register(
+    "citizen_with_version",
+    CITIZENS_QUERY.column(citizens_table.c.version).where(
+        and_(
+            citizens_table.c.import_id == bindparam("import_id"),
+            citizens_table.c.citizen_id == bindparam("citizen_id"),
+        )
+    ),
+)
+
+CITIZEN_VERSION_QUERY = QUERIES.register(
+    "citizen_version",
+    select([citizens_table.c.version]).where(
+        and_(
+            citizens_table.c.import_id == bindparam("import_id"),
+            citizens_table.c.citizen_id == bindparam("citizen_id"),
+        )
+    ),
+)
+
+# Увеличивает версии жителей. Если передана ожидаемая версия, то обновляются
+# только жители с этой версией - так реализуется условное (If-Match)
+# обновление без advisory-блокировки выгрузки: строка жителя блокируется до
+# конца транзакции, а конкурентный запрос с той же версией не найдет жителя.
+BUMP_VERSIONS_QUERY = QUERIES.register(
+    "bump_versions",
+    """
+UPDATE citizens
+SET version = version + 1
+WHERE import_id = $1
+    AND citizen_id = ANY($2::int[])
+    AND ($3::int IS NULL OR version = $3)
+RETURNING citizen_id, version
+""",
+    params=("import_id", "citizen_id", "version"),
+)
+
+CITIZENS_BY_IDS_QUERY = QUERIES.register(
+    "citizens_by_ids",
+    CITIZENS_QUERY.where(
+        and_(
+            citizens_table.c.import_id == bindparam("import_id"),
+            citizens_table.c.citizen_id == any_(bindparam("citizen_ids", type_=ARRAY(Integer))),
+        )
+    ),
+)
+
+UPDATE_CITIZENS_FIELDS = ("name", "birth_date", "gender", "town", "street", "building", "apartment")
+
+# Обновление полей сразу нескольких жителей одним запросом. Каждый параметр
+# (кроме import_id) - массив значений соответствующего поля. Поля, которые
+# обновлять не нужно, передаются как NULL (все поля жителя обязательные,
+# поэтому NULL однозначно означает "оставить текущее значение").
+UPDATE_CITIZENS_QUERY = QUERIES.register(
+    "update_citizens",
+    """
+UPDATE citizens
+SET name = coalesce(v.name, citizens.name),
+    birth_date = coalesce(v.birth_date, citizens.birth_date),
+    gender = coalesce(v.gender::gender, citizens.gender),
+    town = coalesce(v.town, citizens.town),
+    street = coalesce(v.street, citizens.street),
+    building = coalesce(v.building, citizens.building),
+    apartment = coalesce(v.apartment, citizens.apartment)
+FROM unnest($2::int[], $3::text[], $4::date[], $5::text[], $6::text[], $7::text[], $8::text[], $9::int[])
+    AS v(citizen_id, name, birth_date, gender, town, street, building, apartment)
+WHERE citizens.import_id = $1 AND citizens.citizen_id = v.citizen_id
+""",
+    params=("import_id", "citizen_id") + UPDATE_CITIZENS_FIELDS,
+)
+
+MONTH = citizen_birth_month.label("month")
+
+# Родственные связи симметричны, поэтому подарки, которые житель купит
+# родственникам, родившимся в некотором месяце, можно посчитать, начав с
+# родившихся в этом месяце жителей: так фильтр по месяцу использует индекс
+# по месяцу рождения, а связи выбираются по префиксу первичного ключа.
+BIRTHDAYS = (
+    select(
+        [
+            MONTH,
+            relations_table.c.relative_id.label("citizen_id"),
+            func.count().label("presents"),
+        ]
+    )
+    .select_from(
+        citizens_table.join(
+            relations_table,
+            and_(
+                citizens_table.c.import_id == relations_table.c.import_id,
+                citizens_table.c.citizen_id == relations_table.c.citizen_id,
+            ),
+        )
+    )
+    .group_by(MONTH, relations_table.c.relative_id)
+    .order_by(MONTH, relations_table.c.relative_id)
+)
+
+BIRTHDAYS_QUERY = QUERIES.register(
+    "birthdays",
+    BIRTHDAYS.where(citizens_table.c.import_id == bindparam("import_id")),
+)
+
+BIRTHDAYS_BY_MONTH_QUERY = QUERIES.register(
+    "birthdays_by_month",
+    BIRTHDAYS.where(
+        and_(
+            citizens_table.c.import_id == bindparam("import_id"),
+            citizen_birth_month == bindparam("month"),
+        )
+    ),
+)
+
+RELATION_GRAPH_QUERY = QUERIES.register(
+    "relation_graph",
+    select(
+        [
+            citizens_table.c.citizen_id,
+            MONTH,
+            func.array_remove(func.array_agg(relations_table.c.relative_id), None).label("relatives"),
+        ]
+    )
+    .select_from(
+        citizens_table.outerjoin(
+            relations_table,
+            and_(
+                citizens_table.c.import_id == relations_table.c.import_id,
+                citizens_table.c.citizen_id == relations_table.c.citizen_id,
+            ),
+        )
+    )
+    .where(citizens_table.c.import_id == bindparam("import_id"))
+    .group_by(citizens_table.c.import_id, citizens_table.c.citizen_id)
+    .order_by(citizens_table.c.citizen_id),
+)
+
+# Добавление и удаление родственных связей. Связи передаются двумя массивами
+# одинаковой длины, поэтому текст запроса не зависит от количества связей и
+# подготавливается один раз.
+ADD_RELATIONS_QUERY = QUERIES.register(
+    "add_relations",
+    """
+INSERT INTO relations (import_id, citizen_id, relative_id)
+SELECT $1::int, r.citizen_id, r.relative_id
+FROM unnest($2::int[], $3::int[]) AS r(citizen_id, relative_id)
+""",
+    params=("import_id", "citizen_id", "relative_id"),
+)
+
+REMOVE_RELATIONS_QUERY = QUERIES.register(
+    "remove_relations",
+    """
+DELETE FROM relations
+USING unnest($2::int[], $3::int[]) AS r(citizen_id, relative_id)
+WHERE relations.import_id = $1
+    AND relations.citizen_id = r.citizen_id
+    AND relations.relative_id = r.relative_id
+""",
+    params=("import_id", "citizen_id", "relative_id"),
+)
+
+# Время изменения выгрузки. now() - время начала транзакции, и транзакция,
+# начавшаяся раньше, может зафиксироваться позже: значение всегда увеличивается,
+# чтобы по нему можно было формировать ETag. Блокировка строки выгрузки
+# держится до фиксации и упорядочивает запись в журнал изменений (см.
+# log_changes): изменения одной выгрузки фиксируются по очереди.
+TOUCH_IMPORT_QUERY = QUERIES.register(
+    "touch_import",
+    """
+UPDATE imports
+SET updated_at = greatest(clock_timestamp(), updated_at + interval '1 microsecond')
+WHERE import_id = $1
+""",
+    params=("import_id",),
+)
+
+Relation = Tuple[int, int]
+
 
 async def acquire_lock(conn: SAConnection, import_id: int) -> None:
     """
@@ -47,7 +246,7 @@ async def acquire_lock(conn: SAConnection, import_id: int) -> None:
     :param conn: объект соединения
     :param import_id: идентификатор выгрузки
     """
-    await conn.execute("SELECT pg_advisory_xact_lock($1)", import_id)
+    await ACQUIRE_LOCK_QUERY.execute(conn, import_id=import_id)
 
 
 def get_citizens_cursor(db: PG, import_id: int) -> AsyncPGCursor:
@@ -58,8 +257,11 @@ def get_citizens_cursor(db: PG, import_id: int) -> AsyncPGCursor:
     :param import_id: идентфикатор выгрузки
     :return: объект курсора
     """
-    query = CITIZENS_QUERY.where(citizens_table.c.import_id == import_id)
-    return AsyncPGCursor(query=query, transaction_ctx=db.transaction())
+    return AsyncPGCursor(
+        query=IMPORT_CITIZENS_QUERY,
+        params={"import_id": import_id},
+        transaction_ctx=db.transaction(),
+    )
 
 
 async def get_citizen(conn: SAConnection, import_id: int, citizen_id: int) -> dict:
@@ -71,188 +273,348 @@ async def get_citizen(conn: SAConnection, import_id: int, citizen_id: int) -> di
     :param citizen_id: идентфикатор жителя
     :return: словарь с данными жителя
     """
-    query = CITIZENS_QUERY.where(
-        and_(
-            citizens_table.c.import_id == import_id,
-            citizens_table.c.citizen_id == citizen_id,
-        )
-    )
-    return await conn.fetchrow(query)
+    return await CITIZEN_QUERY.fetchrow(conn, import_id=import_id, citizen_id=citizen_id)
 
 
-async def add_relatives(conn: SAConnection, import_id: int, citizen_id: int, relatives: Iterable[int]) -> None:
+async def get_citizens(conn: SAConnection, import_id: int, citizen_ids: Iterable[int]) -> List[Record]:
     """
-    Добавляет записи в таблицу родственных связей (relation_table).
+    Возвращает жителей с указанными идентификаторами в указанной выгрузке.
 
     :param conn: объект соединения
     :param import_id: идентификатор выгрузки
+    :param citizen_ids: идентификаторы жителей
+    :return: список найденных жителей
+    """
+    return await CITIZENS_BY_IDS_QUERY.fetch(conn, import_id=import_id, citizen_ids=list(citizen_ids))
+
+
+def make_relations(citizen_id: int, relatives: Iterable[int]) -> Set[Relation]:
+    """
+    Возвращает двусторонние родственные связи жителя с указанными родственниками.
+
     :param citizen_id: идентфикатор жителя
-    :param relatives: идентификаторы родственников для добавления
-    :raise ValidationError
+    :param relatives: идентификаторы родственников
+    :return: множество пар (citizen_id, relative_id)
     """
-    values = []
+    relations = set()
     for relative_id in relatives:
-        values.append(
-            {
-                "import_id": import_id,
-                "citizen_id": citizen_id,
-                "relative_id": relative_id,
-            }
-        )
+        relations.add((citizen_id, relative_id))
+        relations.add((relative_id, citizen_id))
+    return relations
 
-        if citizen_id != relative_id:
-            values.append(
-                {
-                    "import_id": import_id,
-                    "citizen_id": relative_id,
-                    "relative_id": citizen_id,
-                }
-            )
 
-    query = relations_table.insert().values(values)
+def unzip_relations(relations: Iterable[Relation]) -> Tuple[List[int], List[int]]:
+    """
+    Раскладывает пары (citizen_id, relative_id) на два массива
+    для передачи в unnest.
+
+    :param relations: пары (citizen_id, relative_id)
+    :return: массив citizen_id и массив relative_id
+    """
+    citizen_ids, relative_ids = [], []
+    for citizen_id, relative_id in relations:
+        citizen_ids.append(citizen_id)
+        relative_ids.append(relative_id)
+    return citizen_ids, relative_ids
+
+
+async def add_relations(conn: SAConnection, import_id: int, relations: Iterable[Relation]) -> None:
+    """
+    Добавляет записи в таблицу родственных связей (relation_table).
+
+    :param conn: объект соединения
+    :param import_id: идентификатор выгрузки
+    :param relations: пары (citizen_id, relative_id) для добавления
+    :raise ValidationError
+    """
+    citizen_ids, relative_ids = unzip_relations(relations)
 
     try:
-        await conn.execute(query)
+        await ADD_RELATIONS_QUERY.execute(conn, import_id=import_id, citizen_id=citizen_ids, relative_id=relative_ids)
     except ForeignKeyViolationError:
         raise ValidationError(
-            message="Unable to add relatives {0}, some do not exist".format(relatives),
+            message="Unable to add relatives {0}, some do not exist".format(sorted(set(relative_ids))),
             field_name="relatives",
         )
 
 
-async def remove_relatives(conn: SAConnection, import_id: int, citizen_id: int, relatives: Iterable[int]) -> None:
+async def remove_relations(conn: SAConnection, import_id: int, relations: Iterable[Relation]) -> None:
     """
     Удаляет записи из таблицы родственных связей (relation_table).
 
     :param conn: объект соединения
     :param import_id: идентификатор выгрузки
-    :param citizen_id: идентфикатор жителя
-    :param relatives: идентификаторы родственников для удаления
+    :param relations: пары (citizen_id, relative_id) для удаления
     """
-    conditions = []
+    citizen_ids, relative_ids = unzip_relations(relations)
+    await REMOVE_RELATIONS_QUERY.execute(conn, import_id=import_id, citizen_id=citizen_ids, relative_id=relative_ids)
 
-    for relative_id in relatives:
-        conditions.extend(
-            [
-                and_(
-                    relations_table.c.import_id == import_id,
-                    relations_table.c.citizen_id == citizen_id,
-                    relations_table.c.relative_id == relative_id,
-                ),
-                and_(
-                    relations_table.c.import_id == import_id,
-                    relations_table.c.citizen_id == relative_id,
-                    relations_table.c.relative_id == citizen_id,
-                ),
-            ]
-        )
 
-    query = relations_table.delete().where(or_(*conditions))
-    await conn.execute(query)
+async def update_citizens_fields(conn: SAConnection, import_id: int, updates: Iterable[dict]) -> None:
+    """
+    Обновляет поля (кроме родственных связей) жителей одним запросом.
 
+    :param conn: объект соединения
+    :param import_id: идентификатор выгрузки
+    :param updates: данные для обновления, содержащие citizen_id
+    """
+    columns = {field: [] for field in ("citizen_id",) + UPDATE_CITIZENS_FIELDS}
+    for updated_data in updates:
+        if not any(field in updated_data for field in UPDATE_CITIZENS_FIELDS):
+            continue
+        for field, values in columns.items():
+            values.append(updated_data.get(field))
+
+    if columns["citizen_id"]:
+        await UPDATE_CITIZENS_QUERY.execute(conn, import_id=import_id, **columns)
 
-async def update_citizen(conn: SAConnection, import_id: int, citizen: dict, updated_data: dict) -> dict:
+
+def diff_relations(citizens: Iterable[Record], updates: Iterable[dict]) -> Tuple[Set[Relation], Set[Relation]]:
     """
-    Обновляет жителя по идентификатору жителя в указанной выгрузке.
+    Вычисляет итоговый набор родственных связей для добавления и удаления.
+
+    Изменения применяются последовательно (в порядке обновлений) к текущему
+    состоянию жителей, поэтому связь, добавленная одним обновлением и удаленная
+    другим, в итоговые наборы не попадет.
+
+    :param citizens: текущие данные обновляемых жителей
+    :param updates: данные для обновления, содержащие citizen_id
+    :return: пары (citizen_id, relative_id) для добавления и для удаления
+    """
+    relatives_map = {citizen["citizen_id"]: set(citizen["relatives"]) for citizen in citizens}
+    relations_for_add, relations_for_remove = set(), set()
+
+    for updated_data in updates:
+        if "relatives" not in updated_data:
+            continue
+
+        citizen_id = updated_data["citizen_id"]
+        current_relatives = relatives_map[citizen_id]
+        updated_relatives = set(updated_data["relatives"])
+
+        for relation in make_relations(citizen_id, updated_relatives - current_relatives):
+            if relation in relations_for_remove:
+                relations_for_remove.discard(relation)
+            else:
+                relations_for_add.add(relation)
+
+        for relation in make_relations(citizen_id, current_relatives - updated_relatives):
+            if relation in relations_for_add:
+                relations_for_add.discard(relation)
+            else:
+                relations_for_remove.add(relation)
+
+        # Родственные связи двусторонние: отражаем изменения и у родственников,
+        # которые обновляются в этом же запросе
+        for relative_id in updated_relatives - current_relatives:
+            relatives_map.get(relative_id, set()).add(citizen_id)
+        for relative_id in current_relatives - updated_relatives:
+            relatives_map.get(relative_id, set()).discard(citizen_id)
+        relatives_map[citizen_id] = updated_relatives
+
+    return relations_for_add, relations_for_remove
+
+
+async def update_citizens(conn: SAConnection, import_id: int, citizens: List[Record], updates: List[dict]) -> None:
+    """
+    Обновляет нескольких жителей указанной выгрузки.
+
+    Поля всех жителей обновляются одним запросом, родственные связи - не более
+    чем двумя (добавление и удаление). Версии обновляемых жителей должны быть
+    увеличены заранее, здесь увеличиваются версии только их родственников,
+    чьи родственные связи изменились. Все изменения записываются в журнал
+    изменений в той же транзакции, и обновляется время изменения выгрузки.
 
     :param conn: объект соединения
     :param import_id: идентификатор выгрузки
-    :param citizen: текущие данные жителя
-    :param updated_data: данные для обновления
+    :param citizens: текущие данные жителей, у которых обновляются родственники
+    :param updates: данные для обновления, содержащие citizen_id
+    :raise ValidationError
     """
-    citizen_kwargs = {
-        "conn": conn,
-        "import_id": import_id,
-        "citizen_id": citizen["citizen_id"],
-    }
-    updated_citizen_data = {field: value for field, value in updated_data.items() if field != "relatives"}
-    if updated_citizen_data:
-        query = (
-            citizens_table.update()
-            .values(updated_citizen_data)
-            .where(
-                and_(
-                    citizens_table.c.import_id == import_id,
-                    citizens_table.c.citizen_id == citizen["citizen_id"],
-                )
-            )
-        )
-        await conn.execute(query)
+    stats_updates = [updated_data for updated_data in updates if STATS_FIELDS.intersection(updated_data)]
+    if stats_updates:
+        await invalidate_town_age_statistics(conn=conn, import_id=import_id)
+        # Прежние города жителей известны только до обновления
+        await invalidate_sketches(conn=conn, import_id=import_id, updates=stats_updates)
+
+    await update_citizens_fields(conn=conn, import_id=import_id, updates=updates)
+
+    relations_for_add, relations_for_remove = diff_relations(citizens=citizens, updates=updates)
+    if relations_for_add:
+        await add_relations(conn=conn, import_id=import_id, relations=relations_for_add)
+    if relations_for_remove:
+        await remove_relations(conn=conn, import_id=import_id, relations=relations_for_remove)
+
+    relatives_changed = {citizen_id for citizen_id, _ in relations_for_add | relations_for_remove}
+    affected_ids = relatives_changed - {updated_data["citizen_id"] for updated_data in updates}
+    if affected_ids:
+        await BUMP_VERSIONS_QUERY.execute(conn, import_id=import_id, citizen_id=list(affected_ids), version=None)
+
+    # Последние действия транзакции: блокировка строки выгрузки держится до
+    # фиксации, изменения одной выгрузки с этого момента выполняются по очереди
+    await TOUCH_IMPORT_QUERY.execute(conn, import_id=import_id)
+    await log_changes(conn=conn, import_id=import_id, updates=updates, relatives_changed=relatives_changed)
 
-    if "relatives" in updated_data:
-        current_relatives = set(citizen["relatives"])  # {1}
-        updated_relatives = set(updated_data["relatives"])  # {2}
 
-        relatives_for_add = updated_relatives - current_relatives  # нужно ли добавить родственные связи
-        relatives_for_remove = current_relatives - updated_relatives  # нужно ли удалить родственные связи
+async def update_citizen(conn: SAConnection, import_id: int, citizen_id: int, updated_data: dict) -> Record:
+    """
+    Обновляет жителя по идентификатору жителя в указанной выгрузке.
 
-        if relatives_for_add:
-            await add_relatives(**citizen_kwargs, relatives=relatives_for_add)
-        if relatives_for_remove:
-            await remove_relatives(**citizen_kwargs, relatives=relatives_for_remove)
+    :param conn: объект соединения
+    :param import_id: идентификатор выгрузки
+    :param citizen_id: идентификатор жителя
+    :param updated_data: данные для обновления
+    :return: обновленное состояние жителя
+    """
+    citizens = []
+    if "relatives" in updated_data:
+        citizens.append(await get_citizen(conn=conn, import_id=import_id, citizen_id=citizen_id))
 
-    return await get_citizen(**citizen_kwargs)
+    await update_citizens(
+        conn=conn,
+        import_id=import_id,
+        citizens=citizens,
+        updates=[{**updated_data, "citizen_id": citizen_id}],
+    )
+    return await get_citizen(conn=conn, import_id=import_id, citizen_id=citizen_id)
 
 
-async def partially_update_citizen(db: PG, import_id: int, citizen_id: int, updated_data: dict) -> dict:
+async def partially_update_citizen(
+    db: PG, import_id: int, citizen_id: int, updated_data: dict, version: Optional[int] = None
+) -> Tuple[Record, int]:
     """
     Частичное обновление жителя.
 
+    Если передана ожидаемая версия жителя, то обновление условное:
+    advisory-блокировка выгрузки не берется (кроме изменения родственных
+    связей, которые затрагивают других жителей, и полей, от которых зависит
+    сохраненная статистика выгрузки), и обновления разных жителей выполняются
+    параллельно. По очереди выполняются только последние шаги - обновление
+    времени изменения выгрузки и запись в журнал изменений (см. update_citizens),
+    после которых транзакция только читает результат и фиксируется. При несовпадении версии
+    выбрасывается исключение HTTPPreconditionFailed.
+
     :param db: объект для взаимодействия с БД
     :param import_id: идентификатор выгрузки
     :param citizen_id: идентификатор жителя
     :param updated_data: актуальные данные для обновления жителя
-    :return: обновленное состояние жителя
+    :param version: ожидаемая текущая версия жителя
+    :return: обновленное состояние жителя и его новая версия
     """
     async with db.transaction() as conn:
-        # Блокировка позволит избежать состояние гонки между конкурентными
-        # запросами на изменение родственников
-        await acquire_lock(conn=conn, import_id=import_id)
+        if version is None or "relatives" in updated_data or STATS_FIELDS.intersection(updated_data):
+            # Блокировка позволит избежать состояние гонки между конкурентными
+            # запросами на изменение родственников и пересчетом статистики
+            await acquire_lock(conn=conn, import_id=import_id)
+
+        versions = await BUMP_VERSIONS_QUERY.fetch(conn, import_id=import_id, citizen_id=[citizen_id], version=version)
+        if not versions:
+            if version is not None and await CITIZEN_VERSION_QUERY.fetchval(
+                conn, import_id=import_id, citizen_id=citizen_id
+            ):
+                raise HTTPPreconditionFailed
+            raise HTTPNotFound
+
+        updated_citizen = await update_citizen(
+            conn=conn, import_id=import_id, citizen_id=citizen_id, updated_data=updated_data
+        )
+        return updated_citizen, versions[0]["version"]
+
 
-        citizen = await get_citizen(conn=conn, import_id=import_id, citizen_id=citizen_id)
+async def partially_update_citizens(db: PG, import_id: int, updates: List[dict]) -> List[Record]:
+    """
+    Частичное обновление нескольких жителей в одной транзакции.
+
+    :param db: объект для взаимодействия с БД
+    :param import_id: идентификатор выгрузки
+    :param updates: данные для обновления, содержащие citizen_id
+    :return: обновленные жители в порядке обновлений
+    """
+    citizen_ids = [updated_data["citizen_id"] for updated_data in updates]
 
-        if not citizen:
+    async with db.transaction() as conn:
+        await acquire_lock(conn=conn, import_id=import_id)
+
+        versions = await BUMP_VERSIONS_QUERY.fetch(conn, import_id=import_id, citizen_id=citizen_ids, version=None)
+        if len(versions) != len(citizen_ids):
             raise HTTPNotFound
 
-        return await update_citizen(conn=conn, import_id=import_id, citizen=citizen, updated_data=updated_data)
+        citizens = []
+        relatives_ids = [updated_data["citizen_id"] for updated_data in updates if "relatives" in updated_data]
+        if relatives_ids:
+            citizens = await get_citizens(conn=conn, import_id=import_id, citizen_ids=relatives_ids)
 
+        await update_citizens(conn=conn, import_id=import_id, citizens=citizens, updates=updates)
 
-async def get_citizen_birthdays_by_months(db: PG, import_id: int) -> Dict[int, list]:
+        updated_citizens = {
+            citizen["citizen_id"]: citizen
+            for citizen in await get_citizens(conn=conn, import_id=import_id, citizen_ids=citizen_ids)
+        }
+        return [updated_citizens[citizen_id] for citizen_id in citizen_ids]
+
+
+async def get_citizen_with_version(db: PG, import_id: int, citizen_id: int) -> Tuple[dict, int]:
+    """
+    Возвращает жителя и его текущую версию.
+
+    :param db: объект для взаимодействия с БД
+    :param import_id: идентификатор выгрузки
+    :param citizen_id: идентификатор жителя
+    :return: данные жителя и его версия
+    """
+    row = await CITIZEN_WITH_VERSION_QUERY.fetchrow(db, import_id=import_id, citizen_id=citizen_id)
+    if not row:
+        raise HTTPNotFound
+
+    citizen = dict(row)
+    return citizen, citizen.pop("version")
+
+
+async def get_citizen_birthdays_by_months(
+    db: PG, import_id: int, month: Optional[int] = None, graphs: Optional[RelationGraphCache] = None
+) -> Dict[str, list]:
     """
     Возвращает жителей и количество подарков, которые они будут покупать
     своим близжашим родственникам, сгруппированных по месяцам.
 
+    Жители в каждом месяце упорядочены по идентификатору. Если передан месяц,
+    то заполняется только он, остальные месяцы возвращаются пустыми.
+
+    Если передан кэш графов родственных связей, то результат вычисляется по
+    графу выгрузки в памяти процесса. Граф перестраивается, только если выгрузка
+    изменилась с момента его построения.
+
     :param db: объект для взаимодействия с БД
     :param import_id: идентификатор выгрузки
+    :param month: номер месяца
+    :param graphs: кэш графов родственных связей
     :return: статистику по месяцам
     """
-    month = func.date_part("month", citizens_table.c.birth_date)
-    month = cast(month, Integer).label("month")
-    query = (
-        select(
-            [
-                month,
-                relations_table.c.citizen_id,
-                func.count(relations_table.c.relative_id).label("presents"),
-            ]
-        )
-        .select_from(
-            relations_table.outerjoin(
-                citizens_table,
-                and_(
-                    relations_table.c.import_id == citizens_table.c.import_id,
-                    relations_table.c.relative_id == citizens_table.c.citizen_id,
-                ),
-            )
-        )
-        .group_by(month, relations_table.c.import_id, relations_table.c.citizen_id)
-        .where(relations_table.c.import_id == import_id)
-    )
-    rows = await db.fetch(query)
-
     result = {str(i): [] for i in range(1, 13)}
-    for month, rows in groupby(rows, key=lambda row: row["month"]):
-        for row in rows:
-            result[str(month)].append({"citizen_id": row["citizen_id"], "presents": row["presents"]})
+
+    if graphs is not None:
+        # Версия читается до построения графа: если выгрузка изменится между
+        # запросами, граф будет помечен устаревшей версией и перестроен позже
+        version = await get_last_change_seq(db, import_id=import_id)
+        graph = graphs.get(import_id, version)
+        if graph is None:
+            rows = await RELATION_GRAPH_QUERY.fetch(db, import_id=import_id)
+            graph = RelationGraph.from_rows(version=version, rows=rows)
+            graphs.put(import_id, graph)
+
+        presents = graph.presents_by_months()
+        if month is None:
+            return presents
+        result[str(month)] = presents[str(month)]
+        return result
+
+    if month is None:
+        rows = await BIRTHDAYS_QUERY.fetch(db, import_id=import_id)
+    else:
+        rows = await BIRTHDAYS_BY_MONTH_QUERY.fetch(db, import_id=import_id, month=month)
+
+    # Строки упорядочены по месяцу и жителю, поэтому результат собирается за один проход
+    for row in rows:
+        result[str(row["month"])].append({"citizen_id": row["citizen_id"], "presents": row["presents"]})
 
     return result
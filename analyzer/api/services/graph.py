@@ -0,0 +1,107 @@
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from asyncpg import Record
+
+
+class RelationGraph:
+    """
+    Компактный граф родственных связей выгрузки.
+
+    Хранит жителей, месяцы их рождения и родственников в виде CSR-списка
+    смежности: родственники i-го жителя - это индексы
+    relatives[offsets[i]:offsets[i + 1]] в массивах citizen_ids и months.
+    Граф помечен номером последнего изменения выгрузки, по которому он построен.
+    """
+
+    __slots__ = ("version", "citizen_ids", "months", "offsets", "relatives", "_presents")
+
+    def __init__(self, version: int, citizen_ids: array, months: array, offsets: array, relatives: array) -> None:
+        self.version = version
+        self.citizen_ids = citizen_ids
+        self.months = months
+        self.offsets = offsets
+        self.relatives = relatives
+        self._presents = None
+
+    @classmethod
+    def from_rows(cls, version: int, rows: Iterable[Record]) -> "RelationGraph":
+        """
+        Строит граф по строкам с полями citizen_id, month и relatives.
+
+        :param version: номер последнего изменения выгрузки
+        :param rows: жители выгрузки
+        :return: граф родственных связей
+        """
+        rows = list(rows)
+        index = {row["citizen_id"]: i for i, row in enumerate(rows)}
+
+        citizen_ids, months = array("l"), array("b")
+        offsets, relatives = array("l", [0]), array("l")
+        for row in rows:
+            citizen_ids.append(row["citizen_id"])
+            months.append(row["month"])
+            relatives.extend(index[relative_id] for relative_id in row["relatives"])
+            offsets.append(len(relatives))
+
+        return cls(version=version, citizen_ids=citizen_ids, months=months, offsets=offsets, relatives=relatives)
+
+    def presents_by_months(self) -> Dict[str, list]:
+        """
+        Возвращает жителей и количество подарков, которые они будут покупать
+        своим родственникам, сгруппированных по месяцам.
+
+        Результат вычисляется один раз и не должен изменяться вызывающим кодом.
+        """
+        if self._presents is None:
+            presents = {str(month): [] for month in range(1, 13)}
+            for i, citizen_id in enumerate(self.citizen_ids):
+                counts = [0] * 13
+                for j in self.relatives[self.offsets[i] : self.offsets[i + 1]]:
+                    counts[self.months[j]] += 1
+                for month in range(1, 13):
+                    if counts[month]:
+                        presents[str(month)].append({"citizen_id": citizen_id, "presents": counts[month]})
+            self._presents = presents
+
+        return self._presents
+
+
+class RelationGraphCache:
+    """LRU-кэш графов родственных связей по идентификатору выгрузки."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._graphs = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._graphs)
+
+    def get(self, import_id: int, version: int) -> Optional[RelationGraph]:
+        """
+        Возвращает граф выгрузки, если он построен по указанной версии.
+
+        :param import_id: идентификатор выгрузки
+        :param version: номер последнего изменения выгрузки
+        """
+        graph = self._graphs.get(import_id)
+        if graph is None or graph.version != version:
+            return None
+
+        self._graphs.move_to_end(import_id)
+        return graph
+
+    def put(self, import_id: int, graph: RelationGraph) -> None:
+        current = self._graphs.get(import_id)
+        if current is not None and current.version > graph.version:
+            # Конкурентный запрос уже построил граф по более новой версии
+            return
+
+        self._graphs[import_id] = graph
+        self._graphs.move_to_end(import_id)
+        while len(self._graphs) > self.max_size:
+            self._graphs.popitem(last=False)
+
+    def invalidate(self, import_id: int) -> None:
+        self._graphs.pop(import_id, None)
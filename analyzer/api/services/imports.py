@@ -3,6 +3,7 @@ from typing import List
 from aiomisc import chunk_list
 from asyncpgsa import PG
 
+from analyzer.api.services.sketches import build_sketches, store_sketches
 from analyzer.db.schema import imports_table, citizens_table, relations_table
 from analyzer.utils.consts import MAX_QUERY_ARGS
 
@@ -54,4 +55,7 @@ async def create_import(db: PG, citizens: List[dict]) -> int:
         for chunk in chunked_relation_rows:
             await conn.execute(query.values(list(chunk)))
 
+        sketches = build_sketches((citizen["town"], citizen["birth_date"]) for citizen in citizens)
+        await store_sketches(conn=conn, import_id=import_id, sketches=sketches)
+
         return import_id
@@ -0,0 +1,209 @@
+import json
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from asyncpgsa import PG
+from asyncpgsa.connection import SAConnection
+from sqlalchemy import select, and_, bindparam, any_, String
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from analyzer.api.services.stats import (
+    ACQUIRE_SHARED_LOCK_QUERY,
+    DEFAULT_QUANTILES,
+    TOWN_BIRTH_DATES_QUERY,
+    get_current_date,
+    make_town_age_stat,
+)
+from analyzer.db.schema import citizens_table, town_age_sketches_table
+from analyzer.utils.db import QUERIES
+from analyzer.utils.tdigest import TDigest
+
+# Распределения строятся по датам рождения (порядковым номерам дней), а не по
+# возрастам: возрасты меняются каждый день, а даты рождения - только при
+# обновлении жителя. Квантиль q возраста соответствует квантилю 1 - q даты.
+
+SKETCHES_QUERY = QUERIES.register(
+    "town_age_sketches",
+    select([town_age_sketches_table.c.town, town_age_sketches_table.c.sketch]).where(
+        town_age_sketches_table.c.import_id == bindparam("import_id")
+    ),
+)
+
+TOWNS_BIRTH_DATES_QUERY = QUERIES.register(
+    "towns_birth_dates",
+    select([citizens_table.c.town, citizens_table.c.birth_date]).where(
+        and_(
+            citizens_table.c.import_id == bindparam("import_id"),
+            citizens_table.c.town == any_(bindparam("towns", type_=ARRAY(String))),
+        )
+    ),
+)
+
+STORE_SKETCHES_QUERY = QUERIES.register(
+    "store_town_age_sketches",
+    """
+INSERT INTO town_age_sketches (import_id, town, sketch)
+SELECT $1::int, s.town, s.sketch::jsonb
+FROM unnest($2::text[], $3::text[]) AS s(town, sketch)
+ON CONFLICT (import_id, town) DO UPDATE SET sketch = excluded.sketch
+""",
+    params=("import_id", "town", "sketch"),
+)
+
+DELETE_SKETCHES_QUERY = QUERIES.register(
+    "delete_town_age_sketches",
+    "DELETE FROM town_age_sketches WHERE import_id = $1 AND town = ANY($2::text[])",
+    params=("import_id", "town"),
+)
+
+# Помечает устаревшими распределения прежних и новых городов обновляемых
+# жителей. Выполняется до обновления, пока в таблице жителей прежние города.
+# Выгрузки, распределения которых еще не строились, не затрагиваются: для них
+# все распределения будут построены при первом запросе.
+INVALIDATE_SKETCHES_QUERY = QUERIES.register(
+    "invalidate_town_age_sketches",
+    """
+INSERT INTO town_age_sketches (import_id, town, sketch)
+SELECT $1::int, t.town, NULL
+FROM (
+    SELECT citizens.town
+    FROM citizens
+    WHERE citizens.import_id = $1 AND citizens.citizen_id = ANY($2::int[])
+    UNION
+    SELECT unnest($3::text[])
+) AS t(town)
+WHERE EXISTS (SELECT 1 FROM town_age_sketches WHERE import_id = $1)
+ON CONFLICT (import_id, town) DO UPDATE SET sketch = NULL
+""",
+    params=("import_id", "citizen_id", "town"),
+)
+
+
+def build_sketches(citizens: Iterable[Tuple[str, date]]) -> Dict[str, TDigest]:
+    """
+    Строит распределения дат рождения по городам.
+
+    :param citizens: пары (город, дата рождения)
+    :return: распределения по городам
+    """
+    ordinals = defaultdict(list)
+    for town, birth_date in citizens:
+        ordinals[town].append(birth_date.toordinal())
+    return {town: TDigest.from_values(values) for town, values in ordinals.items()}
+
+
+async def store_sketches(conn: SAConnection, import_id: int, sketches: Dict[str, TDigest]) -> None:
+    """
+    Сохраняет распределения дат рождения по городам.
+
+    :param conn: объект соединения
+    :param import_id: идентификатор выгрузки
+    :param sketches: распределения по городам
+    """
+    if not sketches:
+        return
+
+    towns = list(sketches)
+    await STORE_SKETCHES_QUERY.execute(
+        conn,
+        import_id=import_id,
+        town=towns,
+        sketch=[json.dumps(sketches[town].to_dict()) for town in towns],
+    )
+
+
+async def invalidate_sketches(conn: SAConnection, import_id: int, updates: List[dict]) -> None:
+    """
+    Помечает устаревшими распределения городов, затронутых обновлением жителей.
+
+    Должна вызываться до обновления жителей, под эксклюзивной блокировкой выгрузки.
+
+    :param conn: объект соединения
+    :param import_id: идентификатор выгрузки
+    :param updates: данные для обновления, затрагивающие даты рождения или города
+    """
+    await INVALIDATE_SKETCHES_QUERY.execute(
+        conn,
+        import_id=import_id,
+        citizen_id=[updated_data["citizen_id"] for updated_data in updates],
+        town=[updated_data["town"] for updated_data in updates if "town" in updated_data],
+    )
+
+
+async def get_sketches(db: PG, import_id: int) -> Dict[str, TDigest]:
+    """
+    Возвращает распределения дат рождения по городам выгрузки.
+
+    Устаревшие распределения перестраиваются по данным только своих городов,
+    а если распределения выгрузки еще не строились - по всей выгрузке.
+
+    :param db: объект для взаимодействия с БД
+    :param import_id: идентификатор выгрузки
+    :return: распределения по городам
+    """
+    rows = await SKETCHES_QUERY.fetch(db, import_id=import_id)
+    if rows and all(row["sketch"] is not None for row in rows):
+        return {row["town"]: TDigest.from_dict(json.loads(row["sketch"])) for row in rows}
+
+    async with db.transaction() as conn:
+        # Разделяемая блокировка, как и при расчете статистики, не даст
+        # сохранить распределения, построенные до конкурентного обновления
+        await ACQUIRE_SHARED_LOCK_QUERY.execute(conn, import_id=import_id)
+
+        rows = await SKETCHES_QUERY.fetch(conn, import_id=import_id)
+        sketches = {row["town"]: TDigest.from_dict(json.loads(row["sketch"])) for row in rows if row["sketch"]}
+        stale_towns = [row["town"] for row in rows if row["sketch"] is None]
+
+        if not rows:
+            cursor = await TOWN_BIRTH_DATES_QUERY.cursor(conn, import_id=import_id)
+        else:
+            cursor = await TOWNS_BIRTH_DATES_QUERY.cursor(conn, import_id=import_id, towns=stale_towns)
+        rebuilt = build_sketches([(row["town"], row["birth_date"]) async for row in cursor])
+
+        await store_sketches(conn, import_id=import_id, sketches=rebuilt)
+        # В городе могло не остаться жителей
+        empty_towns = [town for town in stale_towns if town not in rebuilt]
+        if empty_towns:
+            await DELETE_SKETCHES_QUERY.execute(conn, import_id=import_id, town=empty_towns)
+
+    sketches.update(rebuilt)
+    return sketches
+
+
+def full_years(birth_date: date, current_date: date) -> int:
+    """Возвращает количество полных лет, как date_part('year', age(...))."""
+    if birth_date > current_date:
+        return -full_years(current_date, birth_date)
+    return (
+        current_date.year
+        - birth_date.year
+        - ((current_date.month, current_date.day) < (birth_date.month, birth_date.day))
+    )
+
+
+async def get_town_age_quantiles_approximate(
+    db: PG, import_id: int, quantiles: Optional[Sequence[float]] = None
+) -> List[dict]:
+    """
+    Возвращает приближенные квантили возрастов жителей по городам.
+
+    Стоимость расчета пропорциональна количеству городов, а не жителей.
+    Возрасты - целое количество полных лет, без интерполяции между жителями.
+
+    :param db: объект для взаимодействия с БД
+    :param import_id: идентификатор выгрузки
+    :param quantiles: квантили от 0 до 1 (None - квантили по умолчанию)
+    :return: статистика, упорядоченная по городу
+    """
+    current_date = get_current_date()
+    sketches = await get_sketches(db, import_id=import_id)
+
+    stats = []
+    for town in sorted(sketches):
+        values = [
+            float(full_years(date.fromordinal(round(sketches[town].quantile(1 - q))), current_date))
+            for q in quantiles or DEFAULT_QUANTILES
+        ]
+        stats.append(make_town_age_stat(town, values, quantiles))
+    return stats
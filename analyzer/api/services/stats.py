@@ -1,39 +1,365 @@
-from typing import List
+import asyncio
+import importlib
+import importlib.util
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from typing import List, Optional, Sequence, Tuple
 
-from asyncpg import Record
+from aiohttp.web import Application
 from asyncpgsa import PG
-from sqlalchemy import select, func, text
+from asyncpgsa.connection import SAConnection
+from sqlalchemy import select, func, cast, bindparam, collate, literal_column, and_, Date, DateTime, Float, Integer
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by, insert
 
-from analyzer.db.schema import citizens_table
-from analyzer.utils.db import rounded
+from analyzer.db.schema import citizens_table, town_age_stats_table
+from analyzer.utils.db import rounded, Executor, QUERIES
 
-CURRENT_DATE = text("TIMEZONE('utc', CURRENT_TIMESTAMP)")
+# NumPy импортируется при первом расчете (или в фоне после запуска
+# приложения, см. preload_numpy), а не при запуске сервера
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
 
+# Квантили, которые возвращаются по умолчанию в полях p50, p75 и p99
+DEFAULT_QUANTILES = (0.5, 0.75, 0.99)
 
-async def get_town_age_statistics(db: PG, import_id: int) -> List[Record]:
+# Города упорядочиваются по кодам символов, как строки в Python (расчет с
+# помощью NumPy и по скетчам), а не по правилам сортировки (collation) БД:
+# порядок не должен зависеть от движка
+TOWN_COLLATION = "C"
+
+AGE = func.date_part(
+    "year", func.age(cast(bindparam("current_date", type_=Date), DateTime), citizens_table.c.birth_date)
+)
+
+TOWN_AGE_STATS = (
+    select(
+        [
+            citizens_table.c.town,
+            rounded(func.percentile_cont(0.5).within_group(AGE)).label("p50"),
+            rounded(func.percentile_cont(0.75).within_group(AGE)).label("p75"),
+            rounded(func.percentile_cont(0.99).within_group(AGE)).label("p99"),
+        ]
+    )
+    .select_from(citizens_table)
+    .group_by(citizens_table.c.town)
+)
+
+TOWN_AGE_STATS_QUERY = QUERIES.register(
+    "town_age_stats",
+    TOWN_AGE_STATS.where(citizens_table.c.import_id == bindparam("import_id")),
+)
+
+TOWN_AGE_QUANTILES_QUERY = QUERIES.register(
+    "town_age_quantiles",
+    select(
+        [
+            citizens_table.c.town,
+            func.percentile_cont(cast(bindparam("quantiles"), ARRAY(Float))).within_group(AGE).label("quantiles"),
+        ]
+    )
+    .where(citizens_table.c.import_id == bindparam("import_id"))
+    .group_by(citizens_table.c.town)
+    .order_by(collate(citizens_table.c.town, TOWN_COLLATION)),
+)
+
+# Поля жителя, от которых зависит статистика возрастов
+STATS_FIELDS = frozenset(("birth_date", "town"))
+
+CACHED_TOWN_AGE_STATS_QUERY = QUERIES.register(
+    "cached_town_age_stats",
+    select([town_age_stats_table.c.stats]).where(
+        and_(
+            town_age_stats_table.c.import_id == bindparam("import_id"),
+            town_age_stats_table.c.stats_date == bindparam("current_date"),
+        )
+    ),
+)
+
+# Разделяемая блокировка выгрузки: обновления статистики не мешают друг другу,
+# но ждут завершения изменений жителей, которые берут эксклюзивную блокировку.
+ACQUIRE_SHARED_LOCK_QUERY = QUERIES.register(
+    "acquire_shared_lock", "SELECT pg_advisory_xact_lock_shared($1)", params=("import_id",)
+)
+
+# Статистика рассчитывается и сохраняется одним запросом
+IMPORT_TOWN_AGE_STATS = TOWN_AGE_STATS.where(citizens_table.c.import_id == bindparam("import_id")).alias("town_stats")
+INSERT_TOWN_AGE_STATS = insert(town_age_stats_table).from_select(
+    ["import_id", "stats_date", "stats"],
+    select(
+        [
+            cast(bindparam("import_id"), Integer),
+            # Тип параметра должен совпадать с типом в расчете возрастов
+            cast(cast(bindparam("current_date", type_=Date), DateTime), Date),
+            func.coalesce(
+                func.jsonb_agg(
+                    aggregate_order_by(
+                        literal_column(IMPORT_TOWN_AGE_STATS.name),
+                        collate(IMPORT_TOWN_AGE_STATS.c.town, TOWN_COLLATION),
+                    )
+                ),
+                literal_column("'[]'::jsonb"),
+            ),
+        ]
+    ).select_from(IMPORT_TOWN_AGE_STATS),
+)
+REFRESH_TOWN_AGE_STATS_QUERY = QUERIES.register(
+    "refresh_town_age_stats",
+    INSERT_TOWN_AGE_STATS.on_conflict_do_update(
+        index_elements=[town_age_stats_table.c.import_id],
+        set_={
+            "stats_date": INSERT_TOWN_AGE_STATS.excluded.stats_date,
+            "stats": INSERT_TOWN_AGE_STATS.excluded.stats,
+        },
+    ).returning(town_age_stats_table.c.stats),
+)
+
+# Запросы для расчета статистики на стороне приложения
+IMPORT_CITIZENS_COUNT_QUERY = QUERIES.register(
+    "import_citizens_count",
+    select([func.count()]).select_from(citizens_table).where(citizens_table.c.import_id == bindparam("import_id")),
+)
+
+TOWN_BIRTH_DATES_QUERY = QUERIES.register(
+    "town_birth_dates",
+    select([citizens_table.c.town, citizens_table.c.birth_date]).where(
+        citizens_table.c.import_id == bindparam("import_id")
+    ),
+)
+
+STORE_TOWN_AGE_STATS_QUERY = QUERIES.register(
+    "store_town_age_stats",
+    """
+INSERT INTO town_age_stats (import_id, stats_date, stats)
+VALUES ($1, $2, $3::jsonb)
+ON CONFLICT (import_id) DO UPDATE SET stats_date = excluded.stats_date, stats = excluded.stats
+""",
+    params=("import_id", "current_date", "stats"),
+)
+
+INVALIDATE_TOWN_AGE_STATS_QUERY = QUERIES.register(
+    "invalidate_town_age_stats",
+    town_age_stats_table.delete().where(town_age_stats_table.c.import_id == bindparam("import_id")),
+)
+
+
+def get_current_date() -> date:
+    """Возвращает текущую дату по UTC, относительно которой считаются возрасты."""
+    return datetime.now(tz=timezone.utc).date()
+
+
+def round_percentile(value: float) -> float:
+    """
+    Округляет значение так же, как rounded(): при приведении double precision
+    к numeric Postgres оставляет 15 значащих цифр, а затем округляет половины
+    от нуля.
+
+    :param value: значение перцентиля
+    :return: значение, округленное до двух знаков
+    """
+    return float(Decimal("%.15g" % value).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+
+
+def make_town_age_stat(town: str, values: Sequence[float], quantiles: Optional[Sequence[float]] = None) -> dict:
+    """
+    Формирует элемент ответа со статистикой возрастов города.
+
+    :param town: город
+    :param values: значения квантилей
+    :param quantiles: запрошенные квантили (None - квантили по умолчанию)
+    :return: статистика города
+    """
+    if quantiles is None:
+        return {"town": town, **{"p{0:g}".format(q * 100): value for q, value in zip(DEFAULT_QUANTILES, values)}}
+    return {"town": town, "quantiles": {str(q): value for q, value in zip(quantiles, values)}}
+
+
+def calculate_town_age_quantiles(
+    towns: Sequence[str], birth_dates: Sequence[date], current_date: date, quantiles: Sequence[float]
+) -> List[Tuple[str, List[float]]]:
+    """
+    Рассчитывает квантили возрастов жителей по городам с помощью NumPy.
+
+    Возраст - количество полных лет, как у date_part('year', age(...)), а
+    квантили интерполируются линейно, как в percentile_cont.
+
+    :param towns: города жителей
+    :param birth_dates: даты рождения жителей в том же порядке
+    :param current_date: дата, относительно которой считаются возрасты
+    :param quantiles: квантили от 0 до 1
+    :return: округленные значения квантилей, упорядоченные по городу
+    """
+    if not towns:
+        return []
+
+    import numpy as np
+
+    births = np.array(birth_dates, dtype="datetime64[D]")
+    years = births.astype("datetime64[Y]").astype(np.int64) + 1970
+    months = births.astype("datetime64[M]")
+    days = (births - months.astype("datetime64[D]")).astype(np.int64) + 1
+    months = months.astype(np.int64) % 12 + 1
+
+    # Полных лет на одно меньше, если день рождения в текущем году еще не наступил
+    later = (months > current_date.month) | ((months == current_date.month) & (days > current_date.day))
+    earlier = (months < current_date.month) | ((months == current_date.month) & (days < current_date.day))
+    ages = current_date.year - years - later
+    # Для дат из будущего age() считает интервал в обратную сторону и меняет знак
+    future = births > np.datetime64(current_date, "D")
+    ages[future] = (current_date.year - years + earlier)[future]
+
+    town_names, town_ids = np.unique(np.array(towns, dtype=object), return_inverse=True)
+    order = np.lexsort((ages, town_ids))
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(town_ids))))
+    ages = ages[order]
+
+    return [
+        (town, [round_percentile(value) for value in np.quantile(ages[bounds[i] : bounds[i + 1]], quantiles)])
+        for i, town in enumerate(town_names)
+    ]
+
+
+def calculate_town_age_statistics(towns: Sequence[str], birth_dates: Sequence[date], current_date: date) -> List[dict]:
+    """
+    Рассчитывает статистику возрастов по городам (квантили по умолчанию) с помощью NumPy.
+
+    :param towns: города жителей
+    :param birth_dates: даты рождения жителей в том же порядке
+    :param current_date: дата, относительно которой считаются возрасты
+    :return: статистика, упорядоченная по городу
+    """
+    return [
+        make_town_age_stat(town, values)
+        for town, values in calculate_town_age_quantiles(towns, birth_dates, current_date, DEFAULT_QUANTILES)
+    ]
+
+
+async def preload_numpy(app: Application) -> None:
+    """
+    Импортирует NumPy в отдельном потоке, не задерживая запуск приложения
+    и первый запрос статистики.
+    """
+    asyncio.get_event_loop().run_in_executor(None, importlib.import_module, "numpy")
+
+
+async def use_numpy(executor: Executor, import_id: int, numpy_min_citizens: Optional[int]) -> bool:
+    """
+    Определяет, рассчитывать ли статистику выгрузки с помощью NumPy.
+
+    :param executor: объект для взаимодействия с БД
+    :param import_id: идентификатор выгрузки
+    :param numpy_min_citizens: минимальный размер выгрузки (None - никогда)
+    """
+    if numpy_min_citizens is None:
+        return False
+    if numpy_min_citizens == 0:
+        return True
+    return await IMPORT_CITIZENS_COUNT_QUERY.fetchval(executor, import_id=import_id) >= numpy_min_citizens
+
+
+async def fetch_town_birth_dates(conn: SAConnection, import_id: int) -> Tuple[List[str], List[date]]:
+    """
+    Читает города и даты рождения жителей выгрузки курсором за один проход.
+
+    :param conn: объект соединения в транзакции
+    :param import_id: идентификатор выгрузки
+    :return: города и даты рождения в одинаковом порядке
+    """
+    towns, birth_dates = [], []
+    async for row in await TOWN_BIRTH_DATES_QUERY.cursor(conn, import_id=import_id):
+        towns.append(row["town"])
+        birth_dates.append(row["birth_date"])
+    return towns, birth_dates
+
+
+async def refresh_town_age_statistics_numpy(conn: SAConnection, import_id: int, current_date: date) -> List[dict]:
+    """
+    Рассчитывает статистику на стороне приложения и сохраняет ее.
+
+    Города и даты рождения читаются курсором за один проход, сортировка и
+    интерполяция выполняются в процессе приложения, а не в БД.
+
+    :param conn: объект соединения в транзакции
+    :param import_id: идентификатор выгрузки
+    :param current_date: дата, относительно которой считаются возрасты
+    :return: статистика
+    """
+    towns, birth_dates = await fetch_town_birth_dates(conn=conn, import_id=import_id)
+    stats = calculate_town_age_statistics(towns=towns, birth_dates=birth_dates, current_date=current_date)
+    await STORE_TOWN_AGE_STATS_QUERY.execute(
+        conn, import_id=import_id, current_date=current_date, stats=json.dumps(stats, ensure_ascii=False)
+    )
+    return stats
+
+
+async def get_town_age_statistics(db: PG, import_id: int, numpy_min_citizens: Optional[int] = None) -> List[dict]:
     """
     Возвращает статистику возврастов жителей по городам.
 
+    Статистика рассчитывается один раз в день для каждой выгрузки и сохраняется
+    в БД, повторные запросы читают сохраненный результат без сортировки возрастов.
+
     :param db: объект для взаимодействия с БД
     :param import_id: идентификатор выгрузки
+    :param numpy_min_citizens: минимальное количество жителей выгрузки, начиная
+        с которого статистика рассчитывается с помощью NumPy (None - всегда в БД)
     :return: статистика
     """
-    age = func.age(CURRENT_DATE, citizens_table.c.birth_date)
-    age = func.date_part("year", age)
-
-    query = (
-        select(
-            [
-                citizens_table.c.town,
-                rounded(func.percentile_cont(0.5).within_group(age)).label("p50"),
-                rounded(func.percentile_cont(0.75).within_group(age)).label("p75"),
-                rounded(func.percentile_cont(0.99).within_group(age)).label("p99"),
-            ]
-        )
-        .select_from(citizens_table)
-        .group_by(citizens_table.c.town)
-        .where(citizens_table.c.import_id == import_id)
+    current_date = get_current_date()
+    stats = await CACHED_TOWN_AGE_STATS_QUERY.fetchval(db, import_id=import_id, current_date=current_date)
+    if stats is not None:
+        return json.loads(stats)
+
+    async with db.transaction() as conn:
+        await ACQUIRE_SHARED_LOCK_QUERY.execute(conn, import_id=import_id)
+
+        if await use_numpy(conn, import_id=import_id, numpy_min_citizens=numpy_min_citizens):
+            return await refresh_town_age_statistics_numpy(conn=conn, import_id=import_id, current_date=current_date)
+
+        stats = await REFRESH_TOWN_AGE_STATS_QUERY.fetchval(conn, import_id=import_id, current_date=current_date)
+        return json.loads(stats)
+
+
+async def get_town_age_quantiles(
+    db: PG, import_id: int, quantiles: Sequence[float], numpy_min_citizens: Optional[int] = None
+) -> List[dict]:
+    """
+    Возвращает произвольные квантили возрастов жителей по городам.
+
+    В отличие от квантилей по умолчанию, результат не сохраняется.
+
+    :param db: объект для взаимодействия с БД
+    :param import_id: идентификатор выгрузки
+    :param quantiles: квантили от 0 до 1
+    :param numpy_min_citizens: минимальное количество жителей выгрузки, начиная
+        с которого квантили рассчитываются с помощью NumPy (None - всегда в БД)
+    :return: статистика
+    """
+    current_date = get_current_date()
+    if await use_numpy(db, import_id=import_id, numpy_min_citizens=numpy_min_citizens):
+        async with db.transaction() as conn:
+            towns, birth_dates = await fetch_town_birth_dates(conn=conn, import_id=import_id)
+        return [
+            make_town_age_stat(town, values, quantiles)
+            for town, values in calculate_town_age_quantiles(towns, birth_dates, current_date, quantiles)
+        ]
+
+    rows = await TOWN_AGE_QUANTILES_QUERY.fetch(
+        db, import_id=import_id, quantiles=list(quantiles), current_date=current_date
     )
+    return [
+        make_town_age_stat(row["town"], [round_percentile(value) for value in row["quantiles"]], quantiles)
+        for row in rows
+    ]
 
-    stats = await db.fetch(query)
-    return stats
+
+async def invalidate_town_age_statistics(conn: SAConnection, import_id: int) -> None:
+    """
+    Удаляет сохраненную статистику возрастов выгрузки.
+
+    Должна вызываться в транзакции, изменяющей жителей, под эксклюзивной
+    блокировкой выгрузки.
+
+    :param conn: объект соединения
+    :param import_id: идентификатор выгрузки
+    """
+    await INVALIDATE_TOWN_AGE_STATS_QUERY.execute(conn, import_id=import_id)
@@ -1,5 +1,8 @@
+from .changes import ChangeListView
 from .citizens import CitizenListView, CitizenDetailView, CitizenBirthdayView
+from .health import LiveView, ReadyView
 from .imports import ImportView
+from .metrics import MetricsView
 from .stats import TownAgeStatView
 
 VIEWS = (
@@ -8,4 +11,8 @@ VIEWS = (
     CitizenDetailView,
     CitizenBirthdayView,
     TownAgeStatView,
+    ChangeListView,
+    MetricsView,
+    LiveView,
+    ReadyView,
 )
@@ -1,34 +1,200 @@
-from aiohttp.web import View, HTTPNotFound
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Dict, Optional, Set, Union
+
+from aiohttp import hdrs
+from aiohttp.web import Request, View, HTTPNotFound, HTTPNotModified, HTTPPreconditionFailed
 from asyncpgsa import PG
-from sqlalchemy import select, exists
+from sqlalchemy import select, bindparam
 
+from analyzer.api.admission import DEFAULT_CLASS
+from analyzer.api.services.graph import RelationGraphCache
 from analyzer.db.schema import imports_table
+from analyzer.utils.db import QUERIES, ReplicaSet
+
+IMPORT_UPDATED_AT_QUERY = QUERIES.register(
+    "import_updated_at",
+    select([imports_table.c.updated_at]).where(imports_table.c.import_id == bindparam("import_id")),
+)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
 
 class BaseView(View):
     URL_PATH: str
+    # Класс конкурентности запросов (см. analyzer.api.admission.ConcurrencyClass)
+    CONCURRENCY_CLASS = DEFAULT_CLASS
 
     @property
     def db(self) -> PG:
+        """Основная БД: для изменяющих данные запросов."""
         return self.request.app["db"]
 
+    @property
+    def replicas(self) -> ReplicaSet:
+        return self.request.app["db_replicas"]
+
+    @property
+    def relation_graphs(self) -> Optional[RelationGraphCache]:
+        return self.request.app["relation_graphs"]
+
 
 class BaseImportView(BaseView):
     @property
     def import_id(self) -> int:
         return int(self.request.match_info.get("import_id"))
 
-    async def check_import_exists(self) -> None:
+    @property
+    def read_db(self) -> PG:
+        """
+        БД для читающих запросов: реплика или основная БД, если выгрузка
+        недавно изменялась этим процессом. Выбирается один раз на запрос,
+        чтобы все его запросы видели одно и то же состояние.
+        """
+        if "read_db" not in self.request:
+            self.request["read_db"] = self.replicas.reader(self.import_id)
+        return self.request["read_db"]
+
+    async def check_import_exists(self) -> datetime:
         """
         Проверяет существание выгрузки.
 
-        Если выгрузка не существует, то выбрасывает исключение.
+        Если выгрузка не существует, то выбрасывает исключение. Выгрузка,
+        не найденная в реплике, могла быть только что создана другим
+        процессом, поэтому проверяется и в основной БД, из которой в этом
+        случае читается весь запрос.
 
+        :return: время последнего изменения выгрузки
         :raises
             HTTPNotFound
         """
-        query = select([exists().where(imports_table.c.import_id == self.import_id)])
-
-        import_exists = await self.db.fetchval(query=query)
-        if not import_exists:
+        updated_at = await IMPORT_UPDATED_AT_QUERY.fetchval(self.read_db, import_id=self.import_id)
+        if updated_at is None and self.read_db is not self.db:
+            updated_at = await IMPORT_UPDATED_AT_QUERY.fetchval(self.db, import_id=self.import_id)
+            self.request["read_db"] = self.db
+        if updated_at is None:
             raise HTTPNotFound
+        return updated_at
+
+    def cache_headers(
+        self, etag: str, last_modified: Optional[datetime] = None, max_age: Optional[int] = None
+    ) -> Dict[str, str]:
+        """
+        Формирует заголовки кэширования ответа.
+
+        Если версия ответа, сохраненная у клиента или в прокси, актуальна
+        (If-None-Match или If-Modified-Since), то выбрасывает исключение,
+        и ответ не формируется.
+
+        :param etag: ETag ответа
+        :param last_modified: время последнего изменения данных ответа
+        :param max_age: время в секундах, в течение которого ответ можно
+            отдавать из кэша без проверки (по умолчанию --http-cache-max-age)
+        :return: заголовки ответа
+        :raises
+            HTTPNotModified
+        """
+        if max_age is None:
+            max_age = self.request.app["http_cache_max_age"]
+
+        headers = {
+            hdrs.ETAG: etag,
+            hdrs.CACHE_CONTROL: "public, max-age={0}".format(max_age) if max_age > 0 else "public, no-cache",
+        }
+        if last_modified is not None:
+            headers[hdrs.LAST_MODIFIED] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+
+        if is_not_modified(self.request, etag=etag, last_modified=last_modified):
+            raise HTTPNotModified(headers=headers)
+        return headers
+
+    def import_cache_headers(self, updated_at: datetime) -> Dict[str, str]:
+        """Заголовки кэширования ответа, который зависит только от данных выгрузки."""
+        return self.cache_headers(etag=make_etag(import_version(updated_at)), last_modified=updated_at)
+
+    def mark_written(self) -> None:
+        """Направляет чтение выгрузки в основную БД, пока изменения не дойдут до реплик."""
+        self.replicas.mark_written(self.import_id)
+
+    def invalidate_relation_graph(self) -> None:
+        """Удаляет из кэша граф родственных связей выгрузки после ее изменения."""
+        if self.relation_graphs is not None:
+            self.relation_graphs.invalidate(self.import_id)
+
+
+def make_etag(version: Union[int, str]) -> str:
+    """
+    Формирует значение заголовка ETag по версии ресурса.
+
+    :param version: версия ресурса
+    :return: строгий ETag
+    """
+    return '"{0}"'.format(version)
+
+
+def import_version(updated_at: datetime) -> int:
+    """Версия выгрузки - время ее последнего изменения в микросекундах."""
+    return (updated_at - EPOCH) // timedelta(microseconds=1)
+
+
+def parse_etags(value: str) -> Set[str]:
+    """
+    Извлекает ETag из заголовка If-None-Match.
+
+    Слабые ETag (W/) сравниваются как сильные: для If-None-Match
+    используется слабое сравнение.
+    """
+    etags = set()
+    for etag in value.split(","):
+        etag = etag.strip()
+        if etag.startswith("W/"):
+            etag = etag[2:]
+        etags.add(etag)
+    return etags
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    Проверяет, актуальна ли версия ответа, сохраненная у клиента.
+
+    If-Modified-Since учитывается, только если If-None-Match не передан.
+    Last-Modified содержит время изменения с точностью до секунды, а выгрузка
+    может измениться несколько раз за секунду, поэтому время изменения
+    сравнивается точно: ответ, время изменения которого не кратно секунде,
+    подтверждается только по ETag.
+    """
+    if_none_match = request.headers.get(hdrs.IF_NONE_MATCH)
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        return "*" in etags or etag in etags
+
+    if_modified_since = request.if_modified_since
+    if last_modified is None or if_modified_since is None:
+        return False
+    return last_modified <= if_modified_since
+
+
+def parse_if_match(value: Optional[str]) -> Optional[int]:
+    """
+    Извлекает ожидаемую версию ресурса из заголовка If-Match.
+
+    Отсутствие заголовка и значение "*" означают безусловное обновление.
+    If-Match требует строгого сравнения (RFC 7232, 3.1): слабый ETag (W/"...")
+    не совпадает ни с одной версией. Если значение не является строгим ETag,
+    выданным сервисом, то выбрасывает исключение.
+
+    :param value: значение заголовка If-Match
+    :return: ожидаемая версия ресурса
+    :raises
+        HTTPPreconditionFailed
+    """
+    if value is None or value.strip() == "*":
+        return None
+
+    etag = value.strip()
+    if len(etag) < 2 or etag[0] != '"' or etag[-1] != '"':
+        raise HTTPPreconditionFailed
+    try:
+        return int(etag[1:-1])
+    except ValueError:
+        raise HTTPPreconditionFailed
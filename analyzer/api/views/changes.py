@@ -0,0 +1,29 @@
+from http import HTTPStatus
+
+from aiohttp.web import Response
+from aiohttp_apispec import docs, querystring_schema, response_schema
+
+from analyzer.api.admission import BULK_CLASS
+from analyzer.api.schema import ChangesQuerySchema, ChangeListResponseSchema
+from analyzer.api.services.changes import iter_changes
+from analyzer.api.views.base import BaseImportView
+
+
+class ChangeListView(BaseImportView):
+    URL_PATH = r"/imports/{import_id:\d+}/changes"
+    CONCURRENCY_CLASS = BULK_CLASS
+
+    @docs(summary="Отобразить изменения жителей указанной выгрузки")
+    @querystring_schema(schema=ChangesQuerySchema)
+    @response_schema(schema=ChangeListResponseSchema, code=HTTPStatus.OK.value)
+    async def get(self) -> Response:
+        """
+        Возвращает изменения жителей с номером больше переданного в параметре since.
+
+        Изменения отдаются в порядке возрастания номера, поэтому номер последнего
+        полученного изменения можно использовать как since в следующем запросе.
+        Как и список жителей, ответ формируется "на ходу".
+        """
+        headers = self.import_cache_headers(await self.check_import_exists())
+        changes = iter_changes(db=self.read_db, import_id=self.import_id, since=self.request["querystring"]["since"])
+        return Response(body=changes, status=HTTPStatus.OK.value, headers=headers)
@@ -1,24 +1,33 @@
 from http import HTTPStatus
 
-from aiohttp.web import Response
-from aiohttp_apispec import request_schema, docs, response_schema
+from aiohttp import hdrs
+from aiohttp.web import HTTPNotFound, Response
+from aiohttp_apispec import request_schema, docs, querystring_schema, response_schema
 
+from analyzer.api.admission import BULK_CLASS
 from analyzer.api.schema import (
+    CitizenResponseSchema,
     PatchCitizenRequestSchema,
     PatchCitizenResponseSchema,
+    PatchCitizensRequestSchema,
+    PatchCitizensResponseSchema,
+    CitizenBirthdaysQuerySchema,
     CitizenPresentsResponseSchema,
     CitizenListResponseSchema,
 )
 from analyzer.api.services.citizens import (
     get_citizens_cursor,
+    get_citizen_with_version,
     partially_update_citizen,
+    partially_update_citizens,
     get_citizen_birthdays_by_months,
 )
-from analyzer.api.views.base import BaseImportView
+from analyzer.api.views.base import BaseImportView, make_etag, parse_if_match
 
 
 class CitizenListView(BaseImportView):
     URL_PATH = r"/imports/{import_id:\d+}/citizens"
+    CONCURRENCY_CLASS = BULK_CLASS
 
     @docs(summary="Отобразить информацию о всех жителях для указанной выборки")
     @response_schema(schema=CitizenListResponseSchema, code=HTTPStatus.OK.value)
@@ -32,10 +41,32 @@ class CitizenListView(BaseImportView):
         Этот подход позволяет не выделять память на весь объем данных при каждом запросе,
         но у него есть особенность: приложение не сможет вернуть клиенту соответствующий HTTP-статус,
         если возникнет ошибка (ведь клиенту уже был отправлен HTTP-статус, заголовки, и пишутся данные).
+
+        ETag и Last-Modified ответа определяются временем изменения выгрузки:
+        если версия ответа у клиента актуальна, возвращается 304 Not Modified.
+        """
+        headers = self.import_cache_headers(await self.check_import_exists())
+        cursor = get_citizens_cursor(db=self.read_db, import_id=self.import_id)
+        return Response(body=cursor, status=HTTPStatus.OK.value, headers=headers)
+
+    @docs(summary="Обновить нескольких жителей в указанной выгрузке")
+    @request_schema(schema=PatchCitizensRequestSchema)
+    @response_schema(schema=PatchCitizensResponseSchema, code=HTTPStatus.OK.value)
+    async def patch(self) -> Response:
+        """
+        Частичное обновление нескольких жителей указанной выгрузки.
+
+        Все изменения применяются в одной транзакции: если хотя бы один житель
+        не найден или изменение не прошло валидацию, ни одно из них не сохраняется.
         """
-        await self.check_import_exists()
-        cursor = get_citizens_cursor(db=self.db, import_id=self.import_id)
-        return Response(body=cursor, status=HTTPStatus.OK.value)
+        updated_citizens = await partially_update_citizens(
+            db=self.db,
+            import_id=self.import_id,
+            updates=self.request["data"]["citizens"],
+        )
+        self.mark_written()
+        self.invalidate_relation_graph()
+        return Response(body={"data": updated_citizens}, status=HTTPStatus.OK.value)
 
 
 class CitizenDetailView(BaseImportView):
@@ -45,18 +76,53 @@ class CitizenDetailView(BaseImportView):
     def citizen_id(self) -> int:
         return int(self.request.match_info.get("citizen_id"))
 
+    @docs(summary="Отобразить информацию об указанном жителе в указанной выгрузке")
+    @response_schema(schema=CitizenResponseSchema, code=HTTPStatus.OK.value)
+    async def get(self) -> Response:
+        """
+        Возвращает информацию о жителе.
+
+        Текущая версия жителя передается в заголовке ETag, ее можно указать
+        в заголовке If-Match при последующем обновлении жителя, а также в
+        If-None-Match, чтобы получить 304 Not Modified, если житель не изменился.
+        """
+        try:
+            citizen, version = await get_citizen_with_version(
+                db=self.read_db, import_id=self.import_id, citizen_id=self.citizen_id
+            )
+        except HTTPNotFound:
+            # Жители появляются только с новыми выгрузками: выгрузка могла быть
+            # создана другим процессом и еще не дойти до реплики
+            if self.read_db is self.db:
+                raise
+            citizen, version = await get_citizen_with_version(
+                db=self.db, import_id=self.import_id, citizen_id=self.citizen_id
+            )
+        headers = self.cache_headers(etag=make_etag(version))
+        return Response(body={"data": citizen}, status=HTTPStatus.OK.value, headers=headers)
+
     @docs(summary="Обновить указанного жителя в указанной выгрузке")
     @request_schema(schema=PatchCitizenRequestSchema)
     @response_schema(schema=PatchCitizenResponseSchema, code=HTTPStatus.OK.value)
     async def patch(self) -> Response:
-        """Частичное обновление жителя указанной выгрузки."""
-        updated_citizen = await partially_update_citizen(
+        """
+        Частичное обновление жителя указанной выгрузки.
+
+        Если передан заголовок If-Match, то житель обновляется только при совпадении
+        его текущей версии, иначе возвращается 412 Precondition Failed.
+        """
+        updated_citizen, version = await partially_update_citizen(
             db=self.db,
             import_id=self.import_id,
             citizen_id=self.citizen_id,
             updated_data=self.request["data"],
+            version=parse_if_match(self.request.headers.get(hdrs.IF_MATCH)),
+        )
+        self.mark_written()
+        self.invalidate_relation_graph()
+        return Response(
+            body={"data": updated_citizen}, status=HTTPStatus.OK.value, headers={hdrs.ETAG: make_etag(version)}
         )
-        return Response(body={"data": updated_citizen}, status=HTTPStatus.OK.value)
 
 
 class CitizenBirthdayView(BaseImportView):
@@ -66,9 +132,15 @@ class CitizenBirthdayView(BaseImportView):
         summary="Возвращает жителей и количество подарков, "
         "которые они будут покупать своим близжашим родственникам, сгруппированных по месяцам"
     )
+    @querystring_schema(schema=CitizenBirthdaysQuerySchema)
     @response_schema(schema=CitizenPresentsResponseSchema, code=HTTPStatus.OK.value)
     async def get(self) -> Response:
-        await self.check_import_exists()
+        headers = self.import_cache_headers(await self.check_import_exists())
 
-        result = await get_citizen_birthdays_by_months(db=self.db, import_id=self.import_id)
-        return Response(body={"data": result}, status=HTTPStatus.OK.value)
+        result = await get_citizen_birthdays_by_months(
+            db=self.read_db,
+            import_id=self.import_id,
+            month=self.request["querystring"].get("month"),
+            graphs=self.relation_graphs,
+        )
+        return Response(body={"data": result}, status=HTTPStatus.OK.value, headers=headers)
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+
+from aiohttp.web import HTTPServiceUnavailable, Response
+from aiohttp_apispec import docs
+from asyncpg import PostgresError
+
+from analyzer.api.views.base import BaseView
+
+log = logging.getLogger(__name__)
+
+# Время, за которое основная БД должна ответить на проверку готовности, в секундах
+DB_CHECK_TIMEOUT = 1
+
+
+class LiveView(BaseView):
+    URL_PATH = "/health/live"
+    SKIP_ADMISSION = True
+
+    @docs(summary="Проверка, что процесс работает и обрабатывает запросы")
+    async def get(self) -> Response:
+        return Response(body={"status": "ok"})
+
+
+class ReadyView(BaseView):
+    URL_PATH = "/health/ready"
+    SKIP_ADMISSION = True
+
+    @docs(
+        summary="Проверка готовности процесса принимать запросы",
+        description=(
+            "Возвращает 503, если процесс перегружен (запросы, кроме проверок здоровья "
+            "и метрик, отклоняются), останавливается или основная БД недоступна."
+        ),
+    )
+    async def get(self) -> Response:
+        if self.request.app["drainer"].draining:
+            raise HTTPServiceUnavailable(text="Server is shutting down")
+
+        admission = self.request.app["admission"]
+        reason = admission.overload_reason(self.request)
+        if reason is not None:
+            raise admission.unavailable(reason)
+
+        try:
+            await asyncio.wait_for(self.db.fetchval("SELECT 1"), timeout=DB_CHECK_TIMEOUT)
+        except (asyncio.TimeoutError, OSError, PostgresError):
+            log.warning("Database is unavailable", exc_info=True)
+            raise HTTPServiceUnavailable(text="Database is unavailable")
+
+        return Response(body={"status": "ok"})
@@ -1,8 +1,11 @@
+import time
 from http import HTTPStatus
 
 from aiohttp.web import Response
 from aiohttp_apispec import request_schema, docs, response_schema
 
+from analyzer.api.admission import IMPORT_CLASS
+from analyzer.api.metrics import IMPORT_CITIZENS, IMPORT_SECONDS
 from analyzer.api.schema import ImportRequestSchema, ImportResponseSchema
 from analyzer.api.services.imports import create_import
 from analyzer.api.views.base import BaseView
@@ -10,10 +13,16 @@ from analyzer.api.views.base import BaseView
 
 class ImportView(BaseView):
     URL_PATH = "/imports"
+    CONCURRENCY_CLASS = IMPORT_CLASS
 
     @docs(summary="Добавить выгрузку с информацией о житилях")
     @request_schema(schema=ImportRequestSchema)
     @response_schema(schema=ImportResponseSchema, code=HTTPStatus.CREATED.value)
     async def post(self) -> Response:
-        import_id = await create_import(db=self.db, citizens=self.request["data"]["citizens"])
+        citizens = self.request["data"]["citizens"]
+        started = time.monotonic()
+        import_id = await create_import(db=self.db, citizens=citizens)
+        IMPORT_SECONDS.observe(time.monotonic() - started)
+        IMPORT_CITIZENS.observe(len(citizens))
+        self.replicas.mark_written(import_id)
         return Response(body={"data": {"import_id": import_id}}, status=HTTPStatus.CREATED.value)
@@ -0,0 +1,14 @@
+from aiohttp.web import Response
+from aiohttp_apispec import docs
+
+from analyzer.api.views.base import BaseView
+from analyzer.utils.metrics import CONTENT_TYPE, REGISTRY
+
+
+class MetricsView(BaseView):
+    URL_PATH = "/metrics"
+    SKIP_ADMISSION = True
+
+    @docs(summary="Метрики процесса в текстовом формате Prometheus")
+    async def get(self) -> Response:
+        return Response(body=REGISTRY.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
@@ -0,0 +1,33 @@
+import asyncio
+
+from aiohttp.web import HTTPForbidden, HTTPNotFound, Response
+from aiohttp_apispec import docs
+
+from analyzer.api.profiling import Profiler
+from analyzer.api.views.base import BaseView
+
+
+class ProfileView(BaseView):
+    """
+    Профиль запроса в формате collapsed (folded) для построения flamegraph.
+
+    Регистрируется, только если профилирование включено.
+    """
+
+    URL_PATH = r"/profiles/{profile_id:[0-9a-f]{32}}"
+
+    @property
+    def profiler(self) -> Profiler:
+        return self.request.app["profiler"]
+
+    @docs(summary="Профиль запроса (требует заголовок X-Profile)")
+    async def get(self) -> Response:
+        if not self.profiler.is_authorized(self.request):
+            raise HTTPForbidden
+
+        profile = await asyncio.get_event_loop().run_in_executor(
+            None, self.profiler.load, self.request.match_info["profile_id"]
+        )
+        if profile is None:
+            raise HTTPNotFound
+        return Response(text=profile, content_type="text/plain")
@@ -1,20 +1,69 @@
+from datetime import datetime, time, timedelta, timezone
 from http import HTTPStatus
+from typing import Dict
 
 from aiohttp.web import Response
-from aiohttp_apispec import docs, response_schema
+from aiohttp_apispec import docs, querystring_schema, response_schema
 
-from analyzer.api.schema import TownAgeStatResponseSchema
-from analyzer.api.services.stats import get_town_age_statistics
-from analyzer.api.views.base import BaseImportView
+from analyzer.api.schema import TownAgeStatQuerySchema, TownAgeStatResponseSchema
+from analyzer.api.services.sketches import get_town_age_quantiles_approximate
+from analyzer.api.services.stats import get_current_date, get_town_age_quantiles, get_town_age_statistics
+from analyzer.api.views.base import BaseImportView, import_version, make_etag
 
 
 class TownAgeStatView(BaseImportView):
     URL_PATH = r"/imports/{import_id:\d+}/towns/stat/percentile/age"
 
-    @docs(summary="Статистика возрастов жителей по городам")
+    @docs(
+        summary="Статистика возрастов жителей по городам",
+        description=(
+            "По умолчанию возвращает перцентили p50, p75 и p99. Если указаны квантили q "
+            "(через запятую, от 0 до 1), для каждого города возвращается объект quantiles "
+            "(формат TownAgeQuantilesResponseSchema). С approximate=true квантили "
+            "оцениваются по сохраненным распределениям (t-digest) в целых годах."
+        ),
+    )
+    @querystring_schema(schema=TownAgeStatQuerySchema)
     @response_schema(schema=TownAgeStatResponseSchema, code=HTTPStatus.OK.value)
     async def get(self) -> Response:
-        await self.check_import_exists()
+        # Статистика рассчитывается в основной БД: рассчитанные значения и
+        # распределения сохраняются для последующих запросов. Время изменения
+        # выгрузки для заголовков кэширования читается оттуда же
+        self.request["read_db"] = self.db
+        headers = self.stats_cache_headers(await self.check_import_exists())
 
-        stat = await get_town_age_statistics(db=self.db, import_id=self.import_id)
-        return Response(body={"data": stat}, status=HTTPStatus.OK.value)
+        query = self.request["querystring"]
+        quantiles = query.get("q")
+        if query["approximate"]:
+            stat = await get_town_age_quantiles_approximate(db=self.db, import_id=self.import_id, quantiles=quantiles)
+        elif quantiles is not None:
+            stat = await get_town_age_quantiles(
+                db=self.db,
+                import_id=self.import_id,
+                quantiles=quantiles,
+                numpy_min_citizens=self.request.app["stats_numpy_min_citizens"],
+            )
+        else:
+            stat = await get_town_age_statistics(
+                db=self.db,
+                import_id=self.import_id,
+                numpy_min_citizens=self.request.app["stats_numpy_min_citizens"],
+            )
+        return Response(body={"data": stat}, status=HTTPStatus.OK.value, headers=headers)
+
+    def stats_cache_headers(self, updated_at: datetime) -> Dict[str, str]:
+        """
+        Заголовки кэширования статистики: возрасты зависят и от текущей даты
+        (по UTC), поэтому ответ меняется в полночь, даже если выгрузка
+        не изменялась.
+        """
+        current_date = get_current_date()
+        day_start = datetime.combine(current_date, time(), tzinfo=timezone.utc)
+        seconds_left = int((day_start + timedelta(days=1) - datetime.now(tz=timezone.utc)).total_seconds())
+
+        max_age = self.request.app["http_cache_max_age"]
+        return self.cache_headers(
+            etag=make_etag("{0}-{1}".format(import_version(updated_at), current_date.isoformat())),
+            last_modified=max(updated_at, day_start),
+            max_age=min(max_age, seconds_left) if max_age > 0 else 0,
+        )
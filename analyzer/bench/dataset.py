@@ -0,0 +1,154 @@
+import math
+import random
+from bisect import bisect
+from datetime import date, timedelta
+from itertools import accumulate
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from analyzer.utils.consts import DATE_FORMAT
+
+TOWN_DISTRIBUTIONS = ("uniform", "zipf")
+AGE_DISTRIBUTIONS = ("uniform", "normal")
+
+# Показатель степени распределения Ципфа: население k-го по величине города
+# пропорционально 1 / k ** ZIPF_EXPONENT
+ZIPF_EXPONENT = 1.07
+
+FEMALE_NAMES = ("Анна", "Мария", "Елена", "Ольга", "Наталья", "Татьяна", "Ирина", "Екатерина", "Светлана", "Дарья")
+MALE_NAMES = ("Александр", "Сергей", "Дмитрий", "Андрей", "Алексей", "Иван", "Михаил", "Павел", "Николай", "Артем")
+SURNAMES = ("Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов", "Новиков", "Федоров")
+STREETS = ("Ленина", "Советская", "Мира", "Садовая", "Лесная", "Школьная", "Новая", "Набережная", "Заречная", "Полевая")
+
+
+def make_town_sampler(rng: random.Random, towns: int, distribution: str) -> Callable[[], str]:
+    """
+    :param rng: генератор случайных чисел
+    :param towns: количество городов
+    :param distribution: uniform - города одинакового размера, zipf - несколько
+        крупных городов и много мелких
+    """
+    names = ["Город {0}".format(number) for number in range(1, towns + 1)]
+    if distribution == "uniform":
+        return lambda: names[rng.randrange(towns)]
+
+    cum_weights = list(accumulate(1 / rank**ZIPF_EXPONENT for rank in range(1, towns + 1)))
+    total = cum_weights[-1]
+    return lambda: names[min(bisect(cum_weights, rng.random() * total), towns - 1)]
+
+
+def make_age_sampler(
+    rng: random.Random, distribution: str, max_age: int, mean_age: float, age_stddev: float
+) -> Callable[[], int]:
+    """
+    Возвращает функцию, генерирующую возраст жителя в днях.
+
+    :param rng: генератор случайных чисел
+    :param distribution: uniform - от 0 до max_age лет, normal - нормальное
+        распределение со средним mean_age, усеченное до [0, max_age]
+    """
+    max_days = max_age * 365
+    if distribution == "uniform":
+        return lambda: rng.randint(0, max_days)
+
+    def sample() -> int:
+        while True:
+            days = int(rng.gauss(mean_age, age_stddev) * 365)
+            if 0 <= days <= max_days:
+                return days
+
+    return sample
+
+
+def poisson(rng: random.Random, mean: float) -> int:
+    """Случайное число из распределения Пуассона."""
+    if mean > 30:
+        # Алгоритм Кнута линеен по mean, большие значения приближаются нормальным распределением
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+
+    limit, k, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        k += 1
+        product *= rng.random()
+    return k
+
+
+def iter_citizens(
+    count: int,
+    relations: float,
+    towns: int,
+    seed: int,
+    town_distribution: str = "uniform",
+    age_distribution: str = "uniform",
+    max_age: int = 80,
+    mean_age: float = 40,
+    age_stddev: float = 20,
+    window: int = 100,
+    current_date: Optional[date] = None,
+) -> Iterator[dict]:
+    """
+    Генерирует выгрузку жителей со случайными родственными связями.
+
+    Жители генерируются по одному, память не зависит от размера выгрузки:
+    родственниками могут быть только жители, номера которых отличаются
+    не больше чем на window (как члены одной семьи). Связи с жителями,
+    которые еще не сгенерированы, запоминаются до их генерации, поэтому
+    связи всегда симметричны. Количество родственников жителя распределено
+    по Пуассону со средним relations (кроме жителей в конце выгрузки).
+
+    Одинаковые параметры и seed дают одинаковую выгрузку, что позволяет
+    сравнивать результаты бенчмарков между коммитами.
+
+    :param count: количество жителей
+    :param relations: среднее количество родственников у жителя
+    :param towns: количество городов
+    :param seed: начальное значение генератора случайных чисел
+    :param town_distribution: распределение жителей по городам
+    :param age_distribution: распределение возрастов жителей
+    :param max_age: максимальный возраст жителя в годах
+    :param mean_age: средний возраст для нормального распределения
+    :param age_stddev: стандартное отклонение возраста для нормального распределения
+    :param window: максимальная разница номеров родственников
+    :param current_date: дата, от которой отсчитываются возрасты (по умолчанию - сегодня)
+    :return: итератор жителей в формате запроса POST /imports
+    """
+    rng = random.Random(seed)
+    current_date = current_date or date.today()
+    sample_town = make_town_sampler(rng, towns=towns, distribution=town_distribution)
+    sample_age = make_age_sampler(
+        rng, distribution=age_distribution, max_age=max_age, mean_age=mean_age, age_stddev=age_stddev
+    )
+
+    # Родственники еще не сгенерированных жителей
+    pending: Dict[int, Set[int]] = {}
+    for citizen_id in range(1, count + 1):
+        relatives = pending.pop(citizen_id, set())
+
+        # Половина связей жителя создается им самим, половина - предыдущими жителями
+        last_id = min(citizen_id + window, count)
+        new_relatives = min(poisson(rng, relations / 2), last_id - citizen_id)
+        for relative_id in rng.sample(range(citizen_id + 1, last_id + 1), new_relatives):
+            relatives.add(relative_id)
+            pending.setdefault(relative_id, set()).add(citizen_id)
+
+        gender = rng.choice(("male", "female"))
+        if gender == "male":
+            name = "{0} {1}".format(rng.choice(SURNAMES), rng.choice(MALE_NAMES))
+        else:
+            name = "{0}а {1}".format(rng.choice(SURNAMES), rng.choice(FEMALE_NAMES))
+
+        yield {
+            "citizen_id": citizen_id,
+            "town": sample_town(),
+            "street": rng.choice(STREETS),
+            "building": str(rng.randint(1, 200)),
+            "apartment": rng.randint(1, 500),
+            "name": name,
+            "birth_date": (current_date - timedelta(days=sample_age())).strftime(DATE_FORMAT),
+            "gender": gender,
+            "relatives": sorted(relatives),
+        }
+
+
+def generate_citizens(count: int, relations: float, towns: int, seed: int) -> List[dict]:
+    """Генерирует выгрузку целиком (см. iter_citizens)."""
+    return list(iter_citizens(count=count, relations=relations, towns=towns, seed=seed))
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from aiohttp import ClientError, ClientSession
+from yarl import URL
+
+# Интервал между замерами памяти сервера в секундах
+RSS_INTERVAL = 0.1
+
+
+def read_rss(pid: int) -> Optional[int]:
+    """
+    Возвращает RSS процесса и всех его потомков (воркеров, запущенных с
+    --workers) в байтах или None, если /proc недоступен.
+
+    :param pid: идентификатор процесса сервера
+    """
+    try:
+        with open("/proc/{0}/status".format(pid)) as file:
+            rss = next(int(line.split()[1]) * 1024 for line in file if line.startswith("VmRSS:"))
+
+        children = []
+        for task in os.listdir("/proc/{0}/task".format(pid)):
+            with open("/proc/{0}/task/{1}/children".format(pid, task)) as file:
+                children.extend(int(child) for child in file.read().split())
+    except (OSError, StopIteration):
+        return None
+
+    for child in children:
+        rss += read_rss(child) or 0
+    return rss
+
+
+class RssSampler:
+    """Периодически замеряет память сервера во время сценария."""
+
+    def __init__(self, pid: Optional[int]) -> None:
+        self.pid = pid
+        self.before: Optional[int] = None
+        self.peak: Optional[int] = None
+        self.after: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _sample(self) -> Optional[int]:
+        rss = read_rss(self.pid)
+        if rss is not None:
+            self.peak = max(self.peak or 0, rss)
+        return rss
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(RSS_INTERVAL)
+            self._sample()
+
+    async def __aenter__(self) -> "RssSampler":
+        if self.pid is not None:
+            self.before = self._sample()
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self.after = self._sample()
+
+    def result(self) -> Optional[Dict[str, Optional[int]]]:
+        if self.pid is None:
+            return None
+        return {"before": self.before, "peak": self.peak, "after": self.after}
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+
+async def measure(request: Callable[[int], Awaitable[bytes]], requests: int, concurrency: int) -> dict:
+    """
+    Выполняет запросы с заданной конкурентностью.
+
+    :param request: корутинная функция, выполняющая запрос с указанным номером
+        и возвращающая тело ответа
+    :param requests: общее количество запросов
+    :param concurrency: количество одновременно выполняемых запросов
+    :return: пропускная способность, задержки и количество ошибок;
+        throughput_rps учитывает только успешные запросы (отклоненные с 503
+        при перегрузке завершаются быстро и завысили бы ее), attempted_rps -
+        все выполненные запросы
+    """
+    latencies, errors, received = [], 0, 0
+    numbers = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors, received
+        for number in numbers:
+            started = time.perf_counter()
+            try:
+                received += len(await request(number))
+            except (ClientError, asyncio.TimeoutError):
+                errors += 1
+                continue
+            latencies.append(round((time.perf_counter() - started) * 1000, 3))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round((requests - errors) / elapsed, 2),
+        "attempted_rps": round(requests / elapsed, 2),
+        "received_bytes": received,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None,
+        },
+    }
+
+
+class Benchmark:
+    """
+    Сценарии нагрузки на запущенный сервер.
+
+    Все сценарии работают с одной выгрузкой, которую создает сценарий import
+    (последняя из загруженных), поэтому он выполняется первым.
+    """
+
+    def __init__(self, session: ClientSession, api_url: URL, concurrency: int, seed: int) -> None:
+        self.session = session
+        self.api_url = api_url
+        self.concurrency = concurrency
+        self.rng = random.Random(seed)
+        self.citizens: List[dict] = []
+        self.import_id: Optional[int] = None
+
+    def url(self, path: str) -> URL:
+        return self.api_url.with_path(path)
+
+    async def request(self, method: str, path: str, **kwargs) -> bytes:
+        async with self.session.request(method, self.url(path), **kwargs) as response:
+            body = await response.read()
+            # Ответ с ошибкой (ClientResponseError) учитывается measure как ошибка
+            response.raise_for_status()
+            return body
+
+    async def run_import(self, citizens: List[dict], repeats: int) -> dict:
+        """Последовательно загружает выгрузку repeats раз."""
+        self.citizens = citizens
+        body = json.dumps({"citizens": citizens}).encode()
+        headers = {"Content-Type": "application/json"}
+
+        async def request(number: int) -> bytes:
+            response = await self.request("POST", "/imports", data=body, headers=headers)
+            # Остальные сценарии используют последнюю загруженную выгрузку
+            self.import_id = json.loads(response)["data"]["import_id"]
+            return response
+
+        result = await measure(request, requests=repeats, concurrency=1)
+        result["citizens"] = len(citizens)
+        result["relations"] = sum(len(citizen["relatives"]) for citizen in citizens) // 2
+        return result
+
+    async def run_get(self, path: str, requests: int) -> dict:
+        path = path.format(import_id=self.import_id)
+        return await measure(lambda number: self.request("GET", path), requests, self.concurrency)
+
+    async def run_list(self, requests: int) -> dict:
+        return await self.run_get("/imports/{import_id}/citizens", requests)
+
+    async def run_birthdays(self, requests: int) -> dict:
+        return await self.run_get("/imports/{import_id}/citizens/birthdays", requests)
+
+    async def run_stats(self, requests: int) -> dict:
+        return await self.run_get("/imports/{import_id}/towns/stat/percentile/age", requests)
+
+    async def run_patch(self, requests: int, hot_citizens: int) -> dict:
+        """
+        Конкурентно изменяет родственников нескольких "горячих" жителей (как в
+        тесте test_race_condition): запросы конкурируют за блокировку выгрузки.
+        """
+        hot = [citizen["citizen_id"] for citizen in self.citizens[: max(2, hot_citizens)]]
+        patches = []
+        for _ in range(requests):
+            citizen_id, relative_id = self.rng.sample(hot, 2)
+            patches.append((citizen_id, {"relatives": [relative_id]}))
+
+        async def request(number: int) -> bytes:
+            citizen_id, data = patches[number]
+            path = "/imports/{0}/citizens/{1}".format(self.import_id, citizen_id)
+            return await self.request("PATCH", path, json=data)
+
+        return await measure(request, requests, self.concurrency)
@@ -0,0 +1,32 @@
+"""Citizen birth month index
+
+Revision ID: b7e91d3f5a20
+Revises: 8d2a4c6e1f03
+Create Date: 2026-10-19 13:41:52.390117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b7e91d3f5a20"
+down_revision = "8d2a4c6e1f03"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix__citizens__import_id_birth_month",
+        "citizens",
+        [
+            "import_id",
+            sa.text("CAST(date_part('month', CAST(birth_date AS TIMESTAMP WITHOUT TIME ZONE)) AS INTEGER)"),
+        ],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix__citizens__import_id_birth_month", table_name="citizens")
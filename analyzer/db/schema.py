@@ -5,12 +5,19 @@ from sqlalchemy import (
     Column,
     Table,
     Integer,
+    BigInteger,
     String,
     Date,
+    DateTime,
     Enum as PgEnum,
     ForeignKey,
     ForeignKeyConstraint,
+    Index,
+    cast,
+    func,
+    literal_column,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 
 convention = {
     "all_column_names": lambda constraint, table: "_".join([column.name for column in constraint.columns.values()]),
@@ -35,7 +42,14 @@ class Gender(Enum):
     female = "female"
 
 
-imports_table = Table("imports", metadata, Column("import_id", Integer, primary_key=True))
+# Время последнего изменения выгрузки (создания или изменения жителей) - по нему
+# формируются заголовки ETag и Last-Modified ответов на GET-запросы к выгрузке
+imports_table = Table(
+    "imports",
+    metadata,
+    Column("import_id", Integer, primary_key=True),
+    Column("updated_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+)
 
 citizens_table = Table(
     "citizens",
@@ -49,8 +63,21 @@ citizens_table = Table(
     Column("building", String, nullable=False),
     Column("apartment", Integer, nullable=False),
     Column("gender", PgEnum(Gender, name="gender"), nullable=False),
+    # Версия жителя для условных (If-Match) обновлений, увеличивается при
+    # каждом изменении жителя, в том числе его родственных связей
+    Column("version", Integer, nullable=False, server_default="1"),
+)
+
+# Месяц рождения жителя. Дата явно приводится к timestamp without time zone,
+# иначе Postgres выберет date_part для timestamptz, который зависит от часового
+# пояса и не может использоваться в индексе. Название поля передается литералом,
+# а не параметром, чтобы выражение в запросах совпадало с выражением индекса.
+citizen_birth_month = cast(
+    func.date_part(literal_column("'month'"), cast(citizens_table.c.birth_date, DateTime)), Integer
 )
 
+Index("ix__citizens__import_id_birth_month", citizens_table.c.import_id, citizen_birth_month)
+
 relations_table = Table(
     "relations",
     metadata,
@@ -60,3 +87,37 @@ relations_table = Table(
     ForeignKeyConstraint(("import_id", "citizen_id"), ("citizens.import_id", "citizens.citizen_id")),
     ForeignKeyConstraint(("import_id", "relative_id"), ("citizens.import_id", "citizens.citizen_id")),
 )
+
+# Журнал изменений жителей: каждое обновление жителя добавляет сюда строку
+# в той же транзакции, что позволяет потребителям получать только новые изменения
+citizen_changes_table = Table(
+    "citizen_changes",
+    metadata,
+    Column("seq", BigInteger, primary_key=True),
+    Column("import_id", Integer, ForeignKey("imports.import_id"), nullable=False),
+    Column("citizen_id", Integer, nullable=False),
+    Column("changes", JSONB, nullable=False),
+    Index(None, "import_id", "seq"),
+)
+
+# Статистика возрастов жителей выгрузки по городам. Возрасты меняются только
+# со сменой даты, поэтому статистика действительна в течение дня stats_date
+# (по UTC), пока не изменятся даты рождения или города жителей.
+town_age_stats_table = Table(
+    "town_age_stats",
+    metadata,
+    Column("import_id", Integer, ForeignKey("imports.import_id"), primary_key=True),
+    Column("stats_date", Date, nullable=False),
+    Column("stats", JSONB, nullable=False),
+)
+
+# Сжатые распределения (t-digest) дат рождения жителей выгрузки по городам для
+# приближенного расчета квантилей возрастов. Пустое значение sketch означает,
+# что распределение города устарело и должно быть перестроено.
+town_age_sketches_table = Table(
+    "town_age_sketches",
+    metadata,
+    Column("import_id", Integer, ForeignKey("imports.import_id"), primary_key=True),
+    Column("town", String, primary_key=True),
+    Column("sketch", JSONB, nullable=True),
+)
@@ -0,0 +1,115 @@
+"""
+Генератор синтетических выгрузок жителей.
+
+Пишет тело запроса POST /imports в файл или stdout по мере генерации,
+поэтому выгрузки в миллионы жителей не требуют памяти пропорционально
+размеру. Одинаковые параметры и --seed дают одинаковый результат: даты
+рождения отсчитываются от --current-date, которая по умолчанию фиксирована.
+
+Пример:
+    analyzer-gen --citizens 10000 --town-distribution zipf --output import.json
+    curl -X POST -H 'Content-Type: application/json' -d @import.json http://localhost:8081/imports
+"""
+import json
+import os
+import sys
+from datetime import datetime
+from typing import TextIO
+
+from configargparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from analyzer.bench.dataset import AGE_DISTRIBUTIONS, TOWN_DISTRIBUTIONS, iter_citizens
+from analyzer.utils.consts import DATE_FORMAT
+
+# Дата, от которой по умолчанию отсчитываются возрасты: с датой "сегодня"
+# одинаковые параметры давали бы разные выгрузки в разные дни
+DEFAULT_CURRENT_DATE = "01.01.2020"
+
+parser = ArgumentParser(description=__doc__, formatter_class=ArgumentDefaultsHelpFormatter)
+parser.add_argument(
+    "--citizens",
+    type=int,
+    default=10000,
+    help="Number of citizens (the API accepts at most 10000 citizens per import)",
+)
+parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+parser.add_argument("--output", help="File to write the import to (stdout if not set)")
+parser.add_argument(
+    "--current-date",
+    type=lambda value: datetime.strptime(value, DATE_FORMAT).date(),
+    default=DEFAULT_CURRENT_DATE,
+    help="Date ages are counted from in DD.MM.YYYY format",
+)
+
+group = parser.add_argument_group("Towns")
+group.add_argument("--towns", type=int, default=20, help="Number of towns")
+group.add_argument(
+    "--town-distribution",
+    default="uniform",
+    choices=TOWN_DISTRIBUTIONS,
+    help="uniform - towns of the same size, zipf - a few big towns and a long tail of small ones",
+)
+
+group = parser.add_argument_group("Ages")
+group.add_argument("--age-distribution", default="uniform", choices=AGE_DISTRIBUTIONS)
+group.add_argument("--max-age", type=int, default=80, help="Maximum age in years")
+group.add_argument("--mean-age", type=float, default=40, help="Mean age of the normal distribution")
+group.add_argument("--age-stddev", type=float, default=20, help="Standard deviation of the normal distribution")
+
+group = parser.add_argument_group("Relations")
+group.add_argument("--relations", type=float, default=2, help="Average number of relatives of a citizen")
+group.add_argument(
+    "--relation-window",
+    type=int,
+    default=100,
+    help="Relatives are picked among citizens whose ids differ by at most this number, "
+    "it bounds memory used by the generator",
+)
+
+
+def write_import(file: TextIO, citizens) -> None:
+    file.write('{"citizens":[')
+    for number, citizen in enumerate(citizens):
+        if number:
+            file.write(",\n")
+        file.write(json.dumps(citizen, ensure_ascii=False, separators=(",", ":")))
+    file.write("]}\n")
+
+
+def main():
+    args = parser.parse_args()
+    if args.citizens < 0 or args.towns < 1 or args.relation_window < 1:
+        parser.error("--citizens must not be negative, --towns and --relation-window must be positive")
+
+    citizens = iter_citizens(
+        count=args.citizens,
+        relations=args.relations,
+        towns=args.towns,
+        seed=args.seed,
+        town_distribution=args.town_distribution,
+        age_distribution=args.age_distribution,
+        max_age=args.max_age,
+        mean_age=args.mean_age,
+        age_stddev=args.age_stddev,
+        window=args.relation_window,
+        current_date=args.current_date,
+    )
+
+    if args.output is None:
+        try:
+            write_import(sys.stdout, citizens)
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # Читатель закрыл канал (например, head): остаток выгрузки не
+            # нужен. stdout подменяется, чтобы интерпретатор при выходе не
+            # сообщал об ошибке записи остатка буфера
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(1)
+        return
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        write_import(file, citizens)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,495 @@
+import asyncio
 import logging
 import os
+import time
 import uuid
-from contextlib import contextmanager
-from typing import AsyncIterable, AsyncIterator, Generator
+from collections import OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from typing import (
+    TYPE_CHECKING,
+    AsyncIterable,
+    AsyncIterator,
+    Generator,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 from aiohttp.web import Application
-from alembic.config import Config
+from asyncpg import Record
+from asyncpg.cursor import CursorFactory
+from asyncpg.prepared_stmt import PreparedStatement
 from asyncpgsa import PG
+from asyncpgsa.connection import SAConnection, compile_query, get_dialect
 from asyncpgsa.transactionmanager import ConnectionTransactionContextManager
 from configargparse import Namespace
 from sqlalchemy import Numeric, cast, func
-from sqlalchemy.sql import Select
+from sqlalchemy.sql import ClauseElement
 from sqlalchemy.sql.elements import ColumnElement
-from sqlalchemy_utils import create_database, drop_database
 from yarl import URL
 
 from analyzer.utils.consts import PROJECT_PATH
+from analyzer.utils.metrics import REGISTRY
+from analyzer.utils.slow_queries import SLOW_QUERY_LOG
+
+# alembic и sqlalchemy_utils нужны только для миграций и тестов, сервер
+# запускается без их импорта
+if TYPE_CHECKING:  # pragma: no cover
+    from alembic.config import Config
 
 log = logging.getLogger(__name__)
 
+DIALECT = get_dialect()
+
+DB_POOL_MIN_SIZE = REGISTRY.gauge(
+    "analyzer_db_pool_min_size", "Minimum number of database connections in the pool", labelnames=("pool",)
+)
+DB_POOL_MAX_SIZE = REGISTRY.gauge(
+    "analyzer_db_pool_max_size", "Maximum number of database connections in the pool", labelnames=("pool",)
+)
+DB_POOL_IN_USE = REGISTRY.gauge(
+    "analyzer_db_pool_connections_in_use", "Database connections acquired from the pool", labelnames=("pool",)
+)
+DB_POOL_WAITING = REGISTRY.gauge(
+    "analyzer_db_pool_waiting", "Coroutines waiting to acquire a database connection", labelnames=("pool",)
+)
+DB_POOL_ACQUIRE_SECONDS = REGISTRY.histogram(
+    "analyzer_db_pool_acquire_seconds",
+    "Time spent waiting for a database connection from the pool",
+    labelnames=("pool",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+DB_REPLICA_HEALTHY = REGISTRY.gauge(
+    "analyzer_db_replica_healthy", "Whether the replica is used for reads (1) or not (0)", labelnames=("pool",)
+)
+DB_REPLICA_LAG_SECONDS = REGISTRY.gauge(
+    "analyzer_db_replica_lag_seconds", "Replication lag measured by the last health check", labelnames=("pool",)
+)
+
+PRIMARY_POOL = "primary"
+
+Executor = Union[PG, SAConnection]
+
+
+class PreparedStatementsConnection(SAConnection):
+    """
+    Соединение, хранящее подготовленные (prepared) запросы из реестра QUERIES.
+
+    Запросы подготавливаются один раз при создании соединения в пуле
+    (см. QueryRegistry.prepare) и далее выполняются без повторного разбора.
+
+    Запросы, выполняемые напрямую через соединение (вставка выгрузки,
+    транзакции, проверки здоровья), измеряются для журнала медленных
+    запросов; запросы реестра измеряет PreparedQuery.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = {}
+
+    async def _observed(self, method, query, args: Sequence, kwargs: Mapping):
+        if not SLOW_QUERY_LOG.enabled:
+            return await method(query, *args, **kwargs)
+
+        # Запрос компилируется здесь, чтобы записать в лог его SQL и параметры
+        sql, params = compile_query(query, dialect=self._dialect)
+        args = params or args
+        started = time.monotonic()
+        result = await method(sql, *args, **kwargs)
+        await SLOW_QUERY_LOG.observe(self, None, sql, args, time.monotonic() - started)
+        return result
+
+    async def execute(self, query, *args, **kwargs) -> str:
+        return await self._observed(super().execute, query, args, kwargs)
+
+    async def fetch(self, query, *args, **kwargs) -> List[Record]:
+        return await self._observed(super().fetch, query, args, kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs) -> Optional[Record]:
+        return await self._observed(super().fetchrow, query, args, kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._observed(super().fetchval, query, args, kwargs)
+
+    async def reset(self, *args, **kwargs) -> None:
+        with SLOW_QUERY_LOG.untimed():
+            await super().reset(*args, **kwargs)
+
+
+@asynccontextmanager
+async def acquire(executor: Executor) -> AsyncIterator[SAConnection]:
+    """
+    Возвращает соединение: берет его из пула, если передан объект PG,
+    или использует переданное соединение как есть.
+
+    :param executor: объект для взаимодействия с БД или соединение
+    """
+    if isinstance(executor, PG):
+        async with executor.pool.acquire() as conn:
+            yield conn
+    else:
+        yield executor
+
+
+class MeteredAcquireContext:
+    """Контекст получения соединения из пула, измеряющий время ожидания."""
+
+    __slots__ = ("context", "pool")
+
+    def __init__(self, context, pool: "MeteredPool") -> None:
+        self.context = context
+        self.pool = pool
+
+    async def __aenter__(self) -> SAConnection:
+        labels = self.pool.labels
+        DB_POOL_WAITING.inc(labels=labels)
+        started = self.pool.waiters[self] = time.monotonic()
+        try:
+            conn = await self.context.__aenter__()
+        finally:
+            del self.pool.waiters[self]
+            DB_POOL_WAITING.dec(labels=labels)
+            DB_POOL_ACQUIRE_SECONDS.observe(time.monotonic() - started, labels=labels)
+
+        DB_POOL_IN_USE.inc(labels=labels)
+        return conn
+
+    async def __aexit__(self, *exc_info) -> None:
+        try:
+            await self.context.__aexit__(*exc_info)
+        finally:
+            DB_POOL_IN_USE.dec(labels=self.pool.labels)
+
+
+class MeteredPool:
+    """
+    Обертка над пулом asyncpg, собирающая метрики получения соединений.
+
+    Все способы получить соединение (PG.fetch*, PG.transaction, acquire)
+    сводятся к pool.acquire(), поэтому достаточно переопределить его и
+    transaction, который в asyncpgsa создает контекст поверх pool.acquire().
+    """
+
+    __slots__ = ("_pool", "labels", "waiters")
+
+    def __init__(self, pool, name: str) -> None:
+        self._pool = pool
+        self.labels = (name,)
+        # Время начала ожидания соединения по контекстам acquire в порядке
+        # начала ожидания: первое значение - самое старое
+        self.waiters = {}
+
+    def __getattr__(self, name: str):
+        return getattr(self._pool, name)
+
+    def acquire(self, *, timeout: float = None) -> MeteredAcquireContext:
+        return MeteredAcquireContext(self._pool.acquire(timeout=timeout), self)
+
+    def transaction(self, **kwargs) -> ConnectionTransactionContextManager:
+        return ConnectionTransactionContextManager(self, **kwargs)
+
+    begin = transaction
+
+    def wait_time(self) -> float:
+        """
+        Текущее время ожидания соединения в секундах: сколько ждет самая
+        давно ожидающая корутина (0, если свободные соединения есть).
+        """
+        if not self.waiters:
+            return 0.0
+        return time.monotonic() - next(iter(self.waiters.values()))
+
+
+class MeteredPG(PG):
+    """Объект для взаимодействия с БД, пул которого собирает метрики."""
+
+    __slots__ = ("name", "_metered_pool")
+
+    def __init__(self, name: str = PRIMARY_POOL) -> None:
+        """
+        :param name: название пула в метриках
+        """
+        super().__init__()
+        self.name = name
+        self._metered_pool = None
+
+    async def init(self, *args, min_size: int, max_size: int, **kwargs) -> None:
+        await super().init(*args, min_size=min_size, max_size=max_size, **kwargs)
+        self._metered_pool = MeteredPool(super().pool, self.name)
+        DB_POOL_MIN_SIZE.set(min_size, labels=(self.name,))
+        DB_POOL_MAX_SIZE.set(max_size, labels=(self.name,))
+
+    @property
+    def pool(self):
+        if self._metered_pool is None:
+            return super().pool
+        return self._metered_pool
+
+
+class PreparedQuery:
+    """
+    Запрос, скомпилированный в SQL один раз - при регистрации.
+
+    Принимает конструкцию SQLAlchemy (параметры задаются через bindparam)
+    или SQL-строку с позиционными параметрами ($1, $2, ...), имена которых
+    передаются в params. При выполнении параметры передаются по именам.
+    """
+
+    __slots__ = ("name", "sql", "params", "defaults", "processors")
+
+    def __init__(self, name: str, query: Union[str, ClauseElement], params: Sequence[str] = ()) -> None:
+        self.name = name
+
+        if isinstance(query, str):
+            self.sql = query
+            self.params = tuple(params)
+            self.defaults = {}
+            self.processors = {}
+            return
+
+        # Тот же способ компиляции, что и в asyncpgsa.compile_query, но
+        # выполняемый единожды: литералы (например, 0.5 в percentile_cont)
+        # становятся значениями параметров по умолчанию.
+        compiled = query.compile(dialect=DIALECT)
+        self.params = tuple(sorted(compiled.params))
+        self.sql = compiled.string % {key: "$" + str(i) for i, key in enumerate(self.params, start=1)}
+        self.processors = {
+            key: compiled._bind_processors[key] for key in self.params if key in compiled._bind_processors
+        }
+        self.defaults = {key: value for key, value in compiled.params.items() if value is not None}
+
+    def __repr__(self) -> str:
+        return "<{0} {1!r}>".format(self.__class__.__name__, self.name)
+
+    def make_args(self, params: Mapping) -> list:
+        """
+        Формирует список позиционных аргументов запроса.
+
+        :param params: значения параметров по именам
+        :return: список аргументов в порядке $1, $2, ...
+        """
+        args = []
+        for key in self.params:
+            value = params[key] if key in params else self.defaults[key]
+            if key in self.processors:
+                value = self.processors[key](value)
+            args.append(value)
+        return args
+
+    async def prepare(self, conn: SAConnection) -> PreparedStatement:
+        """
+        Возвращает подготовленный запрос для соединения.
+
+        :param conn: объект соединения
+        :return: подготовленный запрос
+        """
+        statements = getattr(conn, "prepared_statements", None)
+        if statements is None:
+            # Соединение создано не пулом приложения (например, в тестах)
+            return await conn.prepare(self.sql)
+
+        statement = statements.get(self.name)
+        if statement is None:
+            statement = statements[self.name] = await conn.prepare(self.sql)
+        return statement
+
+    async def _run(self, executor: Executor, method: str, params: Mapping):
+        async with acquire(executor) as conn:
+            statement = await self.prepare(conn)
+            args = self.make_args(params)
+            started = time.monotonic()
+            result = await getattr(statement, method)(*args)
+            await SLOW_QUERY_LOG.observe(conn, self.name, self.sql, args, time.monotonic() - started)
+            return result
+
+    async def fetch(self, executor: Executor, **params) -> List[Record]:
+        return await self._run(executor, "fetch", params)
+
+    async def fetchrow(self, executor: Executor, **params) -> Record:
+        return await self._run(executor, "fetchrow", params)
+
+    async def fetchval(self, executor: Executor, **params):
+        return await self._run(executor, "fetchval", params)
+
+    async def execute(self, executor: Executor, **params) -> None:
+        await self._run(executor, "fetch", params)
+
+    async def cursor(self, conn: SAConnection, prefetch: int = None, timeout: float = None, **params) -> CursorFactory:
+        statement = await self.prepare(conn)
+        return statement.cursor(*self.make_args(params), prefetch=prefetch, timeout=timeout)
+
+
+class QueryRegistry(Mapping):
+    """Реестр запросов, подготавливаемых для каждого соединения пула."""
+
+    def __init__(self) -> None:
+        self._queries = {}
+
+    def __getitem__(self, name: str) -> PreparedQuery:
+        return self._queries[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._queries)
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def register(self, name: str, query: Union[str, ClauseElement], params: Sequence[str] = ()) -> PreparedQuery:
+        """
+        Компилирует и регистрирует запрос под указанным именем.
+
+        :param name: уникальное имя запроса
+        :param query: конструкция SQLAlchemy или SQL-строка
+        :param params: имена позиционных параметров SQL-строки
+        :return: скомпилированный запрос
+        """
+        if name in self._queries:
+            raise ValueError("Query {0!r} is already registered".format(name))
+
+        self._queries[name] = PreparedQuery(name=name, query=query, params=params)
+        return self._queries[name]
+
+    async def prepare(self, conn: SAConnection) -> None:
+        """
+        Подготавливает все зарегистрированные запросы.
+
+        Используется как хук init пула: вызывается один раз для каждого
+        нового соединения.
+
+        :param conn: объект соединения
+        """
+        for query in self._queries.values():
+            await query.prepare(conn)
+
+
+QUERIES = QueryRegistry()
+
+
+# Отставание реплики: 0, если она воспроизвела все полученные изменения
+# (на простаивающей реплике pg_last_xact_replay_timestamp не обновляется)
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class ReplicaSet:
+    """
+    Реплики для чтения данных.
+
+    Читающие запросы распределяются по исправным репликам по кругу. Реплика
+    исключается из распределения, если проверка здоровья не смогла
+    выполнить запрос или ее отставание больше max_lag секунд.
+
+    Чтобы клиент видел собственные изменения (read-your-writes), выгрузки,
+    изменившиеся в этом процессе, читаются из основной БД, пока изменения
+    гарантированно не дойдут до реплик: max_lag плюс интервал проверок.
+    Если реплик нет или все они неисправны, чтение идет из основной БД.
+    """
+
+    def __init__(self, primary: PG, replicas: Sequence[MeteredPG], max_lag: float, check_interval: float) -> None:
+        """
+        :param primary: объект для взаимодействия с основной БД
+        :param replicas: объекты для взаимодействия с репликами
+        :param max_lag: максимальное отставание исправной реплики в секундах
+        :param check_interval: интервал между проверками здоровья в секундах
+        """
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.healthy: List[MeteredPG] = list(self.replicas)
+        self._next = 0
+        self._written = OrderedDict()
+
+    @property
+    def write_window(self) -> float:
+        return self.max_lag + self.check_interval
+
+    def mark_written(self, import_id: int) -> None:
+        """
+        Запоминает изменение выгрузки, чтобы читать ее из основной БД.
+
+        :param import_id: идентификатор выгрузки
+        """
+        if not self.replicas:
+            return
+
+        now = time.monotonic()
+        self._written.pop(import_id, None)
+        self._written[import_id] = now
+
+        # Записи упорядочены по времени, устаревшие находятся в начале
+        while self._written:
+            oldest_id, written_at = next(iter(self._written.items()))
+            if now - written_at < self.write_window:
+                break
+            del self._written[oldest_id]
+
+    def is_written_recently(self, import_id: int) -> bool:
+        written_at = self._written.get(import_id)
+        return written_at is not None and time.monotonic() - written_at < self.write_window
+
+    def reader(self, import_id: Optional[int] = None) -> PG:
+        """
+        Возвращает объект для выполнения читающих запросов.
+
+        :param import_id: идентификатор читаемой выгрузки
+        """
+        if not self.healthy or (import_id is not None and self.is_written_recently(import_id)):
+            return self.primary
+
+        self._next = (self._next + 1) % len(self.healthy)
+        return self.healthy[self._next]
+
+    async def check_replica(self, replica: MeteredPG) -> bool:
+        try:
+            async with replica.pool.acquire(timeout=self.check_interval) as conn:
+                lag = float(await conn.fetchval(REPLICA_LAG_QUERY, timeout=self.check_interval))
+        except Exception:
+            log.exception("Health check of replica %r failed", replica.name)
+            return False
+
+        DB_REPLICA_LAG_SECONDS.set(lag, labels=(replica.name,))
+        if lag > self.max_lag:
+            log.warning("Replica %r lags behind by %.1f s", replica.name, lag)
+            return False
+        return True
+
+    async def check_health(self) -> None:
+        """Проверяет все реплики и обновляет список исправных."""
+        results = await asyncio.gather(*(self.check_replica(replica) for replica in self.replicas))
+
+        healthy = [replica for replica, ok in zip(self.replicas, results) if ok]
+        for replica, ok in zip(self.replicas, results):
+            DB_REPLICA_HEALTHY.set(int(ok), labels=(replica.name,))
+            if ok and replica not in self.healthy:
+                log.info("Replica %r is back in rotation", replica.name)
+        self.healthy = healthy
+
+    async def run_health_checks(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check_health()
+
+
+async def init_pg(pg: MeteredPG, url: URL, min_size: int, max_size: int) -> MeteredPG:
+    await pg.init(
+        str(url),
+        min_size=min_size,
+        max_size=max_size,
+        connection_class=PreparedStatementsConnection,
+        init=QUERIES.prepare,
+    )
+    await pg.fetchval("SELECT 1")
+    return pg
+
 
 async def setup_db(app: Application, args: Namespace):
     """
@@ -28,20 +499,54 @@ async def setup_db(app: Application, args: Namespace):
     пула коннектов и т.д.
     То, что после оператора yield - закрытие всех соединений и освобождение ресурсов.
 
+    Изменяющие данные запросы выполняются в основной БД (app["db"]), читающие
+    могут выполняться в репликах (app["db_replicas"]).
+
     :param app: экземпляр приложения
     :param args: аргументы командной строки
     """
-    app["db"] = PG()
-    await app["db"].init(str(args.pg_url), min_size=args.pg_pool_min_size, max_size=args.pg_pool_max_size)
+    SLOW_QUERY_LOG.configure(
+        threshold=args.pg_slow_query_threshold / 1000 if args.pg_slow_query_threshold > 0 else None,
+        explain_sample_rate=args.pg_explain_sample_rate,
+        explain_interval=args.pg_explain_interval,
+    )
 
-    await app["db"].fetchval("SELECT 1")
+    app["db"] = await init_pg(MeteredPG(), args.pg_url, min_size=args.pg_pool_min_size, max_size=args.pg_pool_max_size)
     log.info("Connected to database")
 
+    replicas = []
+    try:
+        for number, url in enumerate(args.pg_replica_url or ()):
+            replica = MeteredPG(name="replica{0}".format(number))
+            await init_pg(replica, url, min_size=args.pg_replica_pool_min_size, max_size=args.pg_replica_pool_max_size)
+            replicas.append(replica)
+            log.info("Connected to replica %r", replica.name)
+
+        app["db_replicas"] = ReplicaSet(
+            primary=app["db"],
+            replicas=replicas,
+            max_lag=args.pg_replica_max_lag,
+            check_interval=args.pg_replica_check_interval,
+        )
+        health_checks = None
+        if replicas:
+            await app["db_replicas"].check_health()
+            health_checks = asyncio.ensure_future(app["db_replicas"].run_health_checks())
+    except Exception:
+        for pg in [app["db"]] + replicas:
+            await pg.pool.close()
+        raise
+
     try:
         yield
     finally:
+        if health_checks is not None:
+            health_checks.cancel()
+            await asyncio.gather(health_checks, return_exceptions=True)
+
         log.info("Disconnecting from database")
-        await app["db"].pool.close()
+        for pg in [app["db"]] + replicas:
+            await pg.pool.close()
         log.info("Disconnected from database")
 
 
@@ -57,16 +562,18 @@ class AsyncPGCursor(AsyncIterable):
 
     PREFETCH = 500
 
-    __slots__ = ("query", "transaction_ctx", "prefetch", "timeout")
+    __slots__ = ("query", "params", "transaction_ctx", "prefetch", "timeout")
 
     def __init__(
         self,
-        query: Select,
+        query: PreparedQuery,
         transaction_ctx: ConnectionTransactionContextManager,
+        params: Mapping = None,
         prefetch: int = None,
         timeout: float = None,
     ) -> None:
         self.query = query
+        self.params = params or {}
         self.transaction_ctx = transaction_ctx
         self.prefetch = prefetch or self.PREFETCH
         self.timeout = timeout
@@ -81,16 +588,28 @@ class AsyncPGCursor(AsyncIterable):
 
         """
         async with self.transaction_ctx as conn:
-            cursor = conn.cursor(self.query, prefetch=self.prefetch, timeout=self.timeout)
+            cursor = await self.query.cursor(conn, prefetch=self.prefetch, timeout=self.timeout, **self.params)
+
+            # Для журнала медленных запросов измеряется время до первой порции
+            # строк: дальнейшая выборка зависит и от скорости чтения клиентом
+            started, duration = time.monotonic(), None
             async for row in cursor:
+                if duration is None:
+                    duration = time.monotonic() - started
                 yield row
 
+            if duration is None:
+                duration = time.monotonic() - started
+            await SLOW_QUERY_LOG.observe(
+                conn, self.query.name, self.query.sql, self.query.make_args(self.params), duration
+            )
+
 
 def rounded(column: ColumnElement, fraction: int = 2) -> ColumnElement:
     return func.round(cast(column, Numeric), fraction)
 
 
-def make_alembic_config(options: Namespace, base_path: str = PROJECT_PATH) -> Config:
+def make_alembic_config(options: Namespace, base_path: str = PROJECT_PATH) -> "Config":
     """
     Создает объект конфигурации alembic на основе аргументов командной строки,
     и настраивает его (меняет относительные пути на абсолютные).
@@ -104,6 +623,8 @@ def make_alembic_config(options: Namespace, base_path: str = PROJECT_PATH) -> Co
     if not os.path.isabs(options.config):
         options.config = os.path.join(base_path, options.config)
 
+    from alembic.config import Config
+
     # Создаем объект конфигурации Alembic
     config = Config(file_=options.config, ini_section=options.name, cmd_opts=options)
     if options.db_url:
@@ -126,6 +647,8 @@ def tmp_database(
     encoding: str = "utf8",
     template: str = None,
 ) -> Generator[str, None, None]:
+    from sqlalchemy_utils import create_database, drop_database
+
     db_name = ".".join([uuid.uuid4().hex, suffix])
     db_url = str(URL(db_url).with_name(db_name))
     create_database(url=db_url, encoding=encoding, template=template)
@@ -136,6 +659,6 @@ def tmp_database(
         drop_database(url=db_url)
 
 
-def alembic_config_from_url(db_url: str = None) -> Config:
+def alembic_config_from_url(db_url: str = None) -> "Config":
     options = Namespace(config="alembic.ini", name="alembic", db_url=db_url, raiseerr=False, x=None)
     return make_alembic_config(options)
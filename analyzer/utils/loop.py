@@ -0,0 +1,31 @@
+import asyncio
+import logging
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover
+    uvloop = None
+
+log = logging.getLogger(__name__)
+
+EVENT_LOOPS = ("asyncio", "uvloop")
+
+
+def setup_event_loop_policy(event_loop: str) -> str:
+    """
+    Устанавливает политику event loop'а для всех создаваемых далее циклов.
+
+    Должна вызываться до создания приложения и запуска сервера. Если uvloop
+    не установлен, остается стандартный asyncio.
+
+    :param event_loop: asyncio или uvloop
+    :return: название фактически используемого event loop'а
+    """
+    if event_loop == "uvloop":
+        if uvloop is not None:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return "uvloop"
+        log.warning("uvloop is not installed, falling back to asyncio event loop")
+
+    asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
+    return "asyncio"
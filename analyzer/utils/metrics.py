@@ -0,0 +1,155 @@
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы по умолчанию для задержек в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join('{0}="{1}"'.format(n, escape_label_value(str(v))) for n, v in zip(names, values)) + "}"
+
+
+class Metric:
+    """
+    Метрика в формате Prometheus.
+
+    Значения хранятся в словаре по кортежу значений меток, поэтому обновление
+    метрики на горячем пути - это поиск в словаре и сложение, без блокировок
+    (метрики обновляются только из потока event loop'а).
+    """
+
+    type: str
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """Возвращает тройки (суффикс имени, метки, значение)."""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            "# HELP {0} {1}".format(self.name, self.documentation.replace("\\", "\\\\").replace("\n", "\\n")),
+            "# TYPE {0} {1}".format(self.name, self.type),
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append("{0}{1}{2} {3}".format(self.name, suffix, labels, format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, labels: LabelValues = ()) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield "_total", format_labels(self.labelnames, labels), value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, labels: LabelValues = ()) -> None:
+        self._values[labels] = value
+
+    def inc(self, amount: float = 1, labels: LabelValues = ()) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, labels: LabelValues = ()) -> None:
+        self.inc(-amount, labels)
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield "", format_labels(self.labelnames, labels), value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # По каждому набору меток: счетчики попаданий в интервалы (последний - +Inf) и сумма
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, labels: LabelValues = ()) -> None:
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        # Граница le включительная, поэтому bisect_left
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def samples(self):
+        names = self.labelnames + ("le",)
+        for labels, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", format_labels(names, labels + (format_value(bound),)), cumulative
+            yield "_sum", format_labels(self.labelnames, labels), self._sums[labels]
+            yield "_count", format_labels(self.labelnames, labels), cumulative
+
+
+class Registry:
+    """Набор метрик процесса, отдаваемый в текстовом формате Prometheus."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError("Metric {0!r} is already registered".format(metric.name))
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Метрики создаются при импорте модулей, как и запросы в QUERIES
+REGISTRY = Registry()
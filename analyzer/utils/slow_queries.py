@@ -0,0 +1,141 @@
+import logging
+import random
+import reprlib
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional, Sequence
+
+from asyncpgsa.connection import SAConnection
+
+log = logging.getLogger(__name__)
+
+# Параметры запросов бывают большими (массивы идентификаторов жителей),
+# в лог попадает только их начало
+PARAMS_REPR = reprlib.Repr()
+PARAMS_REPR.maxlist = PARAMS_REPR.maxtuple = 20
+PARAMS_REPR.maxstring = PARAMS_REPR.maxother = 200
+
+# Запросы, не зарегистрированные в реестре, называются в логе началом их текста
+SQL_REPR = reprlib.Repr()
+SQL_REPR.maxstring = 100
+
+# Планы снимаются только для запросов, которые поддерживает EXPLAIN
+# (BEGIN, SAVEPOINT и т.п. только записываются в лог)
+EXPLAINABLE = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "VALUES"))
+
+# Не измеряются ли запросы текущей задачи: запросы самого журнала (EXPLAIN)
+# и служебные запросы asyncpg (сброс соединения при возврате в пул)
+_untimed = ContextVar("untimed", default=False)
+
+
+class Rollback(Exception):
+    """Откатывает транзакцию (или точку сохранения), в которой выполнялся EXPLAIN."""
+
+
+class SlowQueryLog:
+    """
+    Журнал медленных запросов.
+
+    Запросы, выполнявшиеся дольше порога, записываются в лог вместе с
+    параметрами. Для части из них (с вероятностью explain_sample_rate и не
+    чаще раза в explain_interval секунд) на том же соединении снимается план
+    выполнения: EXPLAIN (ANALYZE, BUFFERS) для SELECT-запросов и EXPLAIN
+    без выполнения для остальных. EXPLAIN выполняется в транзакции (или точке
+    сохранения, если соединение уже в транзакции), которая всегда откатывается.
+    """
+
+    def __init__(self) -> None:
+        self.threshold: Optional[float] = None
+        self.explain_sample_rate = 0.0
+        self.explain_interval = 60.0
+        self._last_explain = float("-inf")
+
+    def configure(self, threshold: Optional[float], explain_sample_rate: float, explain_interval: float) -> None:
+        """
+        :param threshold: порог в секундах (None - журнал выключен)
+        :param explain_sample_rate: доля медленных запросов, для которых снимается план
+        :param explain_interval: минимальный интервал между снятиями планов в секундах
+        """
+        self.threshold = threshold
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_interval = explain_interval
+
+    @property
+    def enabled(self) -> bool:
+        """Нужно ли измерять запросы текущей задачи."""
+        return self.threshold is not None and not _untimed.get()
+
+    @staticmethod
+    @contextmanager
+    def untimed() -> Iterator[None]:
+        """Отключает измерение запросов текущей задачи."""
+        token = _untimed.set(True)
+        try:
+            yield
+        finally:
+            _untimed.reset(token)
+
+    def is_slow(self, duration: float) -> bool:
+        return self.threshold is not None and duration >= self.threshold
+
+    def should_explain(self) -> bool:
+        if self.explain_sample_rate <= 0 or random.random() >= self.explain_sample_rate:
+            return False
+
+        now = time.monotonic()
+        if now - self._last_explain < self.explain_interval:
+            return False
+        self._last_explain = now
+        return True
+
+    async def observe(self, conn: SAConnection, name: Optional[str], sql: str, args: Sequence, duration: float) -> None:
+        """
+        Записывает запрос в лог, если он выполнялся дольше порога.
+
+        :param conn: соединение, на котором выполнялся запрос
+        :param name: название запроса в реестре (None - запрос не зарегистрирован)
+        :param sql: текст запроса
+        :param args: позиционные параметры запроса
+        :param duration: время выполнения в секундах
+        """
+        if not self.is_slow(duration):
+            return
+
+        if name is None:
+            name = SQL_REPR.repr(" ".join(sql.split()))[1:-1]
+        log.warning("Slow query %r took %.1f ms, params: %s", name, duration * 1000, PARAMS_REPR.repr(list(args)))
+        if not self.should_explain():
+            return
+
+        plan = await self.explain(conn, sql, args)
+        if plan is not None:
+            log.warning("Plan of slow query %r:\n%s", name, plan)
+
+    @staticmethod
+    async def explain(conn: SAConnection, sql: str, args: Sequence) -> Optional[str]:
+        words = sql.split(None, 1)
+        if not words or words[0].upper() not in EXPLAINABLE:
+            return None
+
+        # ANALYZE выполняет запрос повторно, поэтому изменяющие данные запросы
+        # не выполняются даже внутри откатываемой транзакции: откат не вернет
+        # значения последовательностей
+        analyze = words[0].upper() == "SELECT"
+        explain_sql = "{0} {1}".format("EXPLAIN (ANALYZE, BUFFERS)" if analyze else "EXPLAIN", sql)
+
+        plan = None
+        try:
+            with SlowQueryLog.untimed():
+                async with conn.transaction():
+                    rows = await conn.fetch(explain_sql, *args)
+                    plan = "\n".join(row[0] for row in rows)
+                    raise Rollback
+        except Rollback:
+            pass
+        except Exception:
+            log.exception("Failed to explain slow query")
+        return plan
+
+
+SLOW_QUERY_LOG = SlowQueryLog()
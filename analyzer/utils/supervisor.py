@@ -0,0 +1,106 @@
+import logging
+import multiprocessing
+import signal
+import time
+from multiprocessing.connection import wait
+from typing import Callable, List, Optional
+
+log = logging.getLogger(__name__)
+
+# Воркер, завершившийся быстрее, скорее всего не может запуститься (например,
+# занят порт или недоступна БД) - перезапускать его в цикле без паузы нельзя
+MIN_WORKER_UPTIME = 1.0
+RESTART_DELAY = 1.0
+
+
+class Supervisor:
+    """
+    Запускает несколько процессов-воркеров, перезапускает упавшие
+    и корректно останавливает все воркеры по SIGINT/SIGTERM.
+
+    Воркеры создаются через fork: каждый из них сам открывает сокет с
+    SO_REUSEPORT и соединения с БД, поэтому никакие ресурсы, кроме кода,
+    между процессами не разделяются.
+    """
+
+    def __init__(self, target: Callable[[int], None], workers: int, shutdown_timeout: float = 30.0) -> None:
+        """
+        :param target: функция воркера, принимает номер воркера
+        :param workers: количество воркеров
+        :param shutdown_timeout: сколько ждать завершения воркеров после SIGTERM
+        """
+        self.target = target
+        self.workers = workers
+        self.shutdown_timeout = shutdown_timeout
+        self._context = multiprocessing.get_context("fork")
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._started_at: List[float] = [0.0] * workers
+        self._stopping = False
+
+    def _start_worker(self, number: int) -> None:
+        process = self._context.Process(target=self._run_worker, args=(number,), name="worker-{0}".format(number))
+        process.start()
+        self._processes[number] = process
+        self._started_at[number] = time.monotonic()
+        log.info("Started worker %d (pid %d)", number, process.pid)
+
+    def _run_worker(self, number: int) -> None:
+        # Обработчики сигналов супервизора наследуются через fork
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self.target(number)
+
+    def _stop(self, signum: int, frame) -> None:
+        log.info("Received signal %d, stopping workers", signum)
+        self._stopping = True
+
+    def run(self) -> int:
+        """
+        Запускает воркеры и блокируется до получения сигнала остановки.
+
+        :return: код выхода процесса
+        """
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+
+        for number in range(self.workers):
+            self._start_worker(number)
+
+        while not self._stopping:
+            # Ожидание прерывается завершением любого воркера или сигналом
+            wait([process.sentinel for process in self._processes], timeout=RESTART_DELAY)
+            if self._stopping:
+                break
+
+            for number, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+
+                uptime = time.monotonic() - self._started_at[number]
+                log.error("Worker %d (pid %d) exited with code %s", number, process.pid, process.exitcode)
+                if uptime < MIN_WORKER_UPTIME:
+                    time.sleep(RESTART_DELAY)
+                if not self._stopping:
+                    self._start_worker(number)
+
+        return self._shutdown()
+
+    def _shutdown(self) -> int:
+        for process in self._processes:
+            if process.is_alive():
+                # aiohttp по SIGTERM перестает принимать соединения, а воркер
+                # дожидается завершения обрабатываемых запросов (см. Drainer)
+                process.terminate()
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        exit_code = 0
+        for number, process in enumerate(self._processes):
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                log.warning("Worker %d (pid %d) did not stop in time, killing", number, process.pid)
+                process.kill()
+                process.join()
+                exit_code = 1
+
+        log.info("All workers stopped")
+        return exit_code
@@ -0,0 +1,135 @@
+import math
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_COMPRESSION = 200
+
+
+class TDigest:
+    """
+    Сжатое представление распределения (merging t-digest, Dunning).
+
+    Хранит не более O(compression) центроидов (среднее и вес), причем у краев
+    распределения центроиды мельче, чем в середине, - поэтому крайние квантили
+    оцениваются точнее. Удалять значения из дайджеста нельзя, поэтому после
+    изменения жителей распределение города строится заново.
+    """
+
+    __slots__ = ("compression", "means", "counts", "min_value", "max_value")
+
+    def __init__(
+        self,
+        compression: int = DEFAULT_COMPRESSION,
+        means: Sequence[float] = (),
+        counts: Sequence[int] = (),
+        min_value: Optional[float] = None,
+        max_value: Optional[float] = None,
+    ) -> None:
+        self.compression = compression
+        self.means = list(means)
+        self.counts = list(counts)
+        # Крайние значения позволяют интерполировать внутри крайних центроидов
+        self.min_value = min_value
+        self.max_value = max_value
+
+    def __len__(self) -> int:
+        return len(self.means)
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    @classmethod
+    def from_values(cls, values: Iterable[float], compression: int = DEFAULT_COMPRESSION) -> "TDigest":
+        digest = cls(compression=compression)
+        digest._compress(sorted((value, 1) for value in values))
+        return digest
+
+    def _k(self, q: float) -> float:
+        """Масштабирующая функция k1: переводит квантиль в номер центроида."""
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _q(self, k: float) -> float:
+        """Функция, обратная k1."""
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(2 * math.pi * k / self.compression) + 1) / 2
+
+    def _compress(self, points: List[Tuple[float, int]]) -> None:
+        """
+        Объединяет упорядоченные по значению точки в центроиды так, чтобы
+        каждый центроид занимал не больше единицы шкалы k1.
+        """
+        self.means, self.counts = [], []
+        if not points:
+            self.min_value = self.max_value = None
+            return
+
+        self.min_value, self.max_value = points[0][0], points[-1][0]
+
+        total = sum(count for _, count in points)
+        so_far = 0
+        mean, count = points[0]
+        q_limit = self._q(self._k(0) + 1)
+        for point_mean, point_count in points[1:]:
+            if (so_far + count + point_count) / total <= q_limit:
+                count += point_count
+                mean += (point_mean - mean) * point_count / count
+                continue
+
+            self.means.append(mean)
+            self.counts.append(count)
+            so_far += count
+            q_limit = self._q(self._k(so_far / total) + 1)
+            mean, count = point_mean, point_count
+
+        self.means.append(mean)
+        self.counts.append(count)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Оценивает квантиль распределения.
+
+        Центроид веса w считается расположенным в середине занимаемого им
+        отрезка, между центроидами значение интерполируется линейно. Позиция
+        квантиля выбрана так же, как в percentile_cont: для центроидов из одной
+        точки результат совпадает с точным.
+
+        :param q: квантиль от 0 до 1
+        :return: оценка значения или None для пустого дайджеста
+        """
+        if not self.means:
+            return None
+
+        # Крайние значения - точки в середине первой и последней единицы веса
+        total = self.total
+        centers, values = [0.5], [self.min_value]
+        position = 0
+        for mean, count in zip(self.means, self.counts):
+            centers.append(position + count / 2)
+            values.append(mean)
+            position += count
+        centers.append(total - 0.5)
+        values.append(self.max_value)
+
+        target = q * (total - 1) + 0.5
+        for i in range(1, len(centers)):
+            if target <= centers[i]:
+                width = centers[i] - centers[i - 1]
+                if width <= 0:
+                    return values[i]
+                return values[i - 1] + (values[i] - values[i - 1]) * (target - centers[i - 1]) / width
+
+        return self.max_value
+
+    def to_dict(self) -> dict:
+        return {
+            "compression": self.compression,
+            "means": self.means,
+            "counts": self.counts,
+            "min_value": self.min_value,
+            "max_value": self.max_value,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TDigest":
+        return cls(**data)
@@ -0,0 +1,216 @@
+"""
+Микробенчмарки построчных горячих путей: валидация выгрузки, формирование
+строк для вставки в БД и сериализация ответов. БД для запуска не требуется.
+
+Результаты можно сохранить как базовые и сравнивать с ними последующие
+запуски: при замедлении любого случая больше чем на --threshold скрипт
+завершается с кодом 1. Базовые результаты зависят от машины, поэтому
+по умолчанию хранятся локально в .benchmarks/ (не в репозитории).
+
+Запуск:
+    python -m benchmarks.hot_paths --save
+    python -m benchmarks.hot_paths --compare
+
+Те же случаи запускаются через pytest-benchmark (см. test_hot_paths.py):
+    pytest benchmarks/ --benchmark-autosave
+    pytest benchmarks/ --benchmark-compare --benchmark-compare-fail=min:10%
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import timeit
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple
+
+from asyncpg.protocol.protocol import _create_record as make_record
+from marshmallow.fields import Nested
+
+from analyzer.api.payloads import JSON_BACKENDS, AsyncGenJSONListPayload, set_json_backend, smart_dumps
+from analyzer.api.schema import CitizenSchema, ImportRequestSchema
+from analyzer.api.services.imports import make_citizen_rows, make_relation_rows
+from analyzer.bench.dataset import generate_citizens
+from analyzer.utils.consts import DATE_FORMAT
+
+DEFAULT_BASELINE = os.path.join(".benchmarks", "hot_paths.json")
+SIZES = (1000, 10000, 100000)
+
+# Поля записи, которую возвращает запрос списка жителей
+CITIZEN_FIELDS = ("citizen_id", "name", "birth_date", "gender", "town", "street", "building", "apartment", "relatives")
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--save", nargs="?", const=DEFAULT_BASELINE, help="Save results as the baseline")
+parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, help="Compare results with the baseline")
+parser.add_argument("--threshold", type=float, default=0.1, help="Allowed slowdown relative to the baseline")
+parser.add_argument("--repeat", type=int, default=5, help="Number of runs per case, the best one is reported")
+parser.add_argument("--filter", default="", help="Run only cases whose names contain this substring")
+
+
+class UnboundedImportRequestSchema(ImportRequestSchema):
+    """
+    Схема выгрузки без ограничения на количество жителей: API принимает
+    не больше 10000 жителей, но стоимость валидации интересна и для
+    выгрузок большего размера.
+    """
+
+    citizens = Nested(CitizenSchema, many=True, required=True)
+
+
+class NullWriter:
+    """Писатель ответа, отбрасывающий данные."""
+
+    async def write(self, chunk: bytes) -> None:
+        pass
+
+
+class Dataset(NamedTuple):
+    payload: dict
+    schema: ImportRequestSchema
+    records: list
+
+
+class Case(NamedTuple):
+    name: str
+    rows: int
+    # Возвращает измеряемую функцию для набора данных размера rows
+    make_func: Callable[[Dataset], Callable[[], object]]
+
+
+def make_citizen_records(citizens: List[dict]) -> list:
+    """Записи asyncpg в том виде, в каком их возвращает запрос списка жителей."""
+    mapping = {field: i for i, field in enumerate(CITIZEN_FIELDS)}
+    records = []
+    for citizen in citizens:
+        values = dict(citizen, birth_date=datetime.strptime(citizen["birth_date"], DATE_FORMAT).date())
+        records.append(make_record(mapping, tuple(values[field] for field in CITIZEN_FIELDS)))
+    return records
+
+
+def make_dataset(size: int) -> Dataset:
+    citizens = generate_citizens(count=size, relations=2, towns=20, seed=size)
+    schema = (ImportRequestSchema if size <= 10000 else UnboundedImportRequestSchema)()
+    return Dataset(payload={"citizens": citizens}, schema=schema, records=make_citizen_records(citizens))
+
+
+def make_cases() -> List[Case]:
+    """
+    Возвращает случаи без данных: жители генерируются только для выполняемых
+    случаев, при подготовке их функций (см. make_case_func).
+    """
+    loop = asyncio.new_event_loop()
+    cases = []
+    for size in SIZES:
+        cases.extend(
+            [
+                Case("schema_load[{0}]".format(size), size, lambda d: lambda: d.schema.load(d.payload)),
+                Case(
+                    "make_citizen_rows[{0}]".format(size),
+                    size,
+                    lambda d: lambda: list(make_citizen_rows(import_id=1, citizens=d.payload["citizens"])),
+                ),
+                Case(
+                    "make_relation_rows[{0}]".format(size),
+                    size,
+                    lambda d: lambda: list(make_relation_rows(import_id=1, citizens=d.payload["citizens"])),
+                ),
+                Case("smart_dumps[{0}]".format(size), size, lambda d: lambda: smart_dumps({"data": d.records})),
+            ]
+        )
+
+        for backend in JSON_BACKENDS:
+            cases.append(
+                Case(
+                    "payload_write[{0}-{1}]".format(backend, size),
+                    size,
+                    lambda d, b=backend: lambda: write_payload(loop, d.records, backend=b),
+                )
+            )
+    return cases
+
+
+def make_case_func(case: Case, datasets: Dict[int, Dataset]) -> Callable[[], object]:
+    """
+    Возвращает измеряемую функцию случая.
+
+    :param case: случай
+    :param datasets: наборы данных по размерам, общие для всех случаев
+    """
+    if case.rows not in datasets:
+        datasets[case.rows] = make_dataset(case.rows)
+    return case.make_func(datasets[case.rows])
+
+
+def write_payload(loop: asyncio.AbstractEventLoop, records: list, backend: str) -> None:
+    async def rows():
+        for record in records:
+            yield record
+
+    set_json_backend(backend)
+    try:
+        loop.run_until_complete(AsyncGenJSONListPayload(rows()).write(NullWriter()))
+    finally:
+        set_json_backend("json")
+
+
+def measure(func: Callable, repeat: int) -> float:
+    """Возвращает лучшее время одного вызова в секундах."""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def load_baseline(path: str) -> Dict[str, float]:
+    with open(path) as file:
+        return json.load(file)["results"]
+
+
+def save_baseline(path: str, results: Dict[str, float]) -> None:
+    # Запуск с --filter обновляет только выполненные случаи
+    if os.path.exists(path):
+        results = dict(load_baseline(path), **results)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(
+            {
+                "saved_at": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "machine": platform.platform(),
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+
+
+def main():
+    args = parser.parse_args()
+    baseline = load_baseline(args.compare) if args.compare else {}
+
+    results, regressions, datasets = {}, [], {}
+    print("{0:<30} {1:>12} {2:>12} {3:>10}".format("case", "total, ms", "per row, us", "baseline"))
+    for case in make_cases():
+        if args.filter not in case.name:
+            continue
+
+        func = make_case_func(case, datasets)
+        elapsed = results[case.name] = measure(func, repeat=args.repeat)
+        change = ""
+        if case.name in baseline:
+            ratio = elapsed / baseline[case.name]
+            change = "{0:+.1%}".format(ratio - 1)
+            if ratio > 1 + args.threshold:
+                regressions.append(case.name)
+        print(
+            "{0:<30} {1:>12.2f} {2:>12.3f} {3:>10}".format(case.name, elapsed * 1e3, elapsed / case.rows * 1e6, change)
+        )
+
+    if args.save:
+        save_baseline(args.save, results)
+    if regressions:
+        print("Slower than the baseline by more than {0:.0%}: {1}".format(args.threshold, ", ".join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Микробенчмарк: стоимость подготовки запроса на стороне Python.
+
+Сравнивает компиляцию конструкций SQLAlchemy через asyncpgsa на каждый запрос
+(как это делалось раньше) с использованием запросов из реестра QUERIES,
+скомпилированных один раз. БД для запуска не требуется.
+
+Запуск:
+    python -m benchmarks.prepared_queries
+"""
+import timeit
+from datetime import date
+
+from asyncpgsa import compile_query
+from sqlalchemy import and_, select
+
+from analyzer.api.services.citizens import CITIZENS_QUERY, CITIZEN_QUERY
+from analyzer.api.services.stats import TOWN_AGE_STATS, TOWN_AGE_STATS_QUERY
+from analyzer.api.views.base import IMPORT_UPDATED_AT_QUERY
+from analyzer.db.schema import citizens_table, imports_table
+
+NUMBER = 2000
+
+CASES = (
+    (
+        "citizen",
+        lambda: compile_query(
+            CITIZENS_QUERY.where(and_(citizens_table.c.import_id == 1, citizens_table.c.citizen_id == 1))
+        ),
+        lambda: CITIZEN_QUERY.make_args({"import_id": 1, "citizen_id": 1}),
+    ),
+    (
+        "import_updated_at",
+        lambda: compile_query(select([imports_table.c.updated_at]).where(imports_table.c.import_id == 1)),
+        lambda: IMPORT_UPDATED_AT_QUERY.make_args({"import_id": 1}),
+    ),
+    (
+        "town_age_stats",
+        lambda: compile_query(TOWN_AGE_STATS.where(citizens_table.c.import_id == 1)),
+        lambda: TOWN_AGE_STATS_QUERY.make_args({"import_id": 1, "current_date": date.today()}),
+    ),
+)
+
+
+def measure(func) -> float:
+    """Возвращает минимальное среднее время одного вызова в микросекундах."""
+    return min(timeit.repeat(func, number=NUMBER, repeat=5)) / NUMBER * 1e6
+
+
+def main():
+    print("{0:<16} {1:>14} {2:>14} {3:>8}".format("query", "compile, us", "prepared, us", "speedup"))
+    for name, compiled, prepared in CASES:
+        compiled_time, prepared_time = measure(compiled), measure(prepared)
+        print(
+            "{0:<16} {1:>14.2f} {2:>14.2f} {3:>7.1f}x".format(
+                name, compiled_time, prepared_time, compiled_time / prepared_time
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
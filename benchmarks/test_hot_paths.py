@@ -0,0 +1,25 @@
+"""
+Случаи из benchmarks/hot_paths.py для pytest-benchmark: сохранение и
+сравнение с базовыми результатами выполняет сам плагин.
+
+    pytest benchmarks/ --benchmark-autosave
+    pytest benchmarks/ --benchmark-compare --benchmark-compare-fail=min:10%
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from benchmarks.hot_paths import make_cases, make_case_func  # noqa: E402
+
+# Случаи создаются без данных, жители генерируются только при запуске тестов
+CASES = make_cases()
+
+
+@pytest.fixture(scope="module")
+def datasets() -> dict:
+    return {}
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case.name for case in CASES])
+def test_hot_path(benchmark, datasets: dict, case) -> None:
+    benchmark(make_case_func(case, datasets))
@@ -45,13 +45,20 @@ setup(
         "Programming Language :: Python :: Implementation :: CPython",
     ],
     python_requires=">=3.7",
-    packages=find_packages(exclude=["tests"]),
+    packages=find_packages(exclude=["tests", "benchmarks"]),
     install_requires=load_requirements("requirements.txt"),
-    extras_require={"dev": load_requirements("requirements.dev.txt")},
+    extras_require={
+        "dev": load_requirements("requirements.dev.txt"),
+        "numpy": ["numpy"],
+        "uvloop": ["uvloop"],
+        "orjson": ["orjson"],
+    },
     entry_points={
         "console_scripts": [
             "{0}-api = {0}.api.__main__:main".format(module_name),
             "{0}-db = {0}.db.__main__:main".format(module_name),
+            "{0}-bench = {0}.bench.__main__:main".format(module_name),
+            "{0}-gen = {0}.gen.__main__:main".format(module_name),
         ]
     },
     include_package_data=True,
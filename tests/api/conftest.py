@@ -10,15 +10,34 @@ from analyzer.api.app import create_app
 
 
 @pytest.fixture
-def arguments(aiomisc_unused_port: int, migrated_postgres: str) -> Namespace:
-    """Аргументы для запуска приложения."""
-    return parser.parse_args(
+def arguments(request, aiomisc_unused_port: int, migrated_postgres: str) -> Namespace:
+    """
+    Аргументы для запуска приложения.
+
+    Значения аргументов переопределяются маркером app_arguments теста (или
+    модуля) и косвенной параметризацией фикстуры словарем:
+        @pytest.mark.app_arguments(pg_pool_max_size=1)
+        @pytest.mark.parametrize("arguments", [{"stats_engine": "sql"}], indirect=True)
+    """
+    args = parser.parse_args(
         [
             "--api-port={0}".format(aiomisc_unused_port),
             "--pg-url={0}".format(migrated_postgres),
         ]
     )
 
+    # Маркеры ближе к тесту имеют приоритет над маркерами модуля
+    overrides = {}
+    for marker in reversed(list(request.node.iter_markers("app_arguments"))):
+        overrides.update(marker.kwargs)
+    overrides.update(getattr(request, "param", {}))
+
+    for name, value in overrides.items():
+        if not hasattr(args, name):
+            raise ValueError("Unknown argument {0!r}".format(name))
+        setattr(args, name, value)
+    return args
+
 
 @pytest.fixture
 async def api_client(aiohttp_client: Callable, arguments: Namespace) -> AsyncGenerator[TestClient, None]:
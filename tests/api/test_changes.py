@@ -0,0 +1,61 @@
+from http import HTTPStatus
+
+from aiohttp.test_utils import TestClient
+from asyncpgsa import PG
+
+from tests.utils.changes import fetch_changes_request
+from tests.utils.citizens import generate_citizen, patch_citizen_request, patch_citizens_request
+from tests.utils.imports import create_import_db
+
+
+async def test_changes(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    """
+    Проверяет, что каждое обновление жителя попадает в журнал изменений,
+    и что журнал можно читать инкрементально.
+    """
+    side_import_id = await create_import_db(dataset=[generate_citizen(citizen_id=1)], conn=migrated_postgres_conn)
+    citizens = [
+        generate_citizen(citizen_id=1, relatives=[2]),
+        generate_citizen(citizen_id=2, relatives=[1]),
+        generate_citizen(citizen_id=3),
+    ]
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+    assert await fetch_changes_request(client=api_client, import_id=import_id) == []
+
+    await patch_citizen_request(
+        client=api_client,
+        import_id=import_id,
+        citizen_id=1,
+        data={"name": "Иванов Иван Иванович", "birth_date": "01.02.1990", "relatives": [3]},
+    )
+    changes = await fetch_changes_request(client=api_client, import_id=import_id)
+    assert [(change["citizen_id"], change["changes"]) for change in changes] == [
+        (1, {"name": "Иванов Иван Иванович", "birth_date": "01.02.1990", "relatives": [3]}),
+        (2, {"relatives": []}),
+        (3, {"relatives": [1]}),
+    ]
+
+    since = changes[-1]["seq"]
+    await patch_citizens_request(
+        client=api_client,
+        import_id=import_id,
+        data=[{"citizen_id": 2, "town": "Москва"}, {"citizen_id": 3, "relatives": [2]}],
+    )
+    changes = await fetch_changes_request(client=api_client, import_id=import_id, since=since)
+    assert [(change["citizen_id"], change["changes"]) for change in changes] == [
+        (2, {"town": "Москва", "relatives": [3]}),
+        (3, {"relatives": [2]}),
+        (1, {"relatives": []}),
+    ]
+    assert all(change["seq"] > since for change in changes)
+
+    assert await fetch_changes_request(client=api_client, import_id=side_import_id) == []
+
+
+async def test_changes_invalid(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    import_id = await create_import_db(dataset=[generate_citizen(citizen_id=1)], conn=migrated_postgres_conn)
+
+    await fetch_changes_request(
+        client=api_client, import_id=import_id, since=-1, expected_status=HTTPStatus.BAD_REQUEST
+    )
+    await fetch_changes_request(client=api_client, import_id=999, expected_status=HTTPStatus.NOT_FOUND)
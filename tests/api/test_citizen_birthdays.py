@@ -1,3 +1,5 @@
+from collections import Counter
+from datetime import datetime
 from typing import List, Dict
 
 import pytest
@@ -5,14 +7,40 @@ from aiohttp.test_utils import TestClient
 from asyncpgsa import PG
 from http import HTTPStatus
 
+from analyzer.utils.consts import DATE_FORMAT
+
 from tests.utils.citizens import (
     generate_citizens,
     generate_citizen,
     get_citizen_birthdays,
+    patch_citizen_request,
 )
 from tests.utils.imports import create_import_db
 
 
+# Расчет с отключенным и включенным кэшем графов родственных связей
+RELATION_GRAPH_CACHE = pytest.mark.parametrize(
+    "arguments",
+    [{"relation_graph_cache_size": 0}, {"relation_graph_cache_size": 32}],
+    ids=["sql", "relation-graph"],
+    indirect=True,
+)
+
+
+def calculate_birthdays(citizens: List[dict]) -> dict:
+    """Рассчитывает ожидаемый ответ обработчика, жители упорядочены по идентификатору."""
+    months = {
+        citizen["citizen_id"]: datetime.strptime(citizen["birth_date"], DATE_FORMAT).month for citizen in citizens
+    }
+
+    values = {}
+    for citizen in sorted(citizens, key=lambda citizen: citizen["citizen_id"]):
+        presents = Counter(months[relative_id] for relative_id in citizen["relatives"])
+        for month, count in sorted(presents.items()):
+            values.setdefault(str(month), []).append({"citizen_id": citizen["citizen_id"], "presents": count})
+    return make_birthdays_response(values)
+
+
 def make_birthdays_response(values: Dict[str, list] = None) -> dict:
     """
     Генерирует словарь, в котором ключи - номера месяцев, а значения - списки
@@ -80,5 +108,68 @@ async def test_citizen_birthdays(
     assert expected_birthdays == birthdays
 
 
+async def test_citizen_birthdays_after_patch(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    """
+    Проверяет, что после изменения выгрузки обработчик не возвращает
+    закэшированный результат, рассчитанный по старым данным.
+    """
+    citizens = [
+        generate_citizen(citizen_id=1, birth_date="31.12.2020", relatives=[2]),
+        generate_citizen(citizen_id=2, birth_date="11.02.2020", relatives=[1]),
+        generate_citizen(citizen_id=3, birth_date="17.03.2020", relatives=[]),
+    ]
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+    birthdays = await get_citizen_birthdays(client=api_client, import_id=import_id)
+    assert birthdays == make_birthdays_response(
+        {"2": [{"citizen_id": 1, "presents": 1}], "12": [{"citizen_id": 2, "presents": 1}]}
+    )
+
+    await patch_citizen_request(
+        client=api_client, import_id=import_id, citizen_id=2, data={"birth_date": "11.05.2020", "relatives": [1, 3]}
+    )
+    birthdays = await get_citizen_birthdays(client=api_client, import_id=import_id)
+    assert birthdays == make_birthdays_response(
+        {
+            "3": [{"citizen_id": 2, "presents": 1}],
+            "5": [{"citizen_id": 1, "presents": 1}, {"citizen_id": 3, "presents": 1}],
+            "12": [{"citizen_id": 2, "presents": 1}],
+        }
+    )
+
+
+@RELATION_GRAPH_CACHE
+async def test_citizen_birthdays_large_import(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    """
+    Проверяет, что на большой выгрузке ответ не зависит от порядка строк в БД:
+    месяцы и жители в них упорядочены, повторные запросы возвращают тот же ответ.
+    """
+    citizens = generate_citizens(citizens_count=1000, relations_count=1500, start_citizen_id=1)
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+    expected_birthdays = calculate_birthdays(citizens)
+
+    for _ in range(2):
+        birthdays = await get_citizen_birthdays(client=api_client, import_id=import_id)
+        assert birthdays == expected_birthdays
+
+
+@RELATION_GRAPH_CACHE
+async def test_citizen_birthdays_month(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    citizens = generate_citizens(citizens_count=300, relations_count=500, start_citizen_id=1)
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+    expected_birthdays = calculate_birthdays(citizens)
+
+    for month in range(1, 13):
+        birthdays = await get_citizen_birthdays(client=api_client, import_id=import_id, params={"month": month})
+        assert birthdays == make_birthdays_response({str(month): expected_birthdays[str(month)]})
+
+
+@pytest.mark.parametrize("month", [0, 13, "may"])
+async def test_citizen_birthdays_invalid_month(api_client: TestClient, migrated_postgres_conn: PG, month) -> None:
+    import_id = await create_import_db(dataset=[generate_citizen()], conn=migrated_postgres_conn)
+    await get_citizen_birthdays(
+        client=api_client, import_id=import_id, params={"month": month}, expected_status=HTTPStatus.BAD_REQUEST
+    )
+
+
 async def test_get_nonexistence_import_birthdays(api_client: TestClient) -> None:
     await get_citizen_birthdays(client=api_client, import_id=999, expected_status=HTTPStatus.NOT_FOUND)
@@ -0,0 +1,115 @@
+from http import HTTPStatus
+
+from aiohttp import hdrs
+from aiohttp.test_utils import TestClient
+from asyncpgsa import PG
+
+from analyzer.api.views import CitizenDetailView
+from tests.utils.base import url_for
+from tests.utils.citizens import (
+    generate_citizen,
+    compare_citizens,
+    fetch_citizen_request,
+    patch_citizen_request,
+)
+from tests.utils.imports import create_import_db
+
+
+async def fetch_etag(client: TestClient, import_id: int, citizen_id: int) -> str:
+    response = await client.get(url_for(CitizenDetailView.URL_PATH, import_id=import_id, citizen_id=citizen_id))
+    assert response.status == HTTPStatus.OK
+    return response.headers[hdrs.ETAG]
+
+
+async def test_fetch_citizen(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    citizen = generate_citizen(citizen_id=1)
+    import_id = await create_import_db(dataset=[citizen], conn=migrated_postgres_conn)
+
+    received_citizen = await fetch_citizen_request(client=api_client, import_id=import_id, citizen_id=1)
+    assert compare_citizens(citizen, received_citizen)
+
+    await fetch_citizen_request(
+        client=api_client, import_id=import_id, citizen_id=2, expected_status=HTTPStatus.NOT_FOUND
+    )
+    assert await fetch_etag(client=api_client, import_id=import_id, citizen_id=1) == '"1"'
+
+
+async def test_patch_citizen_if_match(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    """
+    Проверяет, что условное обновление применяется только к актуальной версии жителя.
+    """
+    citizens = [
+        generate_citizen(citizen_id=1, relatives=[2]),
+        generate_citizen(citizen_id=2, relatives=[1]),
+        generate_citizen(citizen_id=3),
+    ]
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+    etag = await fetch_etag(client=api_client, import_id=import_id, citizen_id=1)
+
+    await patch_citizen_request(
+        client=api_client,
+        import_id=import_id,
+        citizen_id=1,
+        data={"name": "Иванов Иван Иванович"},
+        headers={hdrs.IF_MATCH: etag},
+    )
+    # Повторное обновление с той же версией отклоняется
+    await patch_citizen_request(
+        client=api_client,
+        import_id=import_id,
+        citizen_id=1,
+        data={"name": "Петров Петр Петрович"},
+        headers={hdrs.IF_MATCH: etag},
+        expected_status=HTTPStatus.PRECONDITION_FAILED,
+    )
+    received_citizen = await fetch_citizen_request(client=api_client, import_id=import_id, citizen_id=1)
+    assert received_citizen["name"] == "Иванов Иван Иванович"
+
+    # Изменение родственных связей меняет версии всех затронутых жителей
+    etag = await fetch_etag(client=api_client, import_id=import_id, citizen_id=1)
+    relative_etag = await fetch_etag(client=api_client, import_id=import_id, citizen_id=3)
+    response = await api_client.patch(
+        url_for(CitizenDetailView.URL_PATH, import_id=import_id, citizen_id=1),
+        json={"relatives": [3]},
+        headers={hdrs.IF_MATCH: etag},
+    )
+    assert response.status == HTTPStatus.OK
+    assert response.headers[hdrs.ETAG] != etag
+    assert await fetch_etag(client=api_client, import_id=import_id, citizen_id=3) != relative_etag
+
+
+async def test_patch_citizen_invalid_if_match(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    import_id = await create_import_db(dataset=[generate_citizen(citizen_id=1)], conn=migrated_postgres_conn)
+
+    await patch_citizen_request(
+        client=api_client,
+        import_id=import_id,
+        citizen_id=1,
+        data={"name": "Иванов Иван Иванович"},
+        headers={hdrs.IF_MATCH: '"abc"'},
+        expected_status=HTTPStatus.PRECONDITION_FAILED,
+    )
+    # If-Match сравнивает ETag строго: слабый ETag текущей версии не совпадает
+    await patch_citizen_request(
+        client=api_client,
+        import_id=import_id,
+        citizen_id=1,
+        data={"name": "Иванов Иван Иванович"},
+        headers={hdrs.IF_MATCH: 'W/"1"'},
+        expected_status=HTTPStatus.PRECONDITION_FAILED,
+    )
+    await patch_citizen_request(
+        client=api_client,
+        import_id=import_id,
+        citizen_id=2,
+        data={"name": "Иванов Иван Иванович"},
+        headers={hdrs.IF_MATCH: '"1"'},
+        expected_status=HTTPStatus.NOT_FOUND,
+    )
+    await patch_citizen_request(
+        client=api_client,
+        import_id=import_id,
+        citizen_id=1,
+        data={"name": "Иванов Иван Иванович"},
+        headers={hdrs.IF_MATCH: "*"},
+    )
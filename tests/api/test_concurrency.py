@@ -0,0 +1,46 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+from aiohttp.test_utils import TestClient
+
+from analyzer.api.views import CitizenDetailView, CitizenListView
+from tests.utils.base import url_for
+from tests.utils.citizens import generate_citizens
+from tests.utils.imports import create_import_request
+
+# Одно место в классе bulk и единственное соединение в пуле
+pytestmark = pytest.mark.app_arguments(
+    bulk_concurrency=1, bulk_queue_timeout=0.1, pg_pool_min_size=1, pg_pool_max_size=1
+)
+
+
+async def test_bulk_concurrency(api_client: TestClient) -> None:
+    citizens = generate_citizens(citizens_count=10, relations_count=5, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+    list_url = url_for(CitizenListView.URL_PATH, import_id=import_id)
+    detail_url = url_for(CitizenDetailView.URL_PATH, import_id=import_id, citizen_id=1)
+
+    # Первый потоковый запрос занимает место класса и ждет единственное соединение пула
+    async with api_client.app["db"].pool.acquire():
+        first = asyncio.create_task(api_client.get(list_url))
+        await asyncio.sleep(0.05)
+
+        # Второй запрос класса не дожидается своей очереди
+        response = await api_client.get(list_url)
+        assert response.status == HTTPStatus.SERVICE_UNAVAILABLE
+        assert "Retry-After" in response.headers
+
+        # Запросы других классов не ограничены
+        detail = asyncio.create_task(api_client.get(detail_url))
+
+    response = await first
+    assert response.status == HTTPStatus.OK
+    assert len((await response.json())["data"]) == len(citizens)
+
+    response = await detail
+    assert response.status == HTTPStatus.OK
+
+    # Место освобождается после отправки ответа
+    response = await api_client.get(list_url)
+    assert response.status == HTTPStatus.OK
@@ -0,0 +1,44 @@
+from http import HTTPStatus
+
+import pytest
+from aiohttp.test_utils import TestClient
+
+from analyzer.api.views import CitizenListView, ImportView
+from tests.utils.base import url_for
+
+SWAGGER_URL = "/api/docs/swagger.json"
+
+
+async def test_lazy_docs(api_client: TestClient) -> None:
+    response = await api_client.get(SWAGGER_URL)
+    assert response.status == HTTPStatus.OK
+    spec = await response.json()
+    assert ImportView.URL_PATH in spec["paths"]
+    assert CitizenListView.URL_PATH in spec["paths"]
+
+    # Повторный запрос отдает ту же спецификацию
+    response = await api_client.get(SWAGGER_URL)
+    assert await response.json() == spec
+
+    response = await api_client.get("/")
+    assert response.status == HTTPStatus.OK
+
+
+async def test_lazy_docs_validation(api_client: TestClient) -> None:
+    # Запросы проверяются схемами и до построения спецификации
+    response = await api_client.post(url_for(ImportView.URL_PATH), json={"citizens": [{}]})
+    assert response.status == HTTPStatus.BAD_REQUEST
+    error = await response.json()
+    assert error["code"] == "bad_request"
+    assert "citizens" in error["fields"]
+
+
+@pytest.mark.app_arguments(api_docs="off")
+async def test_docs_off(api_client: TestClient) -> None:
+    for url in (SWAGGER_URL, "/"):
+        response = await api_client.get(url)
+        assert response.status == HTTPStatus.NOT_FOUND
+
+    # Запросы по-прежнему проверяются схемами
+    response = await api_client.post(url_for(ImportView.URL_PATH), json={"citizens": [{}]})
+    assert response.status == HTTPStatus.BAD_REQUEST
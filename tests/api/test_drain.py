@@ -0,0 +1,55 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+from aiohttp.test_utils import TestClient
+
+from analyzer.api.views import CitizenListView, LiveView, ReadyView
+from tests.utils.base import url_for
+from tests.utils.citizens import generate_citizens
+from tests.utils.imports import create_import_request
+
+# Единственное соединение в пуле
+pytestmark = pytest.mark.app_arguments(shutdown_timeout=5, pg_pool_min_size=1, pg_pool_max_size=1)
+
+
+async def test_drain(api_client: TestClient) -> None:
+    citizens = generate_citizens(citizens_count=100, relations_count=10, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+    drainer = api_client.app["drainer"]
+
+    # Запрос ждет единственное соединение пула, остановка ждет запрос
+    async with api_client.app["db"].pool.acquire():
+        request = asyncio.create_task(api_client.get(url_for(CitizenListView.URL_PATH, import_id=import_id)))
+        await asyncio.sleep(0.05)
+        drain = asyncio.create_task(drainer.drain())
+        await asyncio.sleep(0.05)
+        assert not drain.done()
+
+        # Балансировщик перестает направлять запросы в останавливающийся процесс
+        response = await api_client.get(ReadyView.URL_PATH)
+        assert response.status == HTTPStatus.SERVICE_UNAVAILABLE
+        response = await api_client.get(LiveView.URL_PATH)
+        assert response.status == HTTPStatus.OK
+
+    response = await request
+    assert response.status == HTTPStatus.OK
+    assert len((await response.json())["data"]) == len(citizens)
+
+    await asyncio.wait_for(drain, timeout=1)
+    assert drainer.in_flight == 0
+
+
+async def test_drain_timeout(api_client: TestClient) -> None:
+    drainer = api_client.app["drainer"]
+    drainer.timeout = 0.1
+
+    async with api_client.app["db"].pool.acquire():
+        request = asyncio.create_task(api_client.get(url_for(CitizenListView.URL_PATH, import_id=1)))
+        await asyncio.sleep(0.05)
+
+        # Запросы, не завершившиеся за timeout, не задерживают остановку
+        await asyncio.wait_for(drainer.drain(), timeout=1)
+        assert drainer.in_flight == 1
+
+    await request
@@ -0,0 +1,74 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+from aiohttp.test_utils import TestClient
+
+from analyzer.api.views import CitizenListView, LiveView, MetricsView, ReadyView
+from tests.utils.base import url_for
+from tests.utils.citizens import generate_citizens
+from tests.utils.imports import create_import_request
+
+# Контроль допуска с единственным соединением в пуле
+ADMISSION = pytest.mark.app_arguments(
+    admission_max_in_flight=2,
+    admission_max_pool_wait=100,
+    admission_retry_after=3,
+    pg_pool_min_size=1,
+    pg_pool_max_size=1,
+)
+
+
+async def assert_overloaded(client: TestClient, import_id: int) -> None:
+    for path in (url_for(CitizenListView.URL_PATH, import_id=import_id), ReadyView.URL_PATH):
+        response = await client.get(path)
+        assert response.status == HTTPStatus.SERVICE_UNAVAILABLE
+        assert response.headers["Retry-After"] == "3"
+        assert (await response.json())["code"] == "service_unavailable"
+
+    # Проверки здоровья и метрики принимаются и при перегрузке
+    for path in (LiveView.URL_PATH, MetricsView.URL_PATH):
+        response = await client.get(path)
+        assert response.status == HTTPStatus.OK
+
+
+async def test_health(api_client: TestClient) -> None:
+    for path in (LiveView.URL_PATH, ReadyView.URL_PATH):
+        response = await api_client.get(path)
+        assert response.status == HTTPStatus.OK
+        assert await response.json() == {"status": "ok"}
+
+
+@ADMISSION
+async def test_in_flight_limit(api_client: TestClient) -> None:
+    citizens = generate_citizens(citizens_count=10, relations_count=5, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+
+    admission = api_client.app["admission"]
+    admission.in_flight = admission.max_in_flight
+    try:
+        await assert_overloaded(api_client, import_id)
+    finally:
+        admission.in_flight = 0
+
+    response = await api_client.get(url_for(CitizenListView.URL_PATH, import_id=import_id))
+    assert response.status == HTTPStatus.OK
+
+
+@ADMISSION
+async def test_pool_wait_limit(api_client: TestClient) -> None:
+    citizens = generate_citizens(citizens_count=10, relations_count=5, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+
+    # Единственное соединение пула занято, запрос ждет его дольше порога
+    async with api_client.app["db"].pool.acquire():
+        waiting = asyncio.create_task(api_client.get(url_for(CitizenListView.URL_PATH, import_id=import_id)))
+        await asyncio.sleep(0.2)
+        await assert_overloaded(api_client, import_id)
+
+    # Запрос, принятый до перегрузки, обрабатывается
+    response = await waiting
+    assert response.status == HTTPStatus.OK
+
+    response = await api_client.get(ReadyView.URL_PATH)
+    assert response.status == HTTPStatus.OK
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http import HTTPStatus
+
+import pytest
+from aiohttp import hdrs
+from aiohttp.test_utils import TestClient, make_mocked_request
+
+from analyzer.api.views import ChangeListView, CitizenBirthdayView, CitizenDetailView, CitizenListView, TownAgeStatView
+from analyzer.api.views.base import is_not_modified
+from tests.utils.base import url_for
+from tests.utils.citizens import generate_citizens, patch_citizen_request
+from tests.utils.imports import create_import_request
+
+
+@pytest.mark.parametrize(
+    "path", (CitizenListView.URL_PATH, CitizenBirthdayView.URL_PATH, ChangeListView.URL_PATH, TownAgeStatView.URL_PATH)
+)
+async def test_import_cache_headers(api_client: TestClient, path: str) -> None:
+    citizens = generate_citizens(citizens_count=10, relations_count=5, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+    url = url_for(path, import_id=import_id)
+
+    response = await api_client.get(url)
+    assert response.status == HTTPStatus.OK
+    assert response.headers[hdrs.CACHE_CONTROL] == "public, no-cache"
+    etag, last_modified = response.headers[hdrs.ETAG], response.headers[hdrs.LAST_MODIFIED]
+
+    # Пока выгрузка не изменялась, сохраненный ответ актуален
+    for headers in ({hdrs.IF_NONE_MATCH: etag}, {hdrs.IF_NONE_MATCH: 'W/"1", ' + etag}):
+        response = await api_client.get(url, headers=headers)
+        assert response.status == HTTPStatus.NOT_MODIFIED
+        assert response.headers[hdrs.ETAG] == etag
+        assert await response.read() == b""
+
+    # Выгрузка не изменялась начиная со следующей секунды
+    next_second = format_datetime(parsedate_to_datetime(last_modified) + timedelta(seconds=1), usegmt=True)
+    response = await api_client.get(url, headers={hdrs.IF_MODIFIED_SINCE: next_second})
+    assert response.status == HTTPStatus.NOT_MODIFIED
+
+    # Изменение жителя меняет ETag всех ответов выгрузки
+    await patch_citizen_request(client=api_client, import_id=import_id, citizen_id=1, data={"name": "Иванов Иван"})
+    response = await api_client.get(url, headers={hdrs.IF_NONE_MATCH: etag})
+    assert response.status == HTTPStatus.OK
+    assert response.headers[hdrs.ETAG] != etag
+
+    # Изменение позже сохраненного Last-Modified, даже в ту же секунду
+    response = await api_client.get(url, headers={hdrs.IF_MODIFIED_SINCE: last_modified})
+    assert response.status == HTTPStatus.OK
+
+    response = await api_client.get(url_for(path, import_id=import_id + 1), headers={hdrs.IF_NONE_MATCH: "*"})
+    assert response.status == HTTPStatus.NOT_FOUND
+
+
+async def test_citizen_cache_headers(api_client: TestClient) -> None:
+    citizens = generate_citizens(citizens_count=2, relations_count=1, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+    url = url_for(CitizenDetailView.URL_PATH, import_id=import_id, citizen_id=1)
+
+    response = await api_client.get(url)
+    etag = response.headers[hdrs.ETAG]
+    response = await api_client.get(url, headers={hdrs.IF_NONE_MATCH: etag})
+    assert response.status == HTTPStatus.NOT_MODIFIED
+
+    # ETag жителя - его версия, изменение другого жителя его не меняет
+    await patch_citizen_request(client=api_client, import_id=import_id, citizen_id=2, data={"name": "Иванов Иван"})
+    response = await api_client.get(url, headers={hdrs.IF_NONE_MATCH: etag})
+    assert response.status == HTTPStatus.NOT_MODIFIED
+
+
+@pytest.mark.parametrize(
+    "last_modified,expected",
+    (
+        # Выгрузка создана в 12:00:00.1, клиент сохранил Last-Modified: 12:00:00
+        (datetime(2020, 1, 1, 12, 0, 0, 100000, tzinfo=timezone.utc), False),
+        # Изменение в ту же секунду
+        (datetime(2020, 1, 1, 12, 0, 0, 500000, tzinfo=timezone.utc), False),
+        # Время изменения кратно секунде и совпадает с Last-Modified
+        (datetime(2020, 1, 1, 12, 0, 0, tzinfo=timezone.utc), True),
+        (datetime(2020, 1, 1, 11, 59, 59, 900000, tzinfo=timezone.utc), True),
+    ),
+)
+def test_if_modified_since_same_second(last_modified: datetime, expected: bool) -> None:
+    request = make_mocked_request("GET", "/", headers={hdrs.IF_MODIFIED_SINCE: "Wed, 01 Jan 2020 12:00:00 GMT"})
+    assert is_not_modified(request, etag='"1"', last_modified=last_modified) is expected
@@ -0,0 +1,58 @@
+import json
+from datetime import date
+from decimal import Decimal
+from http import HTTPStatus
+
+import pytest
+from aiohttp.test_utils import TestClient
+
+from analyzer.api.payloads import JSON_BACKENDS
+from analyzer.api.views import CitizenListView, ImportView
+from tests.utils.base import url_for
+from tests.utils.citizens import generate_citizens, compare_citizen_groups, fetch_citizens_request
+from tests.utils.imports import create_import_request
+
+VALUES = [
+    {"data": {"import_id": 1}},
+    {"data": [{"citizen_id": 1, "birth_date": date(2020, 2, 29), "relatives": [2, 3]}]},
+    {"data": [{"town": "Москва", "p50": Decimal("30.5"), "p75": 45.25, "p99": Decimal("99.99")}]},
+    {"data": {str(month): [] for month in range(1, 13)}},
+    {"code": "bad_request", "message": 'Кавычки " и \\ и управляющие символы \x01\n\t', "fields": {"a": ["b"]}},
+    {"data": [0, -1, 2147483647, 0.1, 1.5, None, True, False, "😀"]},
+]
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_json_backends_output_is_identical(value) -> None:
+    """Ответы не должны зависеть от выбранной библиотеки сериализации."""
+    assert JSON_BACKENDS["json"].dumps(value) == JSON_BACKENDS["orjson"].dumps(value)
+
+
+# Приложение с каждой из установленных библиотек JSON
+ALL_JSON_BACKENDS = pytest.mark.parametrize(
+    "arguments", [{"json_backend": name} for name in JSON_BACKENDS], ids=list(JSON_BACKENDS), indirect=True
+)
+
+
+@ALL_JSON_BACKENDS
+async def test_json_backend_roundtrip(api_client: TestClient) -> None:
+    citizens = generate_citizens(citizens_count=50, relations_count=20, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+
+    imported_citizens = await fetch_citizens_request(client=api_client, import_id=import_id)
+    assert compare_citizen_groups(left=citizens, right=imported_citizens)
+
+    # Потоковый ответ записывается построчно, но должен совпадать с ответом,
+    # сериализованным целиком
+    response = await api_client.get(url_for(CitizenListView.URL_PATH, import_id=import_id))
+    body = await response.read()
+    assert body == JSON_BACKENDS["json"].dumps(json.loads(body))
+
+
+@ALL_JSON_BACKENDS
+@pytest.mark.parametrize("body", [b"{", b"\xff\xfe\x00", b'{"citizens": [}'])
+async def test_json_backend_invalid_body(api_client: TestClient, body: bytes) -> None:
+    response = await api_client.post(
+        url_for(ImportView.URL_PATH), data=body, headers={"Content-Type": "application/json"}
+    )
+    assert response.status == HTTPStatus.BAD_REQUEST
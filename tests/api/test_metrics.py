@@ -0,0 +1,88 @@
+import asyncio
+import re
+from http import HTTPStatus
+from typing import Dict
+from unittest.mock import patch
+
+from aiohttp.test_utils import TestClient
+
+from analyzer.api.payloads import AsyncGenJSONListPayload
+from analyzer.api.views import MetricsView
+from analyzer.utils.metrics import CONTENT_TYPE
+from tests.utils.citizens import generate_citizens, fetch_citizens_request
+from tests.utils.imports import create_import_request
+
+# Строка метрики: имя, необязательные метки и значение
+SAMPLE_LINE = re.compile(
+    r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]\w*="([^"\\]|\\.)*",?)*\})? [-+]?(\d+(\.\d*)?(e[-+]?\d+)?|\+Inf)$'
+)
+
+# Задержка записи тела потокового ответа в тесте длительности запроса
+WRITE_DELAY = 0.2
+
+
+async def fetch_metrics(client: TestClient) -> Dict[str, float]:
+    """Возвращает значения метрик по строке с именем и метками."""
+    response = await client.get(MetricsView.URL_PATH)
+    assert response.status == HTTPStatus.OK
+    assert response.headers["Content-Type"] == CONTENT_TYPE
+
+    metrics = {}
+    for line in (await response.text()).splitlines():
+        if line.startswith("# HELP ") or line.startswith("# TYPE "):
+            continue
+        assert SAMPLE_LINE.match(line), line
+        sample, value = line.rsplit(" ", 1)
+        metrics[sample] = float(value)
+    return metrics
+
+
+async def test_metrics(api_client: TestClient) -> None:
+    # Метрики общие для процесса, поэтому проверяются приращения
+    before = await fetch_metrics(api_client)
+
+    citizens = generate_citizens(citizens_count=10, relations_count=5, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+    await fetch_citizens_request(client=api_client, import_id=import_id)
+    await fetch_citizens_request(client=api_client, import_id=999, expected_status=HTTPStatus.NOT_FOUND)
+
+    after = await fetch_metrics(api_client)
+
+    def delta(sample: str) -> float:
+        return after.get(sample, 0) - before.get(sample, 0)
+
+    # Путь - шаблон маршрута, а не URL с идентификатором выгрузки
+    requests = (
+        "analyzer_http_request_duration_seconds_count"
+        '{{method="GET",path="/imports/{{import_id}}/citizens",status="{0}"}}'
+    )
+    assert delta(requests.format(200)) == 1
+    assert delta(requests.format(404)) == 1
+    assert delta("analyzer_import_citizens_count") == 1
+    assert delta("analyzer_import_citizens_sum") == len(citizens)
+    assert delta('analyzer_http_streamed_bytes_total{root_object="data"}') > 0
+    assert delta('analyzer_db_pool_acquire_seconds_count{pool="primary"}') > 0
+    # Все соединения возвращены в пул
+    assert after['analyzer_db_pool_connections_in_use{pool="primary"}'] == 0
+
+
+async def test_streamed_request_duration(api_client: TestClient) -> None:
+    citizens = generate_citizens(citizens_count=10, relations_count=5, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+    before = await fetch_metrics(api_client)
+
+    # Тело потокового ответа пишется после того, как обработчик вернул ответ
+    write = AsyncGenJSONListPayload.write
+
+    async def slow_write(self, writer) -> None:
+        await asyncio.sleep(WRITE_DELAY)
+        await write(self, writer)
+
+    with patch.object(AsyncGenJSONListPayload, "write", slow_write):
+        await fetch_citizens_request(client=api_client, import_id=import_id)
+
+    after = await fetch_metrics(api_client)
+    duration = (
+        'analyzer_http_request_duration_seconds_sum{method="GET",path="/imports/{import_id}/citizens",status="200"}'
+    )
+    assert after[duration] - before.get(duration, 0) >= WRITE_DELAY
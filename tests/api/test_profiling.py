@@ -0,0 +1,85 @@
+import re
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from aiohttp.test_utils import TestClient
+from configargparse import Namespace
+
+from analyzer.api.profiling import PROFILE_HEADER, PROFILE_ID_HEADER, Profiler
+from analyzer.api.views import CitizenListView
+from analyzer.api.views.profiles import ProfileView
+from tests.utils.base import url_for
+from tests.utils.citizens import generate_citizens
+from tests.utils.imports import create_import_request
+
+TOKEN = "secret"
+
+# Строка профиля в формате collapsed: кадры через точку с запятой и количество
+COLLAPSED_LINE = re.compile(r"^[^;]+;\[(running|waiting)\](;[^;]+)* \d+$")
+
+
+# Профилирование запросов с заголовком, содержащим токен
+PROFILING = pytest.mark.app_arguments(profiling_token=TOKEN)
+
+
+@pytest.fixture
+def arguments(arguments: Namespace, tmp_path: Path) -> Namespace:
+    arguments.profiling_dir = str(tmp_path)
+    return arguments
+
+
+@PROFILING
+async def test_profiling(api_client: TestClient) -> None:
+    citizens = generate_citizens(citizens_count=1000, relations_count=100, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+
+    # Без заголовка запрос не профилируется
+    response = await api_client.get(url_for(CitizenListView.URL_PATH, import_id=import_id))
+    assert response.status == HTTPStatus.OK
+    assert PROFILE_ID_HEADER not in response.headers
+
+    response = await api_client.get(
+        url_for(CitizenListView.URL_PATH, import_id=import_id), headers={PROFILE_HEADER: TOKEN}
+    )
+    assert response.status == HTTPStatus.OK
+    assert len((await response.json())["data"]) == len(citizens)
+    profile_id = response.headers[PROFILE_ID_HEADER]
+
+    url = url_for(ProfileView.URL_PATH, profile_id=profile_id)
+    response = await api_client.get(url)
+    assert response.status == HTTPStatus.FORBIDDEN
+
+    response = await api_client.get(url, headers={PROFILE_HEADER: TOKEN})
+    assert response.status == HTTPStatus.OK
+    profile = await response.text()
+    assert profile
+    for line in profile.splitlines():
+        assert COLLAPSED_LINE.match(line), line
+
+
+@PROFILING
+async def test_profiling_error_response(api_client: TestClient) -> None:
+    response = await api_client.get(url_for(CitizenListView.URL_PATH, import_id=999), headers={PROFILE_HEADER: TOKEN})
+    assert response.status == HTTPStatus.NOT_FOUND
+    assert PROFILE_ID_HEADER in response.headers
+
+
+async def test_profiling_disabled(api_client: TestClient) -> None:
+    response = await api_client.get(url_for(ProfileView.URL_PATH, profile_id="0" * 32), headers={PROFILE_HEADER: TOKEN})
+    assert response.status == HTTPStatus.NOT_FOUND
+
+
+def test_profiles_retention(tmp_path: Path) -> None:
+    # Профиль, оставшийся от предыдущего запуска, удаляется первым
+    (tmp_path / "0.folded").write_text("stale")
+    profiler = Profiler(token=TOKEN, sample_rate=0, directory=str(tmp_path), max_files=2)
+
+    for profile_id in ("1", "2"):
+        profiler.save(profile_id, profile_id)
+    assert profiler.load("0") is None
+    assert [profiler.load(profile_id) for profile_id in ("1", "2")] == ["1", "2"]
+
+    profiler.save("3", "3")
+    assert profiler.load("1") is None
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["2.folded", "3.folded"]
@@ -0,0 +1,73 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+from aiohttp.test_utils import TestClient
+from configargparse import Namespace
+from yarl import URL
+
+from analyzer.utils.db import ReplicaSet
+from tests.api.test_metrics import fetch_metrics
+from tests.utils.citizens import fetch_citizens_request, generate_citizens, patch_citizen_request
+from tests.utils.imports import create_import_request
+
+REPLICA_ACQUIRES = 'analyzer_db_pool_acquire_seconds_count{pool="replica0"}'
+
+# Отставание реплики, которой является основная БД, всегда 0, поэтому
+# изменения читаются из основной БД только в течение интервала проверок
+pytestmark = pytest.mark.app_arguments(
+    pg_replica_pool_min_size=2, pg_replica_pool_max_size=2, pg_replica_max_lag=0, pg_replica_check_interval=0.2
+)
+
+
+@pytest.fixture
+def arguments(arguments: Namespace) -> Namespace:
+    """Аргументы приложения, использующего основную БД в качестве реплики."""
+    arguments.pg_replica_url = [URL(str(arguments.pg_url))]
+    return arguments
+
+
+def get_replicas(client: TestClient) -> ReplicaSet:
+    return client.server.app["db_replicas"]
+
+
+async def test_reads_from_replica(api_client: TestClient) -> None:
+    replicas = get_replicas(api_client)
+    assert replicas.healthy == replicas.replicas
+
+    citizens = generate_citizens(citizens_count=10, relations_count=5, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+    # Только что загруженная выгрузка читается из основной БД
+    assert replicas.reader(import_id) is replicas.primary
+
+    # После того как изменения гарантированно дошли до реплики - из реплики
+    await asyncio.sleep(replicas.write_window)
+    assert replicas.reader(import_id) is replicas.replicas[0]
+
+    before = await fetch_metrics(api_client)
+    assert len(await fetch_citizens_request(client=api_client, import_id=import_id)) == len(citizens)
+    after = await fetch_metrics(api_client)
+    assert after[REPLICA_ACQUIRES] > before.get(REPLICA_ACQUIRES, 0)
+
+    # Изменение снова направляет чтение выгрузки в основную БД
+    await patch_citizen_request(client=api_client, import_id=import_id, citizen_id=1, data={"name": "Иван"})
+    assert replicas.reader(import_id) is replicas.primary
+
+
+async def test_unhealthy_replica(api_client: TestClient) -> None:
+    replicas = get_replicas(api_client)
+
+    # Реплика с закрытым пулом не проходит проверку и исключается из чтения
+    await replicas.replicas[0].pool.close()
+    await replicas.check_health()
+    assert replicas.healthy == []
+    assert replicas.reader() is replicas.primary
+
+    citizens = generate_citizens(citizens_count=10, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+    await asyncio.sleep(replicas.write_window)
+    assert len(await fetch_citizens_request(client=api_client, import_id=import_id)) == len(citizens)
+
+
+async def test_import_missing_in_replica(api_client: TestClient) -> None:
+    await fetch_citizens_request(client=api_client, import_id=999, expected_status=HTTPStatus.NOT_FOUND)
@@ -0,0 +1,60 @@
+import logging
+from typing import Generator
+
+import pytest
+from aiohttp.test_utils import TestClient
+
+from analyzer.utils.slow_queries import SLOW_QUERY_LOG
+from tests.utils.citizens import generate_citizens, fetch_citizens_request, patch_citizen_request
+from tests.utils.imports import create_import_request
+
+# Приложение считает медленными все запросы и снимает план для каждого
+pytestmark = pytest.mark.app_arguments(
+    pg_slow_query_threshold=0.000001, pg_explain_sample_rate=1, pg_explain_interval=0
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_slow_query_log() -> Generator[None, None, None]:
+    """Журнал медленных запросов общий для процесса, приложение настраивает его при запуске."""
+    yield
+    SLOW_QUERY_LOG.configure(threshold=None, explain_sample_rate=0, explain_interval=60)
+
+
+async def test_slow_query_log(api_client: TestClient, caplog) -> None:
+    citizens = generate_citizens(citizens_count=10, start_citizen_id=1)
+    import_id = await create_import_request(client=api_client, citizens=citizens)
+
+    with caplog.at_level(logging.WARNING, logger="analyzer.utils.slow_queries"):
+        # Потоковая выборка жителей через курсор
+        imported_citizens = await fetch_citizens_request(client=api_client, import_id=import_id)
+        # Изменение жителя: план снимается без выполнения, изменения не дублируются
+        await patch_citizen_request(client=api_client, import_id=import_id, citizen_id=1, data={"name": "Иван"})
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith("Slow query 'import_citizens'") for message in messages)
+    assert any(
+        message.startswith("Plan of slow query 'import_citizens'") and "actual time" in message for message in messages
+    )
+    assert not any(record.levelno >= logging.ERROR for record in caplog.records)
+
+    # Запросы с EXPLAIN откатываются и не меняют данные
+    assert len(await fetch_citizens_request(client=api_client, import_id=import_id)) == len(imported_citizens)
+
+
+async def test_slow_import_insert(api_client: TestClient, caplog) -> None:
+    citizens = generate_citizens(citizens_count=10, relations_count=5, start_citizen_id=1)
+
+    with caplog.at_level(logging.WARNING, logger="analyzer.utils.slow_queries"):
+        # Вставка выгрузки выполняется напрямую через соединение, без реестра запросов
+        import_id = await create_import_request(client=api_client, citizens=citizens)
+
+    messages = [record.getMessage() for record in caplog.records]
+    for table in ("citizens", "relations"):
+        query = "'INSERT INTO {0} ".format(table)
+        assert any(message.startswith("Slow query " + query) for message in messages)
+        assert any(message.startswith("Plan of slow query " + query) for message in messages)
+    assert not any(record.levelno >= logging.ERROR for record in caplog.records)
+
+    # Вставка с EXPLAIN не дублирует жителей
+    assert len(await fetch_citizens_request(client=api_client, import_id=import_id)) == len(citizens)
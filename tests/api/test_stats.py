@@ -1,3 +1,4 @@
+from datetime import timedelta
 from http import HTTPStatus
 from typing import List
 from unittest.mock import patch
@@ -8,16 +9,26 @@ from asyncpgsa import PG
 
 from tests.utils.citizens import (
     generate_citizen,
+    patch_citizen_request,
 )
 from tests.utils.imports import create_import_db
 from tests.utils.stats import (
     get_town_age_statistics,
+    get_town_age_quantiles,
     age2date,
     make_expected_age_stats,
+    make_expected_age_quantiles,
     compare_age_stats,
     CURRENT_DATE,
 )
 
+
+# Расчет статистики в PostgreSQL и с помощью NumPy
+STATS_ENGINES = pytest.mark.parametrize(
+    "arguments", [{"stats_engine": "sql"}, {"stats_engine": "numpy"}], ids=["sql", "numpy"], indirect=True
+)
+
+
 datasets = [
     # Несколько жителей у которых завтра день рождения.
     # Проверяется что обработчик использует в рассчетах количество полных лет.
@@ -30,14 +41,36 @@ datasets = [
     # Проверяет краевой случай, возраст жителя у которого сегодня день рождения
     # не должен рассчитаться как на 1 год меньше.
     [generate_citizen(birth_date=age2date(years=10), town="Псков")],
+    # Жители нескольких городов, у части которых день рождения 29 февраля.
+    # Проверяет, что перцентили интерполируются и округляются одинаково
+    # в обоих движках.
+    sorted(
+        [
+            generate_citizen(citizen_id=i, birth_date=age2date(years=i % 70 + 1, days=i * 7 % 365), town=town)
+            for i, town in enumerate(["Москва", "Псков", "Тверь"] * 40, start=1)
+        ]
+        + [generate_citizen(citizen_id=1000, birth_date="29.02.2016", town="Тверь")],
+        key=lambda citizen: citizen["town"],
+    ),
+    # Города с названиями в разном регистре, с буквой Ё и знаками препинания.
+    # Правила сортировки БД упорядочили бы их иначе, чем NumPy: порядок
+    # городов должен совпадать во всех движках.
+    sorted(
+        [
+            generate_citizen(citizen_id=i, birth_date=age2date(years=i * 3), town=town)
+            for i, town in enumerate(["москва", "Москва", "Ёлкино", "Елово", "Санкт-Петербург", "Санкт Петербург"], 1)
+        ],
+        key=lambda citizen: citizen["town"],
+    ),
     # Пустая выгрузка.
     # Обработчик не должен падать на пустой выгрузке.
     [],
 ]
 
 
+@STATS_ENGINES
 @pytest.mark.parametrize("citizens", datasets)
-@patch("analyzer.api.services.stats.CURRENT_DATE", new=CURRENT_DATE)
+@patch("analyzer.api.services.stats.get_current_date", new=CURRENT_DATE.date)
 async def test_get_town_age_statistics(
     api_client: TestClient, migrated_postgres_conn: PG, citizens: List[dict]
 ) -> None:
@@ -55,3 +88,116 @@ async def test_get_town_age_statistics(
 
 async def test_get_nonexistence_import_town_age_stats(api_client: TestClient) -> None:
     await get_town_age_statistics(client=api_client, import_id=999, expected_status=HTTPStatus.NOT_FOUND)
+
+
+@patch("analyzer.api.services.stats.get_current_date", new=CURRENT_DATE.date)
+async def test_town_age_statistics_invalidation(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    """
+    Проверяет, что сохраненная статистика пересчитывается после изменения
+    даты рождения или города жителя, но не после изменения других полей.
+    """
+    citizens = [
+        generate_citizen(citizen_id=1, birth_date=age2date(years=10), town="Москва"),
+        generate_citizen(citizen_id=2, birth_date=age2date(years=20), town="Москва"),
+    ]
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+    stats = await get_town_age_statistics(client=api_client, import_id=import_id)
+    assert compare_age_stats(left=stats, right=make_expected_age_stats(citizens))
+
+    await patch_citizen_request(client=api_client, import_id=import_id, citizen_id=1, data={"name": "Иван"})
+    assert stats == await get_town_age_statistics(client=api_client, import_id=import_id)
+
+    for data in ({"birth_date": age2date(years=30)}, {"town": "Псков"}):
+        citizens[1].update(data)
+        await patch_citizen_request(client=api_client, import_id=import_id, citizen_id=2, data=data)
+        stats = await get_town_age_statistics(client=api_client, import_id=import_id)
+        assert compare_age_stats(left=stats, right=make_expected_age_stats(citizens))
+
+
+async def test_town_age_statistics_next_day(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    """
+    Проверяет, что сохраненная статистика пересчитывается со сменой даты.
+    """
+    citizens = [generate_citizen(birth_date=age2date(years=10), town="Москва")]
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+
+    with patch("analyzer.api.services.stats.get_current_date", new=lambda: CURRENT_DATE.date() - timedelta(days=1)):
+        stats = await get_town_age_statistics(client=api_client, import_id=import_id)
+        assert stats[0]["p50"] == 9
+
+    with patch("analyzer.api.services.stats.get_current_date", new=CURRENT_DATE.date):
+        stats = await get_town_age_statistics(client=api_client, import_id=import_id)
+        assert stats[0]["p50"] == 10
+
+
+@STATS_ENGINES
+@pytest.mark.parametrize("citizens", datasets)
+@patch("analyzer.api.services.stats.get_current_date", new=CURRENT_DATE.date)
+async def test_get_town_age_quantiles(api_client: TestClient, migrated_postgres_conn: PG, citizens: List[dict]) -> None:
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+
+    quantiles = [0, 0.1, 0.5, 0.95, 1]
+    stats = await get_town_age_quantiles(client=api_client, import_id=import_id, quantiles=quantiles)
+    assert compare_age_stats(left=stats, right=make_expected_age_quantiles(citizens, quantiles))
+
+
+@pytest.mark.parametrize("query", [{"q": "1.5"}, {"q": "-0.1"}, {"q": "abc"}, {"q": ""}, {"approximate": "maybe"}])
+async def test_get_town_age_quantiles_invalid(api_client: TestClient, migrated_postgres_conn: PG, query: dict) -> None:
+    import_id = await create_import_db(dataset=[generate_citizen()], conn=migrated_postgres_conn)
+    await get_town_age_statistics(
+        client=api_client, import_id=import_id, expected_status=HTTPStatus.BAD_REQUEST, params=query
+    )
+
+
+@pytest.mark.parametrize("citizens", datasets)
+@patch("analyzer.api.services.sketches.get_current_date", new=CURRENT_DATE.date)
+async def test_get_town_age_quantiles_approximate(
+    api_client: TestClient, migrated_postgres_conn: PG, citizens: List[dict]
+) -> None:
+    """
+    Приближенные квантили - целое количество полных лет, отличающееся от
+    точного значения не больше чем на год.
+    """
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+
+    quantiles = [0, 0.5, 0.99, 1]
+    stats = await get_town_age_quantiles(client=api_client, import_id=import_id, quantiles=quantiles, approximate=True)
+    expected_stats = make_expected_age_quantiles(citizens, quantiles)
+    assert [item["town"] for item in stats] == [item["town"] for item in expected_stats]
+    for item, expected_item in zip(stats, expected_stats):
+        for q, value in item["quantiles"].items():
+            assert value == int(value)
+            assert abs(value - expected_item["quantiles"][q]) <= 1
+
+    # Квантили по умолчанию возвращаются в обычном формате
+    stats = await get_town_age_quantiles(client=api_client, import_id=import_id, approximate=True)
+    assert [item["town"] for item in stats] == [item["town"] for item in expected_stats]
+
+
+@patch("analyzer.api.services.sketches.get_current_date", new=CURRENT_DATE.date)
+async def test_town_age_sketches_invalidation(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    """
+    Проверяет, что распределения прежнего и нового города перестраиваются
+    после изменения даты рождения или города жителя.
+    """
+    citizens = [
+        generate_citizen(citizen_id=1, birth_date=age2date(years=10), town="Москва"),
+        generate_citizen(citizen_id=2, birth_date=age2date(years=20), town="Москва"),
+        generate_citizen(citizen_id=3, birth_date=age2date(years=30), town="Москва"),
+    ]
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+    stats = await get_town_age_quantiles(client=api_client, import_id=import_id, quantiles=[0.5], approximate=True)
+    assert stats == [{"town": "Москва", "quantiles": {"0.5": 20}}]
+
+    await patch_citizen_request(
+        client=api_client, import_id=import_id, citizen_id=2, data={"birth_date": age2date(years=25)}
+    )
+    stats = await get_town_age_quantiles(client=api_client, import_id=import_id, quantiles=[0.5], approximate=True)
+    assert stats == [{"town": "Москва", "quantiles": {"0.5": 25}}]
+
+    for citizen_id in (1, 2, 3):
+        await patch_citizen_request(
+            client=api_client, import_id=import_id, citizen_id=citizen_id, data={"town": "Псков"}
+        )
+    stats = await get_town_age_quantiles(client=api_client, import_id=import_id, quantiles=[0.5], approximate=True)
+    assert stats == [{"town": "Псков", "quantiles": {"0.5": 25}}]
@@ -116,6 +116,35 @@ async def test_patch_self_relative_citizen(api_client: TestClient, migrated_post
     assert compare_citizens(left=citizen, right=updated_citizen)
 
 
+async def test_patch_citizen_many_relatives(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    """Проверяем замену сотен родственных связей одним запросом."""
+    citizens = [generate_citizen(citizen_id=citizen_id) for citizen_id in range(1, 602)]
+
+    # Житель #1 - родственник жителей #2..#301
+    citizens[0]["relatives"] = list(range(2, 302))
+    for citizen in citizens[1:301]:
+        citizen["relatives"] = [1]
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+
+    # Заменяем родственников жителя #1 на жителей #302..#601
+    citizens[0]["relatives"] = list(range(302, 602))
+    for citizen in citizens[1:301]:
+        citizen["relatives"] = []
+    for citizen in citizens[301:]:
+        citizen["relatives"] = [1]
+
+    updated_citizen = await patch_citizen_request(
+        client=api_client,
+        import_id=import_id,
+        citizen_id=1,
+        data={"relatives": citizens[0]["relatives"]},
+    )
+    assert compare_citizens(left=citizens[0], right=updated_citizen)
+
+    received_citizens = await fetch_citizens_request(client=api_client, import_id=import_id)
+    assert compare_citizen_groups(left=citizens, right=received_citizens)
+
+
 invalid_cases = [
     # Сервис должен запрещать устанавливать дату рождения в будущем.
     {"birth_date": (date.today() + timedelta(days=1)).strftime(DATE_FORMAT)},
@@ -0,0 +1,130 @@
+from http import HTTPStatus
+
+import pytest
+from aiohttp.test_utils import TestClient
+from asyncpgsa import PG
+
+from tests.utils.citizens import (
+    generate_citizen,
+    generate_citizens,
+    compare_citizen_groups,
+    fetch_citizens_request,
+    patch_citizens_request,
+)
+from tests.utils.imports import create_import_db
+
+
+async def test_patch_citizens(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    """
+    Проверяет, что данные нескольких жителей и их родственные связи
+    успешно обновляются одним запросом.
+    """
+    side_citizens = generate_citizens(citizens_count=3, start_citizen_id=1)
+    side_import_id = await create_import_db(dataset=side_citizens, conn=migrated_postgres_conn)
+
+    citizens = [
+        generate_citizen(citizen_id=1, relatives=[2]),
+        generate_citizen(citizen_id=2, relatives=[1]),
+        generate_citizen(citizen_id=3, relatives=[]),
+        generate_citizen(citizen_id=4, relatives=[]),
+    ]
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+
+    # Житель #1 меняет имя и родственника #2 на #3, житель #4 становится
+    # родственником жителя #2 и сам себе, у жителя #3 меняется город.
+    citizens[0]["name"] = "Иванова Иванна Ивановна"
+    citizens[0]["relatives"] = [3]
+    citizens[1]["relatives"] = [4]
+    citizens[2]["relatives"] = [1]
+    citizens[2]["town"] = "Другой город"
+    citizens[3]["relatives"] = [2, 4]
+
+    updated_citizens = await patch_citizens_request(
+        client=api_client,
+        import_id=import_id,
+        data=[
+            {"citizen_id": 1, "name": citizens[0]["name"], "relatives": [3]},
+            {"citizen_id": 3, "town": citizens[2]["town"]},
+            {"citizen_id": 4, "relatives": [2, 4]},
+        ],
+    )
+    # Обновленные жители возвращаются в порядке обновлений
+    assert [citizen["citizen_id"] for citizen in updated_citizens] == [1, 3, 4]
+    assert compare_citizen_groups(left=[citizens[0], citizens[2], citizens[3]], right=updated_citizens)
+
+    received_citizens = await fetch_citizens_request(client=api_client, import_id=import_id)
+    assert compare_citizen_groups(left=citizens, right=received_citizens)
+
+    received_citizens = await fetch_citizens_request(client=api_client, import_id=side_import_id)
+    assert compare_citizen_groups(left=side_citizens, right=received_citizens)
+
+
+async def test_patch_citizens_sequential_relatives(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    """
+    Изменения родственных связей применяются в порядке обновлений:
+    связь, удаленная одним обновлением и добавленная другим, сохраняется.
+    """
+    citizens = [
+        generate_citizen(citizen_id=1, relatives=[2]),
+        generate_citizen(citizen_id=2, relatives=[1]),
+    ]
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+
+    await patch_citizens_request(
+        client=api_client,
+        import_id=import_id,
+        data=[
+            {"citizen_id": 2, "relatives": []},
+            {"citizen_id": 1, "relatives": [2]},
+        ],
+    )
+
+    received_citizens = await fetch_citizens_request(client=api_client, import_id=import_id)
+    assert compare_citizen_groups(left=citizens, right=received_citizens)
+
+
+invalid_cases = [
+    # Пустой список обновлений.
+    [],
+    # citizen_id не уникален в рамках запроса.
+    [{"citizen_id": 1, "name": "Иван"}, {"citizen_id": 1, "name": "Петр"}],
+    # Сервис должен запрещать добавлять жителю несуществующего родственника.
+    [{"citizen_id": 1, "relatives": [999]}],
+]
+
+
+@pytest.mark.parametrize("data", invalid_cases)
+async def test_invalid_patch_citizens(api_client: TestClient, migrated_postgres_conn: PG, data: list) -> None:
+    citizens = [generate_citizen(citizen_id=1, relatives=[])]
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+
+    await patch_citizens_request(
+        client=api_client, import_id=import_id, data=data, expected_status=HTTPStatus.BAD_REQUEST
+    )
+
+    # Ни одно изменение не должно сохраниться
+    received_citizens = await fetch_citizens_request(client=api_client, import_id=import_id)
+    assert compare_citizen_groups(left=citizens, right=received_citizens)
+
+
+async def test_patch_nonexistent_citizens(api_client: TestClient, migrated_postgres_conn: PG) -> None:
+    """Если хотя бы один житель не найден, ни одно изменение не сохраняется."""
+    citizens = [generate_citizen(citizen_id=1, relatives=[])]
+    import_id = await create_import_db(dataset=citizens, conn=migrated_postgres_conn)
+
+    await patch_citizens_request(
+        client=api_client,
+        import_id=import_id,
+        data=[{"citizen_id": 1, "name": "Ivan Ivanov"}, {"citizen_id": 999, "name": "Ivan Ivanov"}],
+        expected_status=HTTPStatus.NOT_FOUND,
+    )
+
+    received_citizens = await fetch_citizens_request(client=api_client, import_id=import_id)
+    assert compare_citizen_groups(left=citizens, right=received_citizens)
+
+    await patch_citizens_request(
+        client=api_client,
+        import_id=999,
+        data=[{"citizen_id": 1, "name": "Ivan Ivanov"}],
+        expected_status=HTTPStatus.NOT_FOUND,
+    )
@@ -0,0 +1,34 @@
+from datetime import date
+
+import pytest
+
+from analyzer.api.schema import ImportRequestSchema
+from analyzer.bench.dataset import AGE_DISTRIBUTIONS, TOWN_DISTRIBUTIONS, iter_citizens
+
+CURRENT_DATE = date(2020, 1, 1)
+
+
+@pytest.mark.parametrize("town_distribution", TOWN_DISTRIBUTIONS)
+@pytest.mark.parametrize("age_distribution", AGE_DISTRIBUTIONS)
+def test_iter_citizens(town_distribution: str, age_distribution: str) -> None:
+    kwargs = dict(
+        count=2000,
+        relations=4,
+        towns=10,
+        seed=42,
+        town_distribution=town_distribution,
+        age_distribution=age_distribution,
+        window=50,
+        current_date=CURRENT_DATE,
+    )
+    citizens = list(iter_citizens(**kwargs))
+
+    # Выгрузка проходит валидацию API: в частности, связи симметричны
+    ImportRequestSchema().load({"citizens": citizens})
+    assert [citizen["citizen_id"] for citizen in citizens] == list(range(1, 2001))
+    assert all(abs(relative - citizen["citizen_id"]) <= 50 for citizen in citizens for relative in citizen["relatives"])
+    assert 3 < sum(len(citizen["relatives"]) for citizen in citizens) / len(citizens) < 5
+
+    # Результат определяется seed
+    assert list(iter_citizens(**kwargs)) == citizens
+    assert list(iter_citizens(**dict(kwargs, seed=43))) != citizens
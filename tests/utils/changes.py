@@ -0,0 +1,29 @@
+from enum import Enum
+from http import HTTPStatus
+from typing import List, Union
+
+from aiohttp.test_utils import TestClient
+
+from analyzer.api.schema import ChangeListResponseSchema
+from analyzer.api.views import ChangeListView
+from tests.utils.base import url_for
+
+
+async def fetch_changes_request(
+    client: TestClient,
+    import_id: int,
+    since: int = 0,
+    expected_status: Union[int, Enum] = HTTPStatus.OK,
+    **request_kwargs,
+) -> List[dict]:
+    response = await client.get(
+        url_for(ChangeListView.URL_PATH, import_id=import_id), params={"since": since}, **request_kwargs
+    )
+    assert response.status == expected_status
+
+    if response.status == HTTPStatus.OK:
+        data = await response.json()
+        errors = ChangeListResponseSchema().validate(data)
+        assert errors == {}
+
+        return data["data"]
@@ -7,8 +7,10 @@ import faker
 from aiohttp.test_utils import TestClient
 
 from analyzer.api.schema import (
+    CitizenResponseSchema,
     CitizenListResponseSchema,
     PatchCitizenResponseSchema,
+    PatchCitizensResponseSchema,
     CitizenPresentsResponseSchema,
     DATE_FORMAT,
 )
@@ -132,6 +134,26 @@ async def fetch_citizens_request(
         return data["data"]
 
 
+async def fetch_citizen_request(
+    client: TestClient,
+    import_id: int,
+    citizen_id: int,
+    expected_status: Union[int, Enum] = HTTPStatus.OK,
+    **request_kwargs,
+) -> dict:
+    response = await client.get(
+        url_for(CitizenDetailView.URL_PATH, import_id=import_id, citizen_id=citizen_id), **request_kwargs
+    )
+    assert response.status == expected_status
+
+    if response.status == HTTPStatus.OK:
+        data = await response.json()
+        errors = CitizenResponseSchema().validate(data)
+        assert errors == {}
+
+        return data["data"]
+
+
 async def patch_citizen_request(
     client: TestClient,
     import_id: int,
@@ -153,6 +175,26 @@ async def patch_citizen_request(
         return data["data"]
 
 
+async def patch_citizens_request(
+    client: TestClient,
+    import_id: int,
+    data: List[dict],
+    expected_status: Union[int, Enum] = HTTPStatus.OK,
+    **request_kwargs,
+) -> List[dict]:
+    response = await client.patch(
+        url_for(CitizenListView.URL_PATH, import_id=import_id), json={"citizens": data}, **request_kwargs
+    )
+    assert response.status == expected_status
+
+    if response.status == HTTPStatus.OK:
+        data = await response.json()
+        errors = PatchCitizensResponseSchema().validate(data)
+        assert errors == {}
+
+        return data["data"]
+
+
 async def get_citizen_birthdays(
     client: TestClient, import_id: int, expected_status: Union[int, Enum] = HTTPStatus.OK, **request_kwargs
 ) -> dict:
@@ -5,7 +5,7 @@ from datetime import datetime, date, timedelta
 from enum import Enum
 from http import HTTPStatus
 from itertools import groupby
-from typing import List, Union
+from typing import List, Optional, Sequence, Union
 
 import numpy as np
 import pytz
@@ -14,6 +14,7 @@ from dateutil.relativedelta import relativedelta
 
 from analyzer.api.schema import DATE_FORMAT
 from analyzer.api.schema import (
+    TownAgeQuantilesResponseSchema,
     TownAgeStatResponseSchema,
 )
 from analyzer.api.views.stats import TownAgeStatView
@@ -47,7 +48,7 @@ def round_half_up(n: Union[float, int], decimals: int = 0) -> float:
     """
     Арифметическое округление до значимых чисел decimals.
     """
-    multiplier = 10 ** decimals
+    multiplier = 10**decimals
     return math.floor(n * multiplier + 0.5) / multiplier
 
 
@@ -72,12 +73,29 @@ def make_expected_age_stats(citizens: List[dict]) -> List[dict]:
     return response
 
 
+def make_expected_age_quantiles(citizens: List[dict], quantiles: Sequence[float]) -> List[dict]:
+    """
+    Формирует ожидаемый вывод произвольных квантилей возрастов, сгруппированных по городам.
+
+    :param citizens: список жителей, упорядоченный по городу
+    :param quantiles: квантили от 0 до 1
+    """
+    response = []
+    for town, town_citizens in groupby(citizens, lambda citizen: citizen["town"]):
+        ages = [date2age(citizen["birth_date"]) for citizen in town_citizens]
+        values = [round_half_up(value, decimals=2) for value in np.quantile(ages, quantiles)]
+        response.append({"town": town, "quantiles": {str(q): value for q, value in zip(quantiles, values)}})
+    return response
+
+
 def compare_age_stats(left: List[dict], right: List[dict]) -> bool:
-    """Сравнивает два вывода перцентилей возврастов, сгруппированных по городам."""
-    left.sort(key=lambda item: item["town"])
-    right.sort(key=lambda item: item["town"])
+    """
+    Сравнивает два вывода перцентилей возврастов, сгруппированных по городам.
 
-    return left == right
+    Ответ (left) должен быть упорядочен по городу - по кодам символов, как
+    строки в Python, независимо от движка расчета и правил сортировки БД.
+    """
+    return left == sorted(right, key=lambda item: item["town"])
 
 
 async def get_town_age_statistics(
@@ -92,3 +110,27 @@ async def get_town_age_statistics(
         assert errors == {}
 
         return data["data"]
+
+
+async def get_town_age_quantiles(
+    client: TestClient,
+    import_id: int,
+    quantiles: Optional[Sequence[float]] = None,
+    approximate: bool = False,
+    expected_status: Union[int, Enum] = HTTPStatus.OK,
+    **request_kwargs,
+) -> List[dict]:
+    params = {"approximate": "true" if approximate else "false"}
+    if quantiles is not None:
+        params["q"] = ",".join(str(q) for q in quantiles)
+
+    response = await client.get(url_for(TownAgeStatView.URL_PATH, import_id=import_id), params=params, **request_kwargs)
+    assert response.status == expected_status
+
+    if response.status == HTTPStatus.OK:
+        data = await response.json()
+        schema = TownAgeStatResponseSchema if quantiles is None else TownAgeQuantilesResponseSchema
+        errors = schema().validate(data)
+        assert errors == {}
+
+        return data["data"]